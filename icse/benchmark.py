@@ -0,0 +1,792 @@
+from icse import extractor
+from icse import engine
+from icse import schedule
+from icse import buffer_write
+from icse import buffer_read
+from icse import flat
+from icse import serialize
+from icse import render
+from icse import prune
+from icse import compact
+from icse import memo
+from icse import functions
+from icse import calls
+from icse import rules
+from icse import journal
+from pycparser import CParser, c_ast, c_generator
+from pycparser.c_lexer import CLexer
+import argparse
+import io
+import os.path
+import time
+import tracemalloc
+import pickle
+import shutil
+import sys
+import tempfile
+
+#Reads through nested array references, member chains and pointer arithmetic,
+#checked by bench_specs on top of the corpus
+NESTED_READS = """struct S { char buf[8]; };
+int f(char *p, char a[4][4], struct S *s) {
+  char c;
+  c = a[1][2];
+  c = s->buf[3];
+  c = *(p + 1);
+  c = *p;
+  return c;
+}
+"""
+
+#Info of the read sites of NESTED_READS, '*(p + 1)' reads no named buffer
+NESTED_READ_INFO = ['a', 'a', 's', 'p']
+
+def bench_schedule(args):
+  '''
+  Compares the makespan and the worker idle time of the walk order and of
+  the cost ordered schedule.
+  '''
+  files = extractor.list_files(args.source)
+  profile = schedule.CostProfile(args.profile)
+
+  print("%-8s %10s %10s %10s" % ('order', 'makespan', 'busy', 'idle'))
+  for order in ['walk', 'cost']:
+    pool = engine.Engine('all', args.jobs, profile,
+                         cost_order=(order == 'cost'))
+    for result in pool.run(files):
+      pass
+    print("%-8s %9.3fs %9.3fs %9.3fs" % (order, pool.stats['makespan'],
+                                          pool.stats['busy'], pool.stats['idle']))
+  profile.save()
+
+def bench_rules(args):
+  '''
+  Compares the site rules run by the node visitors with the site rules run
+  over the node index, and the parse time with and without the index.
+  '''
+  files = extractor.list_files(args.source)
+  texts = [extractor.preprocess_file(f, extractor.CPPPATH, extractor.CPPARGS)
+           for f in files]
+
+  parse_time = {}
+  for index_nodes in [False, True]:
+    parser = CParser(index_nodes=index_nodes)
+    start = time.time()
+    trees = [(parser.parse(text, f), parser.node_index)
+             for f, text in zip(files, texts)]
+    parse_time[index_nodes] = time.time() - start
+
+  start = time.time()
+  for tree, index in trees:
+    buffer_write.BufferWriteVisitor().visit(tree)
+    buffer_read.BufferReadVisitor().visit(tree)
+  visitor_time = time.time() - start
+
+  start = time.time()
+  for tree, index in trees:
+    buffer_write.find_nodes(index)
+    buffer_read.find_nodes(index)
+  index_time = time.time() - start
+
+  print("%-8s %10s %10s" % ('rules', 'parse', 'rules'))
+  print("%-8s %9.3fs %9.3fs" % ('visitor', parse_time[False], visitor_time))
+  print("%-8s %9.3fs %9.3fs" % ('index', parse_time[True], index_time))
+
+def bench_flat(args):
+  '''
+  Compares the memory held by the object trees and by the flat ASTs of the
+  corpus, and the time of the site rules over each of them.
+  '''
+  files = extractor.list_files(args.source)
+  texts = [extractor.preprocess_file(f, extractor.CPPPATH, extractor.CPPARGS)
+           for f in files]
+  parser = CParser()
+
+  tracemalloc.start()
+  base = tracemalloc.get_traced_memory()[0]
+  trees = [parser.parse(text, f) for f, text in zip(files, texts)]
+  tree_memory = tracemalloc.get_traced_memory()[0] - base
+
+  flats = [flat.FlatAST(tree) for tree in trees]
+  flat_memory = tracemalloc.get_traced_memory()[0] - base - tree_memory
+  tracemalloc.stop()
+
+  start = time.time()
+  flats = [flat.FlatAST(tree) for tree in trees]
+  convert_time = time.time() - start
+
+  start = time.time()
+  for tree in trees:
+    buffer_write.BufferWriteVisitor().visit(tree)
+    buffer_read.BufferReadVisitor().visit(tree)
+  tree_time = time.time() - start
+
+  start = time.time()
+  for flat_ast in flats:
+    buffer_write.find_flat_nodes(flat_ast)
+    buffer_read.find_flat_nodes(flat_ast)
+  flat_time = time.time() - start
+
+  print("%d files, %d nodes, converted in %.3fs"
+        % (len(files), sum(len(f) for f in flats), convert_time))
+  print("%-8s %10s %10s" % ('ast', 'memory', 'rules'))
+  print("%-8s %8.1fMB %9.3fs" % ('objects', tree_memory / 1e6, tree_time))
+  print("%-8s %8.1fMB %9.3fs" % ('flat', flat_memory / 1e6, flat_time))
+
+def bench_serialize(args):
+  '''
+  Compares the size and the speed of pickle and of icse.serialize on the
+  trees of the corpus.
+  '''
+  files = extractor.list_files(args.source)
+  parser = CParser()
+  trees = [parser.parse(extractor.preprocess_file(f, extractor.CPPPATH,
+                                                  extractor.CPPARGS), f)
+           for f in files]
+
+  codecs = [('pickle', lambda tree: pickle.dumps(tree, pickle.HIGHEST_PROTOCOL),
+             pickle.loads),
+            ('icse', serialize.dumps, serialize.loads)]
+  print("%-8s %10s %10s %10s" % ('format', 'size', 'dump', 'load'))
+  for name, dump, load in codecs:
+    start = time.time()
+    data = [dump(tree) for tree in trees]
+    dump_time = time.time() - start
+    start = time.time()
+    for d in data:
+      load(d)
+    load_time = time.time() - start
+    print("%-8s %8.1fKB %9.3fs %9.3fs" % (name, sum(len(d) for d in data) / 1e3,
+                                          dump_time, load_time))
+
+def _lex(texts, column, track_columns, scanner='ply', tokens=None):
+  '''
+  Tokenizes texts, calls column on each token unless it is None. Returns
+  the number of tokens and the elapsed time. The tokens are appended to
+  tokens unless it is None.
+  '''
+  lexer = CLexer(lambda msg, line, column: None, lambda: None, lambda: None,
+                 lambda name: False, track_columns=track_columns,
+                 scanner=scanner)
+  lexer.build()
+  count = 0
+  start = time.time()
+  for text in texts:
+    lexer.input(text)
+    token = lexer.token()
+    while token is not None:
+      if column is not None:
+        column(lexer, token)
+      if tokens is not None:
+        tokens.append((token.type, token.value, token.lineno, token.lexpos,
+                       getattr(token, 'column', None)))
+      count += 1
+      token = lexer.token()
+  return (count, time.time() - start)
+
+def bench_lexer(args):
+  '''
+  Compares the tokens/sec of the PLY lexer runtime with a column computed by
+  rfind for every token, with the tracked columns and without columns, and
+  of the fast scanner. Checks that both runtimes return the same tokens.
+  '''
+  files = extractor.list_files(args.source)
+  texts = [extractor.preprocess_file(f, extractor.CPPPATH, extractor.CPPARGS)
+           for f in files]
+
+  def rfind_column(lexer, token):
+    last_cr = lexer.lexer.lexdata.rfind('\n', 0, token.lexpos)
+    return token.lexpos - last_cr
+
+  runs = [('ply', 'rfind', rfind_column, False),
+          ('ply', 'tracked', None, True), ('ply', 'off', None, False),
+          ('fast', 'tracked', None, True), ('fast', 'off', None, False)]
+  print("%-8s %-8s %10s %12s" % ('scanner', 'columns', 'tokens', 'tokens/sec'))
+  for scanner, name, column, track_columns in runs:
+    # best of 3, the runs are short
+    count, elapsed = min((_lex(texts, column, track_columns, scanner)
+                          for i in range(3)),
+                         key=lambda run: run[1])
+    print("%-8s %-8s %10d %12.0f" % (scanner, name, count, count / elapsed))
+
+  ply_tokens = []
+  fast_tokens = []
+  _lex(texts, None, True, 'ply', ply_tokens)
+  _lex(texts, None, True, 'fast', fast_tokens)
+  print("same tokens: %s" % ('yes' if ply_tokens == fast_tokens else 'NO'))
+
+def bench_parser(args):
+  '''
+  Compares the reductions/sec of PLY's LR parse loop and of the fast one,
+  both fed by the fast scanner. Checks that both build the same ASTs.
+  '''
+  files = extractor.list_files(args.source)
+  texts = [extractor.preprocess_file(f, extractor.CPPPATH, extractor.CPPARGS)
+           for f in files]
+
+  trees = {}
+  times = {}
+  for lr_parser in ['ply', 'fast']:
+    parser = CParser(scanner='fast', lr_parser=lr_parser)
+    # best of 3, the runs are short
+    for i in range(3):
+      start = time.time()
+      trees[lr_parser] = [parser.parse(text, f) for f, text in zip(files, texts)]
+      elapsed = time.time() - start
+      times[lr_parser] = min(times.get(lr_parser, elapsed), elapsed)
+  # both loops make the same reductions, the fast one counts them
+  reductions = parser.cparser.reductions // 3
+
+  print("%-8s %10s %10s %14s" % ('loop', 'reductions', 'parse',
+                                 'reductions/sec'))
+  for lr_parser in ['ply', 'fast']:
+    print("%-8s %10d %9.3fs %14.0f" % (lr_parser, reductions, times[lr_parser],
+                                       reductions / times[lr_parser]))
+  same = ([serialize.dumps(tree) for tree in trees['ply']]
+          == [serialize.dumps(tree) for tree in trees['fast']])
+  print("same trees: %s" % ('yes' if same else 'NO'))
+
+def bench_render(args):
+  '''
+  Compares the rendering work of the site builders before the value
+  renderer (CGenerator on every write and read node, results discarded, then
+  on the write values) with the value renderer on the write values only, and
+  checks both render the same values.
+  '''
+  files = extractor.list_files(args.source)
+  parser = CParser(index_nodes=True, scanner='fast', lr_parser='fast')
+  asts = [extractor.parse_file(f, use_cpp=True, cpp_path=extractor.CPPPATH,
+                               cpp_args=extractor.CPPARGS, parser=parser)
+          for f in files]
+  writes = []
+  reads = []
+  for ast in asts:
+    for node in buffer_write.find_nodes(ast[3]):
+      lvalue = node.lvalue
+      if isinstance(lvalue, c_ast.ArrayRef):
+        value = lvalue.name
+      elif isinstance(lvalue, c_ast.UnaryOp):
+        value = lvalue.expr
+      else:
+        value = lvalue
+      writes.append((node, value))
+    reads.extend(buffer_read.find_nodes(ast[3]))
+
+  generator = c_generator.CGenerator()
+  renderer = render.ValueRenderer()
+  start = time.time()
+  for i in range(args.repeat):
+    generated = []
+    for node, value in writes:
+      generator.visit(node)
+      generated.append(generator.visit(value))
+    for node in reads:
+      generator.visit(node)
+  generator_time = time.time() - start
+  start = time.time()
+  for i in range(args.repeat):
+    rendered = []
+    for node, value in writes:
+      rendered.append(renderer.render(value))
+  renderer_time = time.time() - start
+
+  print("%d write values, %d reads, %d runs" % (len(writes), len(reads),
+                                                args.repeat))
+  print("%-10s %10s" % ('renderer', 'time'))
+  print("%-10s %9.3fs" % ('generator', generator_time))
+  print("%-10s %9.3fs" % ('values', renderer_time))
+  print("same values: %s" % ('yes' if generated == rendered else 'NO'))
+
+def bench_generate(args):
+  '''
+  Compares CGenerator with CStreamGenerator on whole files, generating to a
+  string and streaming to a file, and checks all produce the same code.
+  '''
+  files = extractor.list_files(args.source)
+  parser = CParser(scanner='fast', lr_parser='fast')
+  asts = [extractor.parse_file(f, use_cpp=True, cpp_path=extractor.CPPPATH,
+                               cpp_args=extractor.CPPARGS, parser=parser)[2]
+          for f in files]
+
+  generator = c_generator.CGenerator()
+  stream_generator = c_generator.CStreamGenerator()
+  times = {}
+  start = time.time()
+  for i in range(args.repeat):
+    generated = [generator.visit(ast) for ast in asts]
+  times['recursive'] = time.time() - start
+  start = time.time()
+  for i in range(args.repeat):
+    streamed = [stream_generator.generate(ast) for ast in asts]
+  times['stream'] = time.time() - start
+  written = []
+  start = time.time()
+  for i in range(args.repeat):
+    written = []
+    for ast in asts:
+      out = io.StringIO()
+      stream_generator.write(ast, out)
+      written.append(out.getvalue())
+  times['write'] = time.time() - start
+
+  print("%d files, %d bytes, %d runs" % (len(asts), sum(map(len, generated)),
+                                         args.repeat))
+  print("%-10s %10s" % ('generator', 'time'))
+  for name in ['recursive', 'stream', 'write']:
+    print("%-10s %9.3fs" % (name, times[name]))
+  same = generated == streamed == written
+  print("same code: %s" % ('yes' if same else 'NO'))
+
+def bench_prune(args):
+  '''
+  Compares the bytes, tokens and parse time of the preprocessed files with
+  and without the unused header declarations, and checks the sites of both
+  are the same.
+  '''
+  files = extractor.list_files(args.source)
+  texts = [extractor.preprocess_file(f, extractor.CPPPATH, extractor.CPPARGS)
+           for f in files]
+  start = time.time()
+  pruned = [prune.prune(text) for text in texts]
+  prune_time = time.time() - start
+
+  parser = CParser(index_nodes=True, scanner='fast', lr_parser='fast')
+  renderer = render.ValueRenderer()
+  print("%d files, pruning %.3fs" % (len(files), prune_time))
+  print("%-8s %10s %10s %10s" % ('text', 'bytes', 'tokens', 'parse'))
+  sites = {}
+  for name, run_texts in [('full', texts), ('pruned', pruned)]:
+    tokens = _lex(run_texts, None, True, 'fast')[0]
+    # best of 3, the runs are short
+    elapsed = None
+    for i in range(3):
+      start = time.time()
+      trees = []
+      for f, text in zip(files, run_texts):
+        tree = parser.parse(text, f)
+        trees.append((tree, parser.node_index))
+      run_time = time.time() - start
+      elapsed = run_time if elapsed is None else min(elapsed, run_time)
+    sites[name] = []
+    for f, (tree, node_index) in zip(files, trees):
+      with open(f, 'r') as source:
+        ast = (f, source.read(), tree, node_index)
+      for file_sites in extractor.file_sites(ast, 'all', renderer):
+        sites[name].append([vars(s) for s in file_sites])
+    print("%-8s %10d %10d %9.3fs" % (name, sum(map(len, run_texts)), tokens,
+                                     elapsed))
+  print("same sites: %s" % ('yes' if sites['full'] == sites['pruned'] else 'NO'))
+
+def bench_compact(args):
+  '''
+  Compares the bytes, lines and lexer time of the preprocessed files, and of
+  the pruned ones, before and after compaction. Checks the lexer returns the
+  same tokens, on the same lines and columns, for both.
+  '''
+  files = extractor.list_files(args.source)
+  texts = [extractor.preprocess_file(f, extractor.CPPPATH, extractor.CPPARGS)
+           for f in files]
+  pruned = [prune.prune(text) for text in texts]
+
+  print("%-8s %-10s %10s %8s %9s %10s" % ('text', 'compaction', 'bytes',
+                                          'lines', 'compact', 'lexer'))
+  same = True
+  for name, run_texts in [('full', texts), ('pruned', pruned)]:
+    start = time.time()
+    compacted = [compact.compact(text) for text in run_texts]
+    compact_time = time.time() - start
+    tokens = {}
+    for state, state_texts in [('off', run_texts), ('on', compacted)]:
+      # best of 3, the runs are short
+      elapsed = min(_lex(state_texts, None, True, 'fast')[1]
+                    for i in range(3))
+      print("%-8s %-10s %10d %8d %9s %9.3fs"
+            % (name, state, sum(map(len, state_texts)),
+               sum(text.count('\n') for text in state_texts),
+               '%.3fs' % compact_time if state == 'on' else '', elapsed))
+      tokens[state] = []
+      _lex(state_texts, None, True, 'fast', tokens[state])
+    # the positions in the text change, not the lines and columns
+    same = same and ([token[:3] + token[4:] for token in tokens['off']]
+                     == [token[:3] + token[4:] for token in tokens['on']])
+  print("same tokens: %s" % ('yes' if same else 'NO'))
+
+def bench_memo(args):
+  '''
+  Compares the site rules run by the node visitors, over the node index and
+  through the function body memo. Checks the memo finds the same nodes.
+  '''
+  files = extractor.list_files(args.source)
+  parser = CParser(index_nodes=True)
+  trees = [(parser.parse(extractor.preprocess_file(f, extractor.CPPPATH,
+                                                   extractor.CPPARGS), f),
+            parser.node_index)
+           for f in files]
+
+  start = time.time()
+  for tree, index in trees:
+    buffer_write.BufferWriteVisitor().visit(tree)
+    buffer_read.BufferReadVisitor().visit(tree)
+  visitor_time = time.time() - start
+
+  start = time.time()
+  found = [(buffer_write.find_nodes(index), buffer_read.find_nodes(index))
+           for tree, index in trees]
+  index_time = time.time() - start
+
+  body_memo = memo.BodyMemo()
+  start = time.time()
+  memoized = [body_memo.nodes(tree)[:2] for tree, index in trees]
+  memo_time = time.time() - start
+
+  stats = body_memo.stats()
+  print("%-8s %10s" % ('rules', 'time'))
+  print("%-8s %9.3fs" % ('visitor', visitor_time))
+  print("%-8s %9.3fs" % ('index', index_time))
+  print("%-8s %9.3fs" % ('memo', memo_time))
+  print("function bodies: %d, memo hits: %d" % (stats['bodies'], stats['hits']))
+  print("rule time of the hits: %.3fs, hashing overhead: %.3fs"
+        % (stats['hit_time'], stats['overhead']))
+  same = all(list(map(id, a)) == list(map(id, b)) and
+             list(map(id, c)) == list(map(id, d))
+             for (a, c), (b, d) in zip(found, memoized))
+  print("same nodes: %s" % ('yes' if same else 'NO'))
+
+def bench_functions(args):
+  '''
+  Compares the site rules over the whole files with the site rules over the
+  functions matching the patterns only, with the node index rules and with
+  the visitors. Checks the selected sites are the sites of the matching
+  functions.
+  '''
+  files = extractor.list_files(args.source)
+  parser = CParser(index_nodes=True)
+  asts = [extractor.parse_file(f, True, extractor.CPPPATH, extractor.CPPARGS,
+                               parser=parser)
+          for f in files]
+  # the visitors run when the file has no node index
+  visitor_asts = [ast[:3] + (None,) for ast in asts]
+  patterns = functions.parse_patterns(args.patterns)
+  select = functions.name_matcher(patterns)
+
+  print("%-18s %8s %10s" % ('rules', 'sites', 'time'))
+  sites = {}
+  for name, rule_asts, rule_select in [('index all', asts, None),
+                                       ('index selected', asts, select),
+                                       ('visitor all', visitor_asts, None),
+                                       ('visitor selected', visitor_asts,
+                                        select)]:
+    renderer = render.ValueRenderer()
+    start = time.time()
+    for i in range(args.repeat):
+      sites[name] = [extractor.file_sites(ast, 'all', renderer,
+                                          select=rule_select)
+                     for ast in rule_asts]
+    elapsed = (time.time() - start) / args.repeat
+    print("%-18s %8d %9.4fs" % (name, sum(len(w) + len(r) for w, r in
+                                          sites[name]), elapsed))
+  expected = [[vars(s) for s in w + r
+               if s.function is not None and select(s.function)]
+              for w, r in sites['index all']]
+  same = all(expected == [[vars(s) for s in w + r] for w, r in sites[name]]
+             for name in ('index selected', 'visitor selected'))
+  print("same sites: %s" % ('yes' if same else 'NO'))
+
+class _ChainedCallVisitor(calls.CallVisitor):
+  """CallVisitor comparing the callee with each function name in turn, as
+  chained '==' tests do."""
+
+  def visit_FuncCall(self, node):
+    if isinstance(node.name, c_ast.ID):
+      for name in self.names:
+        if node.name.name == name:
+          for argument in calls.call_arguments(node, self.table):
+            self.calls.append(node)
+            self.nodes.append(argument)
+            self.functions.append(self.function)
+          break
+
+    for c_name, c in node.children():
+      self.visit(c)
+
+def bench_calls(args):
+  '''
+  Compares the library call rules matched with chained name comparisons,
+  with the dispatch table in a node visitor, and with the dispatch table over
+  the FuncCall nodes of the node index.
+  '''
+  files = extractor.list_files(args.source)
+  parser = CParser(index_nodes=True)
+  trees = []
+  for f in files:
+    text = extractor.preprocess_file(f, extractor.CPPPATH, extractor.CPPARGS)
+    trees.append((parser.parse(text, f), parser.node_index))
+  rules = calls.CallRules()
+  tables = [rules.writes, rules.reads]
+
+  def chained(tree, index, table):
+    visitor = _ChainedCallVisitor(table)
+    visitor.names = list(table)
+    visitor.visit(tree)
+    return visitor.nodes
+
+  def visitor(tree, index, table):
+    call_visitor = calls.CallVisitor(table)
+    call_visitor.visit(tree)
+    return call_visitor.nodes
+
+  def indexed(tree, index, table):
+    return calls.find_nodes(index, table)[1]
+
+  print("%-8s %8s %10s" % ('rules', 'sites', 'time'))
+  found = {}
+  for name, rule in [('chained', chained), ('visitor', visitor),
+                     ('index', indexed)]:
+    start = time.time()
+    for i in range(args.repeat):
+      found[name] = [rule(tree, index, table) for tree, index in trees
+                     for table in tables]
+    elapsed = (time.time() - start) / args.repeat
+    print("%-8s %8d %9.4fs" % (name, sum(len(nodes) for nodes in found[name]),
+                               elapsed))
+  same = found['chained'] == found['visitor'] == found['index']
+  print("same sites: %s" % ('yes' if same else 'NO'))
+
+def bench_specs(args):
+  '''
+  Compares the built-in site rules, over the node index, through the node
+  visitors and through the function body memo, with the same rules compiled
+  from their specification, over the node index and in one walk of the tree,
+  on the corpus and on NESTED_READS. Times the rules of a specification file
+  in one pass when one is given.
+  '''
+  files = extractor.list_files(args.source)
+  parser = CParser(index_nodes=True)
+  asts = [extractor.parse_file(f, True, extractor.CPPPATH, extractor.CPPARGS,
+                               parser=parser)
+          for f in files]
+  asts.append(('nested_reads.c', NESTED_READS,
+               parser.parse(NESTED_READS, 'nested_reads.c'), parser.node_index))
+  # the rules walk the tree when the file has no node index
+  walk_asts = [ast[:3] + (None,) for ast in asts]
+  default_rules = rules.RuleSet()
+  runs = [('built-in', asts, None, False),
+          ('built-in walk', walk_asts, None, False),
+          ('built-in memo', asts, None, True),
+          ('spec index', asts, default_rules, False),
+          ('spec walk', walk_asts, default_rules, False)]
+  if args.rules:
+    file_rules = rules.load_rules(args.rules)
+    runs += [('file index', asts, file_rules, False),
+             ('file walk', walk_asts, file_rules, False)]
+
+  print("%-14s %8s %10s" % ('rules', 'sites', 'time'))
+  sites = {}
+  for name, rule_asts, rule_set, use_memo in runs:
+    renderer = render.ValueRenderer()
+    body_memo = memo.BodyMemo() if use_memo else None
+    start = time.time()
+    for i in range(args.repeat):
+      sites[name] = [[vars(s) for s in w + r] for w, r in
+                     [extractor.file_sites(ast, 'all', renderer, body_memo,
+                                           rules=rule_set)
+                      for ast in rule_asts]]
+    elapsed = (time.time() - start) / args.repeat
+    print("%-14s %8d %9.4fs" % (name, sum(len(f) for f in sites[name]),
+                                elapsed))
+  builtin = [name for name, rule_asts, rule_set, use_memo in runs[:5]]
+  same = all(sites[name] == sites['built-in'] for name in builtin)
+  if args.rules:
+    same = same and sites['file index'] == sites['file walk']
+  print("same sites: %s" % ('yes' if same else 'NO'))
+  nested = [s['info'] for s in sites['built-in'][-1]
+            if s['site_type'] == 'buffer_read']
+  print("nested reads: %s" % ('yes' if nested == NESTED_READ_INFO else 'NO'))
+
+def _site_keys(sites):
+  '''Returns the fields of sites as sortable tuples, in a stable order.'''
+  return sorted(tuple(str(value) for value in vars(s).values()) for s in sites)
+
+def bench_journal(args):
+  '''
+  Times recording the sites of the corpus in a journal and loading them back.
+  Checks a run interrupted with '-s buffer_write' and resumed with '-s all'
+  does not reuse the write-only entries of its journal.
+  '''
+  files = extractor.list_files(args.source)
+  asts = [extractor.parse_file(f, True, extractor.CPPPATH, extractor.CPPARGS)
+          for f in files]
+  renderer = render.ValueRenderer()
+  found = dict((site_types, [extractor.file_sites(ast, site_types, renderer)
+                             for ast in asts])
+               for site_types in ('buffer_write', 'all'))
+
+  directory = tempfile.mkdtemp()
+  path = os.path.join(directory, 'sites.journal')
+  try:
+    start = time.time()
+    run_journal = journal.Journal(path, options='all')
+    for filename, (writes, reads) in zip(files, found['all']):
+      run_journal.record(filename, writes, reads)
+    run_journal.close()
+    record_time = time.time() - start
+
+    start = time.time()
+    resumed = journal.Journal(path, True, 'all')
+    load_time = time.time() - start
+    resumed.close()
+    same_options = len(resumed.entries) == len(files)
+
+    interrupted = journal.Journal(path, options='buffer_write')
+    for filename, (writes, reads) in zip(files[:len(files) // 2],
+                                         found['buffer_write']):
+      interrupted.record(filename, writes, reads)
+    interrupted.close()
+    resumed = journal.Journal(path, True, 'all')
+    run = extractor.Extractor(args.source, 'all', journal=resumed)
+    resumed.close()
+    resumed_sites = run.buffer_write_sites() + run.buffer_read_sites()
+  finally:
+    shutil.rmtree(directory)
+
+  print("%d files, recorded in %.3fs, loaded in %.3fs"
+        % (len(files), record_time, load_time))
+  print("resumed with the same options: %s" % ('yes' if same_options else 'NO'))
+  expected = [s for writes, reads in found['all'] for s in writes + reads]
+  same = _site_keys(resumed_sites) == _site_keys(expected)
+  print("resumed with other options: %s" % ('same sites' if same else 'NO'))
+
+def checkArguments():
+  '''
+  Reads commandline arguments.
+  '''
+  parser = argparse.ArgumentParser(description='Benchmarks of the site extraction pipeline.')
+  subparsers = parser.add_subparsers(dest='benchmark', metavar='benchmark')
+
+  schedule_parser = subparsers.add_parser('schedule',
+            help='makespan and idle time of the parallel engine')
+  schedule_parser.add_argument('source', help='source file or directory name',
+            metavar='srcfile')
+  schedule_parser.add_argument('-j', '--jobs', default=4, type=int, metavar='N',
+            help='number of worker processes')
+  schedule_parser.add_argument('--profile', metavar='file',
+            help='per-file timings of previous runs')
+  schedule_parser.set_defaults(func=bench_schedule)
+
+  rules_parser = subparsers.add_parser('rules',
+            help='site rules over the node visitors and over the node index')
+  rules_parser.add_argument('source', help='source file or directory name',
+            metavar='srcfile')
+  rules_parser.set_defaults(func=bench_rules)
+
+  flat_parser = subparsers.add_parser('flat',
+            help='memory and rule time of the object trees and the flat ASTs')
+  flat_parser.add_argument('source', help='source file or directory name',
+            metavar='srcfile')
+  flat_parser.set_defaults(func=bench_flat)
+
+  serialize_parser = subparsers.add_parser('serialize',
+            help='size and speed of pickle and of icse.serialize')
+  serialize_parser.add_argument('source', help='source file or directory name',
+            metavar='srcfile')
+  serialize_parser.set_defaults(func=bench_serialize)
+
+  lexer_parser = subparsers.add_parser('lexer',
+            help='tokens/sec of the lexer runtimes, with and without columns')
+  lexer_parser.add_argument('source', help='source file or directory name',
+            metavar='srcfile')
+  lexer_parser.set_defaults(func=bench_lexer)
+
+  parser_parser = subparsers.add_parser('parser',
+            help='reductions/sec of the LR parse loops')
+  parser_parser.add_argument('source', help='source file or directory name',
+            metavar='srcfile')
+  parser_parser.set_defaults(func=bench_parser)
+
+  render_parser = subparsers.add_parser('render',
+            help='rendering work of the site builders')
+  render_parser.add_argument('source', help='source file or directory name',
+            metavar='srcfile')
+  render_parser.add_argument('-n', '--repeat', default=20, type=int,
+            metavar='N', help='number of runs')
+  render_parser.set_defaults(func=bench_render)
+
+  generate_parser = subparsers.add_parser('generate',
+            help='recursive and streaming code generators')
+  generate_parser.add_argument('source', help='source file or directory name',
+            metavar='srcfile')
+  generate_parser.add_argument('-n', '--repeat', default=20, type=int,
+            metavar='N', help='number of runs')
+  generate_parser.set_defaults(func=bench_generate)
+
+  prune_parser = subparsers.add_parser('prune',
+            help='parsing with and without the unused header declarations')
+  prune_parser.add_argument('source', help='source file or directory name',
+            metavar='srcfile')
+  prune_parser.set_defaults(func=bench_prune)
+
+  compact_parser = subparsers.add_parser('compact',
+            help='lexing with and without blank line and marker compaction')
+  compact_parser.add_argument('source', help='source file or directory name',
+            metavar='srcfile')
+  compact_parser.set_defaults(func=bench_compact)
+
+  memo_parser = subparsers.add_parser('memo',
+            help='site rules with and without the function body memo')
+  memo_parser.add_argument('source', help='source file or directory name',
+            metavar='srcfile')
+  memo_parser.set_defaults(func=bench_memo)
+
+  functions_parser = subparsers.add_parser('functions',
+            help='site rules over the whole files and over selected functions')
+  functions_parser.add_argument('source', help='source file or directory name',
+            metavar='srcfile')
+  functions_parser.add_argument('-p', '--patterns', default='*_bad',
+            metavar='PATTERN[,PATTERN]', help='function name patterns')
+  functions_parser.add_argument('-n', '--repeat', default=20, type=int,
+            metavar='N', help='number of runs')
+  functions_parser.set_defaults(func=bench_functions)
+
+  calls_parser = subparsers.add_parser('calls',
+            help='library call rules with chained comparisons and dispatch tables')
+  calls_parser.add_argument('source', help='source file or directory name',
+            metavar='srcfile')
+  calls_parser.add_argument('-n', '--repeat', default=20, type=int,
+            metavar='N', help='number of runs')
+  calls_parser.set_defaults(func=bench_calls)
+
+  specs_parser = subparsers.add_parser('specs',
+            help='built-in site rules and site rules compiled from a specification')
+  specs_parser.add_argument('source', help='source file or directory name',
+            metavar='srcfile')
+  specs_parser.add_argument('-r', '--rules', metavar='file',
+            help='JSON file of site rules to time too')
+  specs_parser.add_argument('-n', '--repeat', default=20, type=int,
+            metavar='N', help='number of runs')
+  specs_parser.set_defaults(func=bench_specs)
+
+  journal_parser = subparsers.add_parser('journal',
+            help='journal record and load time, resume with other options')
+  journal_parser.add_argument('source', help='source file or directory name',
+            metavar='srcfile')
+  journal_parser.set_defaults(func=bench_journal)
+
+  args = parser.parse_args()
+
+  if args.benchmark is None:
+    parser.print_help()
+    sys.exit(1)
+
+  if not os.path.exists(args.source):
+    print("File or directory '%s' does not exist!" % args.source)
+    sys.exit(1)
+
+  return args
+
+def main():
+  args = checkArguments()
+  args.func(args)
+
+
+if __name__ == '__main__':
+  main()
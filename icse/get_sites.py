@@ -1,4 +1,14 @@
 from icse import extractor
+from icse import schedule
+from icse import journal
+from icse import shard
+from icse import coordinator
+from icse import sinks
+from icse import compress
+from icse import functions
+from icse import calls
+from icse import rules
+import multiprocessing
 import time
 import argparse
 import os.path
@@ -10,16 +20,65 @@ def checkArguments():
   '''
   # 'division_by_zero', 'variable_access', 'null_ptr', 'int_overflow', 'int_underflow', 'write_what_where', 'return'
   types = ['all', 'buffer_write', 'buffer_read']
+  formats = sorted(sinks.SINKS)
 
-  parser = argparse.ArgumentParser(description='Extract sites from file(s) and output them to file.')
+  parser = argparse.ArgumentParser(description='Extract sites from file(s) and output them to file.',
+            epilog="run 'get_sites.py merge -h' to merge the outputs of the shards, "
+                   "'get_sites.py worker -h' to start workers for a coordinator")
 
   parser.add_argument('source', help='source file or directory name', 
             metavar='srcfile')
-  parser.add_argument('-o', '--output-file', help='site output file name', 
-            metavar='outfile')
+  parser.add_argument('-o', '--output-file', help='site output file name, '
+            'compressed when it ends with .gz, .bz2 or .xz', metavar='outfile')
   parser.add_argument('-s', '--sites', default='all', metavar='type',
-            choices=types,
-            help='which type of site to search for ' + str(types))
+            help='which type of site to search for ' + str(types)
+                 + ', or a site type of the --rules file')
+  parser.add_argument('-f', '--format', default='csv', metavar='format',
+            choices=formats,
+            help='output format ' + str(formats) + ', an existing sqlite '
+                 'output is updated with the files that changed')
+  parser.add_argument('-j', '--jobs', default=1, type=int, metavar='N',
+            help='number of worker processes, files are dispatched largest first')
+  parser.add_argument('--profile', metavar='file',
+            help='per-file timings used to schedule the files, updated after the run')
+  parser.add_argument('--timeout', type=float, metavar='seconds',
+            help='wall-clock limit for each file, slower files are killed')
+  parser.add_argument('--memory-limit', type=int, metavar='MB',
+            help='memory limit of each worker process')
+  parser.add_argument('--retry', action='store_true',
+            help='retry failed files once with doubled limits')
+  parser.add_argument('--failures', metavar='file',
+            help='failed files report, defaults to failures.csv when files fail')
+  parser.add_argument('--journal', metavar='file',
+            help='journal of the finished files, defaults to outfile.journal')
+  parser.add_argument('--resume', action='store_true',
+            help='skip the files finished by the interrupted run of the journal')
+  parser.add_argument('--shard', metavar='i/N',
+            help='only process the i-th of N parts of the corpus, i counts from 1')
+  parser.add_argument('--serve', metavar='host:port',
+            help='hand the files out to remote workers instead of processing them')
+  parser.add_argument('--authkey', default=coordinator.AUTHKEY, metavar='key',
+            help='shared key of the coordinator and the workers')
+  parser.add_argument('--prune', action='store_true',
+            help='drop the header declarations a file does not use before parsing it')
+  parser.add_argument('--compact', action='store_true',
+            help='remove the blank lines and line markers the lexer does not need')
+  parser.add_argument('--memo', action='store_true',
+            help='reuse the site rule results of structurally identical function bodies')
+  parser.add_argument('--functions', metavar='PATTERN[,PATTERN]',
+            help='only extract the sites of the functions matching a glob pattern '
+                 'or a regular expression prefixed with re:')
+  parser.add_argument('--group-functions', action='store_true',
+            help='list the sites of each file grouped by enclosing function')
+  parser.add_argument('--calls', action='store_true',
+            help='the buffers written and read by library calls (strcpy, memcpy, '
+                 'fgets, ...) are sites too')
+  parser.add_argument('--call-rules', metavar='file',
+            help='JSON file of the arguments written and read by more library '
+                 'functions, implies --calls')
+  parser.add_argument('--rules', metavar='file',
+            help='JSON file of site rules run instead of the built-in ones, in '
+                 'one pass over each file')
 
   args = parser.parse_args()
 
@@ -30,27 +89,219 @@ def checkArguments():
   if args.output_file:
     print("output-file: '%s'" % args.output_file)
   else:
-    print("no output-file specified, using sites_list.csv")
-    args.output_file = 'sites_list.csv'
+    default = 'sites_list.' + {'sqlite': 'db', 'binary': 'bin'}.get(args.format, args.format)
+    print("no output-file specified, using %s" % default)
+    args.output_file = default
+
+  if args.format == 'sqlite' and compress.compressor(args.output_file):
+    print("sqlite output can not be compressed!")
+    sys.exit(1)
+
+  if not args.journal:
+    args.journal = args.output_file + '.journal'
 
   print("sites: '%s'" % args.sites)
 
+  if args.jobs < 1:
+    print("jobs must be at least 1!")
+    sys.exit(1)
+
+  if args.memory_limit:
+    args.memory_limit *= 1024 * 1024
+
+  if args.shard:
+    try:
+      args.shard = shard.parse_shard(args.shard)
+    except ValueError:
+      print("Invalid shard '%s', expected i/N with 1 <= i <= N!" % args.shard)
+      sys.exit(1)
+    if args.format != 'csv':
+      print("--shard only merges csv outputs, not '%s'!" % args.format)
+      sys.exit(1)
+    print("shard: %d/%d" % (args.shard[0] + 1, args.shard[1]))
+
+  if args.functions:
+    try:
+      args.functions = functions.parse_patterns(args.functions)
+    except ValueError as e:
+      print("Invalid functions: %s!" % e)
+      sys.exit(1)
+    print("functions: %s" % ', '.join(args.functions))
+
+  if args.call_rules:
+    try:
+      args.calls = calls.load_rules(args.call_rules)
+    except (OSError, ValueError) as e:
+      print("Invalid call rules '%s': %s!" % (args.call_rules, e))
+      sys.exit(1)
+  elif args.calls:
+    args.calls = calls.CallRules()
+  else:
+    args.calls = None
+
+  if args.rules:
+    try:
+      args.rules = rules.load_rules(args.rules)
+    except (OSError, ValueError) as e:
+      print("Invalid rules '%s': %s!" % (args.rules, e))
+      sys.exit(1)
+    if args.memo:
+      print("--memo only memoizes the built-in rules, not --rules!")
+      sys.exit(1)
+    site_types = ['all'] + args.rules.kinds
+    print("site types: %s" % ', '.join(args.rules.kinds))
+  else:
+    site_types = types
+  if args.sites not in site_types:
+    print("Invalid site type '%s', expected one of %s!" % (args.sites, site_types))
+    sys.exit(1)
+
+  if args.serve:
+    try:
+      args.serve = coordinator.parse_address(args.serve)
+    except ValueError:
+      print("Invalid address '%s', expected host:port!" % args.serve)
+      sys.exit(1)
+
+  return args
+
+def checkMergeArguments():
+  '''
+  Reads commandline arguments of the merge subcommand.
+  '''
+  parser = argparse.ArgumentParser(prog='get_sites.py merge',
+            description='Merge the site outputs of the shards of a corpus.')
+
+  parser.add_argument('inputs', nargs='+', help='site output of each shard',
+            metavar='shardfile')
+  parser.add_argument('-o', '--output-file', default='sites_list.csv',
+            help='merged site output file name', metavar='outfile')
+
+  args = parser.parse_args(sys.argv[2:])
+
+  for path in args.inputs:
+    if not os.path.exists(path):
+      print("File '%s' does not exist!" % path)
+      sys.exit(1)
+
+  return args
+
+def merge():
+  args = checkMergeArguments()
+  print("merging %d shard(s) into '%s'" % (len(args.inputs), args.output_file))
+  try:
+    shard.merge_csv(args.inputs, args.output_file)
+  except ValueError as e:
+    print("Cannot merge: %s!" % e)
+    sys.exit(1)
+
+def checkWorkerArguments():
+  '''
+  Reads commandline arguments of the worker subcommand.
+  '''
+  parser = argparse.ArgumentParser(prog='get_sites.py worker',
+            description='Process the files handed out by a coordinator (get_sites.py --serve).')
+
+  parser.add_argument('address', help='address of the coordinator',
+            metavar='host:port')
+  parser.add_argument('-j', '--jobs', default=1, type=int, metavar='N',
+            help='number of worker processes')
+  parser.add_argument('--authkey', default=coordinator.AUTHKEY, metavar='key',
+            help='shared key of the coordinator and the workers')
+
+  args = parser.parse_args(sys.argv[2:])
+
+  try:
+    args.address = coordinator.parse_address(args.address)
+  except ValueError:
+    print("Invalid address '%s', expected host:port!" % args.address)
+    sys.exit(1)
+
+  if args.jobs < 1:
+    print("jobs must be at least 1!")
+    sys.exit(1)
+
   return args
 
+def worker():
+  args = checkWorkerArguments()
+  print("working for %s:%d" % args.address)
+  processes = [multiprocessing.Process(target=coordinator.run_worker,
+                                       args=(args.address, args.authkey))
+               for i in range(args.jobs)]
+  for process in processes:
+    process.start()
+  for process in processes:
+    process.join()
+
 def main():
+  if sys.argv[1:2] == ['merge']:
+    merge()
+    return
+
+  if sys.argv[1:2] == ['worker']:
+    worker()
+    return
+
   args = checkArguments()
   print("Parsing files and Building AST trees, this may take a while...")
-  sites_extractor = extractor.Extractor(args.source, args.sites)
+  profile = schedule.CostProfile(args.profile)
+  # a file stored by a run with other patterns has other sites
+  stored_sites = args.sites
+  if args.functions:
+    stored_sites += ' functions ' + ','.join(args.functions)
+  if args.calls is not None:
+    stored_sites += ' calls ' + args.calls.spec()
+  if args.rules is not None:
+    stored_sites += ' rules ' + args.rules.spec_text()
+  # the journal of another shard holds other files
+  run_options = stored_sites
+  if args.shard:
+    run_options += ' shard %d/%d' % (args.shard[0] + 1, args.shard[1])
+  run_journal = journal.Journal(args.journal, args.resume, run_options)
+  output = sinks.open_sink(args.format, args.output_file, stored_sites,
+                           args.group_functions)
+  try:
+    sites_extractor = extractor.Extractor(args.source, args.sites,
+                                          jobs=args.jobs, profile=profile,
+                                          timeout=args.timeout,
+                                          memory_limit=args.memory_limit,
+                                          retry=args.retry,
+                                          journal=run_journal,
+                                          shard=args.shard, serve=args.serve,
+                                          authkey=args.authkey,
+                                          unchanged=output.unchanged,
+                                          sink=output, prune=args.prune,
+                                          compact=args.compact,
+                                          memo=args.memo,
+                                          function_patterns=args.functions,
+                                          calls=args.calls, rules=args.rules)
+  finally:
+    profile.save()
+    run_journal.close()
 
-  print("Extracting buffer write sites...")
-  sites = sites_extractor.buffer_write_sites()
-  print("Extracting buffer read sites...")
-  sites += sites_extractor.buffer_read_sites()
+  memo = sites_extractor.stats.get('memo')
+  if memo is not None:
+    print("function bodies: %d, memo hits: %d (%.1f%%)"
+          % (memo.get('bodies', 0), memo.get('hits', 0),
+             100.0 * memo.get('hits', 0) / max(1, memo.get('bodies', 0))))
+    print("rule time of the hits: %.3fs, hashing overhead: %.3fs"
+          % (memo.get('hit_time', 0.0), memo.get('overhead', 0.0)))
+
+  if sites_extractor.failures or args.failures:
+    failures_file = args.failures or 'failures.csv'
+    print("%d file(s) failed, see %s" % (len(sites_extractor.failures),
+                                         failures_file))
+    extractor.Extractor.failures_to_csv(sites_extractor.failures, failures_file)
 
   #csv_start = time.clock()
 
-  print("generating csv file")
-  extractor.Extractor.to_csv(sites, args.output_file)
+  if args.format == 'sqlite':
+    print("updating sqlite database, %d file(s) changed" % len(sites_extractor.finished))
+  else:
+    print("generating %s file" % args.format)
+  output.close()
+  run_journal.remove()
 
   #csv_end = time.clock()
   #print("csv time: {0}".format(csv_end - csv_start))
@@ -1,5 +1,6 @@
 """Node Visitor for buffer read sites.
-Buffer read sites include buffer over reads and buffer under reads
+Buffer read sites include buffer over reads and buffer under reads. The
+buffers library calls read are in icse.calls.
 """
 
 from pycparser import c_ast
@@ -9,17 +10,27 @@ class BufferReadVisitor(c_ast.NodeVisitor):
 
   def __init__(self):
     """Constructor method with a list to keep the nodes that matches the site
-    type and a node to keep track of the current node's parent.
+    type, the FuncDef each of them is in and a node to keep track of the
+    current node's parent.
     """
     self.nodes = []
+    self.functions = []
+    self.function = None
     self.current_parent = None
 
+  def visit_FuncDef(self, node):
+    """Keeps track of the enclosing function."""
+    self.function = node
+    self.generic_visit(node)
+    self.function = None
+
   def visit_UnaryOp(self, node):
     """Rules for site matching."""
 
     if(not(isinstance(self.current_parent, c_ast.Assignment) and (self.current_parent.lvalue == node))):
       if(node.op == '*'):
         self.nodes.append(node.expr)
+        self.functions.append(self.function)
 
     self.current_parent = node
     for c_name, c in node.children():
@@ -30,55 +41,75 @@ class BufferReadVisitor(c_ast.NodeVisitor):
     if(not(isinstance(self.current_parent, c_ast.Assignment) and (self.current_parent.lvalue == node))):
       if(not(isinstance(self.current_parent, c_ast.UnaryOp) and self.current_parent.op == '&')):
         self.nodes.append(node.name)
+        self.functions.append(self.function)
 
     self.current_parent = node
     for c_name, c in node.children():
       self.visit(c)
 
-  '''
-  def visit_FuncCall(self, node):
-    """Rules for site matching."""
-    if(isinstance(node.name, c_ast.ID)):
-      if(node.name.name == 'SNPRINTF' or
-          node.name.name == 'snprintf' or
-          node.name.name == '_snprintf' or
-          node.name.name == '_snwprintf' or
-          node.name.name == 'strcpy' or
-          node.name.name == 'strncpy' or
-          node.name.name == 'strncat' or
-          node.name.name == 'strcat' or
-          node.name.name == 'wcsncpy' or
-          node.name.name == 'wcscpy' or
-          node.name.name == 'wcsncat' or
-          node.name.name == 'wcscat' or
-          node.name.name == 'memset' or
-          node.name.name == 'wmemset' or
-          node.name.name == 'wcpcpy' or
-          node.name.name == 'memcpy' or
-          node.name.name == 'memmove' or
-          node.name.name == 'wcpncpy'
-          ):
-        if(not isinstance(node.args.exprs[1], c_ast.Constant)):
-          self.nodes.append(node.args.exprs[1])
-
-      if(node.name.name == 'strlen' or node.name.name == 'wcslen'):
-        self.nodes.append(node.args.exprs[0])
-
-      if(node.name.name == 'fgets'):
-        self.nodes.append(node.args.exprs[2])
-
-      # include these fns if arg is a variable or a cast (not fn call or const)
-      if((node.name.name == 'printLine' or node.name.name == 'printIntLine' or node.name.name == 'printLongLine' or node.name.name == 'printLongLongLine' or node.name.name == 'printHexCharLine' or node.name.name == 'printWLine') and (isinstance(node.args.exprs[0], c_ast.ID) or isinstance(node.args.exprs[0], c_ast.Cast))):
-        self.nodes.append(node.args.exprs[0])
-
-    self.current_parent = node
-    for c_name, c in node.children():
-      self.visit(c)
-  '''
-
   def generic_visit(self, node):
     """Overwriting generic_visit to keep track of parent node."""
     self.current_parent = node
     for c_name, c in node.children():
       self.visit(c)
 
+def find_nodes(index):
+  '''Applies the rules of BufferReadVisitor to the UnaryOp and ArrayRef nodes
+  of a NodeIndex, without walking the tree.
+
+  Notes: The visitor's current_parent is the node visited just before. An
+    Assignment or a UnaryOp always has children, so it can only be visited
+    just before its first child, and the rules only need the parent link.
+
+  Args:
+    index (NodeIndex): Node index of the parsed file
+
+  Returns:
+    list: Matching nodes, in the order of BufferReadVisitor
+  '''
+  candidates = []
+  for node in index.nodes(c_ast.UnaryOp):
+    parent = index.parent(node)
+    if(not(isinstance(parent, c_ast.Assignment) and (parent.lvalue == node))):
+      if(node.op == '*'):
+        candidates.append(node)
+
+  for node in index.nodes(c_ast.ArrayRef):
+    parent = index.parent(node)
+    if(not(isinstance(parent, c_ast.Assignment) and (parent.lvalue == node))):
+      if(not(isinstance(parent, c_ast.UnaryOp) and parent.op == '&')):
+        candidates.append(node)
+
+  nodes = []
+  for node in index.preorder(candidates):
+    if(isinstance(node, c_ast.UnaryOp)):
+      nodes.append(node.expr)
+    else:
+      nodes.append(node.name)
+  return nodes
+
+def find_flat_nodes(flat):
+  '''Applies the rules of BufferReadVisitor to a FlatAST, see find_nodes.
+
+  Args:
+    flat (FlatAST): Flat AST of the parsed file
+
+  Returns:
+    list: Positions of the matching nodes, in preorder
+  '''
+  candidates = []
+  for node in flat.positions('UnaryOp'):
+    parent = flat.parents[node]
+    # an lvalue is the first child of its Assignment
+    if(not(flat.is_kind(parent, 'Assignment') and parent + 1 == node)):
+      if(flat.attr(node, 'op') == '*'):
+        candidates.append(node)
+
+  for node in flat.positions('ArrayRef'):
+    parent = flat.parents[node]
+    if(not(flat.is_kind(parent, 'Assignment') and parent + 1 == node)):
+      if(not(flat.is_kind(parent, 'UnaryOp') and flat.attr(parent, 'op') == '&')):
+        candidates.append(node)
+
+  # the operand is the first child of a UnaryOp, the name of an ArrayRef
+  return [node + 1 for node in sorted(candidates)]
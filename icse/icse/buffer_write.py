@@ -1,7 +1,7 @@
 """Node Visitor for buffer write sites.
 
 Buffer write sites include stack and heap based buffer overflows and buffer
-under writes.
+under writes. The buffers library calls write are in icse.calls.
 """
 
 from pycparser import c_ast
@@ -11,53 +11,67 @@ class BufferWriteVisitor(c_ast.NodeVisitor):
 
   def __init__(self):
     """Constructor method with a list to keep the nodes that matches the site
-    type.
+    type, and the FuncDef each of them is in.
     """
     self.nodes = []
+    self.functions = []
+    self.function = None
+
+  def visit_FuncDef(self, node):
+    """Keeps track of the enclosing function."""
+    self.function = node
+    self.generic_visit(node)
+    self.function = None
 
   def visit_Assignment(self, node):
     """Rules for site matching. '*ptr = 85;' or 'ptr[2] = 23;'"""
     if(isinstance(node.lvalue, c_ast.ArrayRef)):
       self.nodes.append(node)
+      self.functions.append(self.function)
 
     elif(isinstance(node.lvalue, c_ast.UnaryOp) and node.lvalue.op == '*'):
       self.nodes.append(node)
+      self.functions.append(self.function)
 
     for c_name, c in node.children():
       self.visit(c)
 
-'''
-  ### TODO add option to allow analyst to specify function & arguments that
-  ###   lead to site ###
-  def visit_FuncCall(self, node):
-    """Rules for site matching."""
-    #print node.name.name + '\n\n'
-    if(isinstance(node.name, c_ast.ID)):
-      if(node.name.name == 'fgets' or
-          node.name.name == 'strcpy' or
-          node.name.name == 'strncpy' or
-          node.name.name == 'strncat' or
-          node.name.name == 'strcat' or
-          node.name.name == 'wcsncpy' or
-          node.name.name == 'wcscpy' or
-          node.name.name == 'wcsncat' or
-          node.name.name == 'wcscat' or
-          node.name.name == 'memset' or
-          node.name.name == 'wmemset' or
-          node.name.name == 'wcpcpy' or
-          node.name.name == 'memcpy' or
-          node.name.name == 'memmove' or
-          node.name.name == 'wcpncpy' or
-          node.name.name == 'snprintf' or
-          node.name.name == '_snprintf' or
-          node.name.name == '_snwprintf' or
-          node.name.name == 'SNPRINTF'
-          ):
-        self.nodes.append(node.args.exprs[0])
-
-      elif(node.name.name == 'fscanf'):
-        self.nodes.append(node.args.exprs[2])
+def find_nodes(index):
+  '''Applies the rules of BufferWriteVisitor to the Assignment nodes of a
+  NodeIndex, without walking the tree.
 
-    for c_name, c in node.children():
-      self.visit(c)
-'''
+  Args:
+    index (NodeIndex): Node index of the parsed file
+
+  Returns:
+    list: Matching nodes, in the order of BufferWriteVisitor
+  '''
+  nodes = []
+  for node in index.nodes(c_ast.Assignment):
+    if(isinstance(node.lvalue, c_ast.ArrayRef)):
+      nodes.append(node)
+
+    elif(isinstance(node.lvalue, c_ast.UnaryOp) and node.lvalue.op == '*'):
+      nodes.append(node)
+
+  return index.preorder(nodes)
+
+def find_flat_nodes(flat):
+  '''Applies the rules of BufferWriteVisitor to a FlatAST.
+
+  Args:
+    flat (FlatAST): Flat AST of the parsed file
+
+  Returns:
+    list: Positions of the matching Assignment nodes, in preorder
+  '''
+  nodes = []
+  for node in flat.positions('Assignment'):
+    # the lvalue is the first child
+    if(flat.is_kind(node + 1, 'ArrayRef')):
+      nodes.append(node)
+
+    elif(flat.is_kind(node + 1, 'UnaryOp') and flat.attr(node + 1, 'op') == '*'):
+      nodes.append(node)
+
+  return nodes
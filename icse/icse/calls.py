@@ -0,0 +1,242 @@
+"""Buffer write and buffer read sites of library calls.
+
+The buffer a library function writes or reads is one of its arguments:
+strcpy(dst, src) writes its first argument and reads its second one. CallRules
+maps each function name to the positions of the arguments it writes and
+reads, so a call is matched with one dictionary lookup on its name. The
+argument becomes the site.
+
+The default rules cover the C string, memory and input functions and the
+printLine helpers of the Juliet test cases. A JSON file adds the wrappers of a
+project, or replaces the rules of a function:
+
+  {
+    "write": {"SNPRINTF": [0], "myCopy": [0]},
+    "read": {"myCopy": [[1, "nonconstant"]], "logLine": [[0, "variable"]]}
+  }
+
+An argument is its position, or a [position, condition] pair:
+
+  nonconstant  the argument is not a constant ('strcpy(data, "AAA")' reads
+               no buffer)
+  variable     the argument is a name or a cast (not a call or a constant)
+
+An empty list drops the rules of the function.
+"""
+
+import json
+
+from pycparser import c_ast
+
+#Kinds of the rules, the site type of each
+WRITE = 'write'
+READ = 'read'
+SITE_TYPES = {WRITE: 'buffer_write', READ: 'buffer_read'}
+
+def _nonconstant(node):
+  return not isinstance(node, c_ast.Constant)
+
+def _variable(node):
+  return isinstance(node, (c_ast.ID, c_ast.Cast))
+
+#Conditions on the arguments, by name
+CONDITIONS = {
+  'nonconstant': _nonconstant,
+  'variable': _variable,
+}
+
+#Functions that copy or format into their first argument from their second
+_COPIES = ['strcpy', 'strncpy', 'strncat', 'strcat', 'wcsncpy', 'wcscpy',
+           'wcsncat', 'wcscat', 'memset', 'wmemset', 'wcpcpy', 'memcpy',
+           'memmove', 'wcpncpy', 'snprintf', '_snprintf', '_snwprintf',
+           'SNPRINTF']
+
+#Juliet output helpers, their argument is read when it is a variable
+_PRINTS = ['printLine', 'printIntLine', 'printLongLine', 'printLongLongLine',
+           'printHexCharLine', 'printWLine']
+
+#Rules used when no file is given
+DEFAULT_RULES = {
+  WRITE: dict([(name, [0]) for name in _COPIES] +
+              [('fgets', [0]), ('fscanf', [2])]),
+  READ: dict([(name, [[1, 'nonconstant']]) for name in _COPIES] +
+             [('strlen', [0]), ('wcslen', [0]), ('fgets', [2])] +
+             [(name, [[0, 'variable']]) for name in _PRINTS]),
+}
+
+class CallRules:
+  """Arguments written and read by library functions.
+
+  Attributes:
+    rules (dict): The rules in the file format, see the module docstring
+    writes (dict): (position, condition) of each argument written, by
+      function name. condition is a function of the argument node, None
+      for any argument.
+    reads (dict): Likewise for the arguments read
+  """
+
+  def __init__(self, rules=DEFAULT_RULES):
+    """Constructor method.
+
+    Args:
+      rules (optional[dict]): Rules in the file format, the default rules
+        when not given
+
+    Returns:
+      None
+
+    Raises:
+      ValueError: When the rules are malformed
+    """
+    self.rules = {WRITE: {}, READ: {}}
+    self.writes = {}
+    self.reads = {}
+    self.update(rules)
+
+  def update(self, rules):
+    """Adds rules, replacing the rules of the functions already there.
+
+    Args:
+      rules (dict): Rules in the file format
+
+    Returns:
+      None
+
+    Raises:
+      ValueError: When the rules are malformed
+    """
+    if not isinstance(rules, dict):
+      raise ValueError('call rules must be an object')
+    for kind, functions in rules.items():
+      if kind not in SITE_TYPES:
+        raise ValueError("unknown call rule kind '%s'" % kind)
+      if not isinstance(functions, dict):
+        raise ValueError("call rules of '%s' must be an object" % kind)
+      table = self.writes if kind == WRITE else self.reads
+      for name, arguments in functions.items():
+        compiled = tuple(_compile_argument(name, argument)
+                         for argument in arguments)
+        if compiled:
+          table[name] = compiled
+          self.rules[kind][name] = list(arguments)
+        else:
+          table.pop(name, None)
+          self.rules[kind].pop(name, None)
+
+  def spec(self):
+    """Returns the rules as a string, equal for equal rules.
+
+    Args:
+      None
+
+    Returns:
+      string: The rules in the file format, keys sorted
+    """
+    return json.dumps(self.rules, sort_keys=True, separators=(',', ':'))
+
+def load_rules(path):
+  '''Loads the default rules updated with the rules of a JSON file.
+
+  Args:
+    path (string): JSON file of rules, see the module docstring
+
+  Returns:
+    CallRules: The rules
+
+  Raises:
+    ValueError: When the file is not valid JSON or the rules are malformed
+    OSError: When the file cannot be read
+  '''
+  with open(path) as f:
+    rules = json.load(f)
+  call_rules = CallRules()
+  call_rules.update(rules)
+  return call_rules
+
+def _compile_argument(name, argument):
+  '''Returns the (position, condition) of an argument rule.'''
+  if isinstance(argument, list) and len(argument) == 2:
+    position, condition = argument
+    if condition not in CONDITIONS:
+      raise ValueError("unknown condition '%s' of '%s'" % (condition, name))
+    test = CONDITIONS[condition]
+  else:
+    position, test = argument, None
+  if not isinstance(position, int) or isinstance(position, bool) or position < 0:
+    raise ValueError("invalid argument %r of '%s'" % (argument, name))
+  return (position, test)
+
+def call_arguments(call, table):
+  '''Returns the arguments of a call a table of rules matches.
+
+  Args:
+    call (c_ast.FuncCall): The call
+    table (dict): CallRules.writes or CallRules.reads
+
+  Returns:
+    list: The matching argument nodes, in the order of the rules
+  '''
+  name = call.name
+  if type(name) is not c_ast.ID or call.args is None:
+    return []
+  arguments = table.get(name.name)
+  if arguments is None:
+    return []
+  exprs = call.args.exprs
+  found = []
+  for position, test in arguments:
+    if position < len(exprs) and (test is None or test(exprs[position])):
+      found.append(exprs[position])
+  return found
+
+class CallVisitor(c_ast.NodeVisitor):
+  """pycparser NodeVisitor for the call sites of a table of rules."""
+
+  def __init__(self, table):
+    """Constructor method with the table of rules, lists to keep the calls
+    that match, the matching argument of each, and the FuncDef each call is
+    in.
+    """
+    self.table = table
+    self.calls = []
+    self.nodes = []
+    self.functions = []
+    self.function = None
+
+  def visit_FuncDef(self, node):
+    """Keeps track of the enclosing function."""
+    self.function = node
+    self.generic_visit(node)
+    self.function = None
+
+  def visit_FuncCall(self, node):
+    """Rules for site matching. 'strcpy(data, source);'"""
+    for argument in call_arguments(node, self.table):
+      self.calls.append(node)
+      self.nodes.append(argument)
+      self.functions.append(self.function)
+
+    for c_name, c in node.children():
+      self.visit(c)
+
+def find_nodes(index, table):
+  '''Applies the rules of CallVisitor to the FuncCall nodes of a NodeIndex,
+  without walking the tree.
+
+  Args:
+    index (NodeIndex): Node index of the parsed file
+    table (dict): CallRules.writes or CallRules.reads
+
+  Returns:
+    tuple: (calls, arguments), the matching argument of each call, in the
+      order of CallVisitor
+  '''
+  candidates = [node for node in index.nodes(c_ast.FuncCall)
+                if type(node.name) is c_ast.ID and node.name.name in table]
+  calls = []
+  nodes = []
+  for node in index.preorder(candidates):
+    for argument in call_arguments(node, table):
+      calls.append(node)
+      nodes.append(argument)
+  return (calls, nodes)
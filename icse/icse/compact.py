@@ -0,0 +1,65 @@
+"""Compaction of the blank lines and line markers of preprocessed text.
+
+cpp output holds runs of blank lines and line markers that only restate the
+position the lexer is already at, and pruning (icse.prune) leaves whole
+header declarations as blank lines. compact rewrites the text so that every
+line that is not blank or a marker is kept as is, at the same file and line
+number as in the original, with the fewest bytes in between: nothing when
+the lexer is already there, newlines when that is shorter than a marker,
+else one marker.
+
+The input must be cpp output without comments: a blank line inside a
+comment would be rewritten too.
+"""
+
+import re
+
+#Line marker, as CLexer recognizes them: '# <line> ["<file>" [flags]]' or
+#'#line <line> ["<file>"]'
+_LINE_MARKER = re.compile(r'[ \t]*#[ \t]*(?:line\W[ \t]*)?(\d+)[ \t]*'
+                          r'("[^\n]*?")?[ \t\d]*$')
+
+def compact(text):
+  '''Removes the blank lines and the line markers the lexer does not need.
+
+  Args:
+    text (string): Preprocessed C source without comments
+
+  Returns:
+    string: Text that CLexer reads as the same tokens, on the same lines
+      and columns of the same files
+  '''
+  out = []
+  # File and number of the next line of the original text, and where the
+  # lexer of the output is. The file is the quoted name of the marker, None
+  # before the first marker.
+  file = out_file = None
+  line = out_line = 1
+  for text_line in text.splitlines(True):
+    stripped = text_line.strip(' \t\n')
+    if not stripped:
+      line += 1
+      continue
+    if stripped[0] == '#':
+      marker = _LINE_MARKER.match(text_line)
+      if marker is not None:
+        line = int(marker.group(1))
+        if marker.group(2) is not None:
+          file = marker.group(2)
+        continue
+
+    if file != out_file or line != out_line:
+      if file is None:
+        marker = '# %d\n' % line
+      else:
+        marker = '# %d %s\n' % (line, file)
+      if file == out_file and out_line < line <= out_line + len(marker):
+        out.append('\n' * (line - out_line))
+      else:
+        out.append(marker)
+      out_file = file
+      out_line = line
+    out.append(text_line)
+    line += 1
+    out_line += 1
+  return ''.join(out)
@@ -0,0 +1,110 @@
+"""Transparent compression of the outputs and inputs.
+
+Files whose name ends with one of COMPRESSORS are compressed on write and
+decompressed on read. Writes go through a compressor thread, so compressing
+does not hold up the thread that formats the sites; zlib, bz2 and lzma
+release the GIL while they compress, so it does not compete with parsing
+either.
+"""
+
+import io
+import bz2
+import gzip
+import lzma
+import queue
+import threading
+
+#Size of the chunks handed to the compressor thread
+BUFFER_SIZE = 1 << 20
+
+#Maximum number of chunks waiting for the compressor thread
+QUEUE_SIZE = 16
+
+COMPRESSORS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+def compressor(path):
+  '''Returns the open function of the compression of a file.
+
+  Args:
+    path (string): File name
+
+  Returns:
+    function: gzip.open, bz2.open or lzma.open, None for a plain file
+  '''
+  for suffix, opener in COMPRESSORS.items():
+    if path.endswith(suffix):
+      return opener
+  return None
+
+class _CompressorThread(io.RawIOBase):
+  """Binary writer that compresses in a background thread."""
+
+  def __init__(self, stream):
+    """Starts the compressor thread.
+
+    Args:
+      stream (file): Compressed binary file object opened for writing
+
+    Returns:
+      None
+    """
+    io.RawIOBase.__init__(self)
+    self.stream = stream
+    self.error = None
+    self.queue = queue.Queue(QUEUE_SIZE)
+    self.thread = threading.Thread(None, target=self._run)
+    self.thread.daemon = True
+    self.thread.start()
+
+  def _run(self):
+    while True:
+      chunk = self.queue.get()
+      if chunk is None:
+        break
+      if self.error is not None:
+        continue
+      try:
+        self.stream.write(chunk)
+      except Exception as e:
+        self.error = e
+
+  def writable(self):
+    return True
+
+  def write(self, b):
+    if self.error is not None:
+      raise self.error
+    self.queue.put(bytes(b))
+    return len(b)
+
+  def close(self):
+    if not self.closed:
+      self.queue.put(None)
+      self.thread.join()
+      self.stream.close()
+      io.RawIOBase.close(self)
+      if self.error is not None:
+        raise self.error
+
+def open_file(path, mode='r'):
+  '''Opens a file, compressed or not depending on its name.
+
+  Args:
+    path (string): File name
+    mode (optional[string]): 'r', 'w', 'a', optionally with 'b' for binary
+
+  Returns:
+    file: File object, text files are UTF-8 when compressed
+  '''
+  opener = compressor(path)
+  if opener is None:
+    if 'r' in mode:
+      return open(path, mode)
+    return open(path, mode, buffering=BUFFER_SIZE)
+  if 'r' in mode:
+    return opener(path, mode if 'b' in mode else mode + 't')
+  raw = _CompressorThread(opener(path, mode.replace('b', '') + 'b'))
+  buffered = io.BufferedWriter(raw, BUFFER_SIZE)
+  if 'b' in mode:
+    return buffered
+  return io.TextIOWrapper(buffered, encoding='utf-8')
@@ -0,0 +1,313 @@
+"""Work queue coordinator for multi-node extraction.
+
+The coordinator owns the file list and hands out cost ordered batches of
+files over TCP to the workers that connect to it. Workers run the normal
+pipeline (see engine.process_batches) and stream back one FileResult or
+Failure per file. The batch of a worker that disconnects, or that stays
+silent longer than the timeout, goes back to the front of the queue. A
+silent worker is told to stop and its connection is dropped; a result for a
+file that was handed to another worker is ignored.
+
+Workers receive file paths, so every host must see the corpus at the same
+path. Connections are authenticated with a shared key, as the messages are
+pickled.
+"""
+
+import time
+import queue
+import threading
+import collections
+from multiprocessing.connection import Listener, Client, AuthenticationError
+
+from icse import engine
+from icse import extractor
+from icse import schedule
+from icse import memo as memo_pass
+
+#Default shared key of the coordinator and the workers
+AUTHKEY = 'icse'
+
+#A file whose worker is lost MAX_ATTEMPTS times is recorded as a Failure
+MAX_ATTEMPTS = 2
+
+#Seconds a worker keeps trying to reach a coordinator that is not up yet
+CONNECT_TIMEOUT = 30.0
+
+def parse_address(text):
+  '''Parses a 'host:port' address.
+
+  Args:
+    text (string): Address, the host defaults to localhost
+
+  Returns:
+    tuple: (host, port)
+
+  Raises:
+    ValueError: When text is not a valid address
+  '''
+  host, sep, port = text.rpartition(':')
+  return (host or 'localhost', int(port))
+
+def run_worker(address, authkey=AUTHKEY):
+  '''Connects to a coordinator and processes the batches it hands out until
+  the coordinator is done.
+
+  Args:
+    address (tuple): (host, port) of the coordinator
+    authkey (optional[string]): Shared key of the coordinator
+
+  Returns:
+    None
+  '''
+  deadline = time.time() + CONNECT_TIMEOUT
+  while True:
+    try:
+      conn = Client(address, authkey=authkey.encode('utf-8'))
+      break
+    except ConnectionRefusedError:
+      if time.time() > deadline:
+        raise
+      time.sleep(0.5)
+  try:
+    (site_types, prune, compact, memo, function_patterns, calls,
+     rules) = conn.recv()
+  except EOFError:
+    # the coordinator finished before handing out any work
+    return
+  try:
+    engine.process_batches(conn, site_types, prune=prune, compact=compact,
+                           memo=memo, function_patterns=function_patterns,
+                           calls=calls, rules=rules)
+  except (BrokenPipeError, ConnectionResetError):
+    # the coordinator dropped this worker after it stayed silent too long
+    return
+
+class _WorkerLost(Exception):
+  """Raised when a worker stays silent longer than the timeout."""
+
+class Coordinator:
+  """Hands out batches of files to remote workers.
+  Has the interface of engine.Engine.
+
+  Attributes:
+    site_types (string): Type of site(s) to extract
+    address (tuple): (host, port) the coordinator listens on
+    authkey (string): Shared key of the workers
+    profile (CostProfile): Timings used to order the files, updated with the
+      timings of this run
+    batch_size (int): Maximum number of small files in a batch
+    timeout (float): Seconds a worker may stay silent before its batch is
+      reassigned, None for no limit
+    prune (bool): True to have the workers drop the unused header
+      declarations before parsing
+    compact (bool): True to have the workers compact the blank lines and
+      line markers of the preprocessed text
+    memo (bool): True to have the workers memoize the site rule results of
+      function bodies
+    function_patterns (list): Name patterns of the functions whose sites the
+      workers extract, None for all the sites
+    calls (CallRules): Library call rules whose arguments are sites too, None
+      for no call sites
+    rules (RuleSet): Site rules the workers run instead of the built-in ones,
+      None for the built-in ones
+    stats (dict): makespan, busy and idle seconds and number of workers of
+      the last run, and the function body memo counters of the workers
+      under 'memo' with memo
+    failures (list): Failure of each file of the last run that could not be
+      processed
+  """
+
+  def __init__(self, site_types='all', address=('localhost', 0),
+               authkey=AUTHKEY, profile=None, batch_size=engine.BATCH_SIZE,
+               timeout=None, prune=False, compact=False, memo=False,
+               function_patterns=None, calls=None, rules=None):
+    """Constructor method.
+
+    Args:
+      site_types (optional[string]): Type of site(s) to extract
+      address (optional[tuple]): (host, port) to listen on
+      authkey (optional[string]): Shared key of the workers
+      profile (optional[CostProfile]): Timings of previous runs
+      batch_size (optional[int]): Maximum number of small files in a batch
+      timeout (optional[float]): Seconds a worker may stay silent
+      prune (optional[bool]): Have the workers drop the header declarations
+        each file does not need before parsing it, see icse.prune
+      compact (optional[bool]): Have the workers compact the blank lines
+        and line markers of each preprocessed file, see icse.compact
+      memo (optional[bool]): Have the workers memoize the site rule results
+        of function bodies across their files, see icse.memo
+      function_patterns (optional[list]): Have the workers only extract the
+        sites of the functions whose name matches one of these patterns,
+        see icse.functions
+      calls (optional[CallRules]): Have the workers extract the arguments
+        of the library calls of these rules too, see icse.calls
+      rules (optional[RuleSet]): Have the workers run these site rules
+        instead of the built-in ones, see icse.rules
+
+    Returns:
+      None
+    """
+    self.site_types = site_types
+    self.address = address
+    self.authkey = authkey
+    self.profile = profile if profile is not None else schedule.CostProfile()
+    self.batch_size = batch_size
+    self.timeout = timeout
+    self.prune = prune
+    self.compact = compact
+    self.memo = memo
+    self.function_patterns = function_patterns
+    self.calls = calls
+    self.rules = rules
+    self.stats = {}
+    self.failures = []
+
+  def run(self, files):
+    """Extracts the sites of files with the workers that connect.
+
+    Notes: Fills self.stats and self.failures when all the files are done.
+
+    Args:
+      files (list): Paths of the files to process
+
+    Returns:
+      generator: FileResult of each file, in completion order
+    """
+    costs = self.profile.estimate(files)
+    self.batches = collections.deque(schedule.make_batches(
+      schedule.order_files(files, costs), costs, self.batch_size))
+    self.attempts = collections.Counter()
+    self.owners = {}
+    self.remaining = len(files)
+    self.condition = threading.Condition()
+    self.results = queue.Queue()
+    self.failures = []
+    self.worker_time = 0.0
+    self.workers = 0
+    busy = 0.0
+    memo_counters = {}
+
+    if not files:
+      return
+
+    listener = Listener(self.address, authkey=self.authkey.encode('utf-8'))
+    print("coordinator listening on %s:%d" % listener.address)
+    self.serve_threads = []
+    accept_th = threading.Thread(None, target=self._accept, args=(listener,))
+    accept_th.daemon = True
+    accept_th.start()
+
+    start = time.time()
+    try:
+      for i in range(len(files)):
+        message = self.results.get()
+        busy += message.elapsed
+        self.profile.record(message.filename, message.elapsed)
+        if isinstance(message, extractor.Failure):
+          self.failures.append(message)
+        else:
+          memo_pass.add_stats(memo_counters, message.memo)
+          yield message
+    finally:
+      with self.condition:
+        self.remaining = 0
+        self.condition.notify_all()
+      listener.close()
+      for serve_th in self.serve_threads:
+        serve_th.join(1.0)
+
+    makespan = time.time() - start
+    self.stats = {'makespan': makespan, 'busy': busy,
+                  'idle': max(0.0, self.worker_time - busy),
+                  'workers': self.workers}
+    if self.memo:
+      self.stats['memo'] = memo_counters
+
+  def _accept(self, listener):
+    """Accepts the workers and serves each one in its own thread."""
+    while True:
+      try:
+        conn = listener.accept()
+      except AuthenticationError:
+        continue
+      except OSError:
+        # the listener was closed at the end of the run
+        break
+      serve_th = threading.Thread(None, target=self._serve, args=(conn,))
+      serve_th.daemon = True
+      serve_th.start()
+      self.serve_threads.append(serve_th)
+
+  def _serve(self, conn):
+    """Hands batches to one worker until the run is done, requeues the
+    unfinished files of its batch if the worker is lost."""
+    sent = []
+    connected = time.time()
+    started = connected
+    with self.condition:
+      self.workers += 1
+    try:
+      conn.send((self.site_types, self.prune, self.compact, self.memo,
+                 self.function_patterns, self.calls, self.rules))
+      while True:
+        with self.condition:
+          while not self.batches and self.remaining > 0:
+            self.condition.wait()
+          if self.remaining == 0:
+            conn.send(None)
+            break
+          batch = self.batches.popleft()
+          for filename in batch:
+            self.owners[filename] = conn
+        sent = list(batch)
+        conn.send(batch)
+        started = time.time()
+        while sent:
+          if self.timeout and not conn.poll(self.timeout):
+            raise _WorkerLost()
+          message = conn.recv()
+          with self.condition:
+            if self.owners.get(message.filename) is not conn:
+              # the file was handed to another worker
+              continue
+            sent.pop(0)
+            self.remaining -= 1
+            self.results.put(message)
+            if self.remaining == 0:
+              self.condition.notify_all()
+          started = time.time()
+    except _WorkerLost:
+      self._requeue(sent, time.time() - started)
+      try:
+        # tells the worker to stop after its current file
+        conn.send(None)
+      except OSError:
+        pass
+    except (EOFError, OSError):
+      self._requeue(sent, time.time() - started)
+    finally:
+      conn.close()
+      with self.condition:
+        self.worker_time += time.time() - connected
+
+  def _requeue(self, sent, elapsed):
+    """Puts the unfinished files of a lost worker back in the queue. The file
+    it was processing, for elapsed seconds, is recorded as a Failure after
+    MAX_ATTEMPTS losses."""
+    if not sent:
+      return
+    with self.condition:
+      for filename in sent:
+        self.owners.pop(filename, None)
+      if self.remaining == 0:
+        return
+      current = sent[0]
+      self.attempts[current] += 1
+      if self.attempts[current] >= MAX_ATTEMPTS:
+        sent = sent[1:]
+        self.remaining -= 1
+        self.results.put(extractor.Failure(current, 'lost',
+          'worker lost %d times' % self.attempts[current], elapsed))
+      if sent:
+        self.batches.appendleft(sent)
+      self.condition.notify_all()
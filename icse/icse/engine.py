@@ -0,0 +1,466 @@
+"""Parallel extraction engine.
+
+Runs the whole pipeline of a file (preprocessing, parsing and site rules) in
+worker processes. Workers only send back Sites, the ASTs never leave the
+process that built them.
+
+A file that fails, runs past the wall-clock limit or takes its worker down
+is recorded as a Failure and the remaining files keep flowing: the engine
+kills the worker, starts a new one and hands it the rest of the batch.
+"""
+
+import os
+import time
+import signal
+import collections
+import multiprocessing
+from multiprocessing.connection import wait
+
+try:
+  import resource
+except ImportError:
+  resource = None
+
+from pycparser import CParser
+from icse import extractor
+from icse import schedule
+from icse import render
+from icse import memo as memo_pass
+from icse import functions
+
+#Maximum number of small files handed to a worker at once
+BATCH_SIZE = 4
+
+#Limits are multiplied by RETRY_FACTOR when failed files are retried
+RETRY_FACTOR = 2
+
+#Seconds between two checks that the parent of an idle worker is alive
+PARENT_POLL = 1.0
+
+#memo holds the function body memo counters of the file, None without memo
+FileResult = collections.namedtuple('FileResult',
+                                    ['filename', 'writes', 'reads', 'elapsed',
+                                     'memo'])
+
+def process_batches(conn, site_types, cpp_args=None, prune=False,
+                    compact=False, memo=False, function_patterns=None,
+                    calls=None, rules=None):
+  '''Worker loop. Receives batches of file paths and sends back one
+  FileResult or Failure per file, until it receives None, the connection is
+  closed or the parent process dies. A None received during a batch stops
+  the worker after its current file.
+
+  Args:
+    conn (Connection): Connection to the engine or to the coordinator
+    site_types (string): Type of site(s) to extract
+    cpp_args (optional[list]): Arguments for cpp, defaults to
+      extractor.CPPARGS
+    prune (optional[bool]): Drop the unused header declarations before
+      parsing, see icse.prune
+    compact (optional[bool]): Compact the blank lines and line markers of
+      the preprocessed text, see icse.compact
+    memo (optional[bool]): Memoize the site rule results of function bodies
+      across the files of the worker, see icse.memo
+    function_patterns (optional[list]): Only extract the sites of the
+      functions whose name matches one of these patterns, see
+      icse.functions
+    calls (optional[CallRules]): Library call rules whose arguments are
+      sites too, see icse.calls
+    rules (optional[RuleSet]): Site rules run instead of the built-in ones,
+      see icse.rules
+
+  Returns:
+    None
+  '''
+  if cpp_args is None:
+    cpp_args = extractor.CPPARGS
+  parent = os.getppid()
+  parser = CParser(index_nodes=True, scanner='fast', lr_parser='fast')
+  renderer = render.ValueRenderer()
+  body_memo = memo_pass.BodyMemo() if memo else None
+  select = None
+  if function_patterns:
+    select = functions.name_matcher(function_patterns)
+  while True:
+    # sibling workers inherit the pipe, so EOF alone does not tell that the
+    # engine was killed
+    while not conn.poll(PARENT_POLL):
+      if os.getppid() != parent:
+        return
+    try:
+      batch = conn.recv()
+    except EOFError:
+      break
+    if batch is None:
+      break
+    for position, file_path in enumerate(batch):
+      # the next batch is only sent once this one is done, anything received
+      # before it, or the connection closing, is a request to stop
+      if position > 0 and conn.poll():
+        conn.close()
+        return
+      start = time.time()
+      counters = body_memo.stats() if body_memo is not None else None
+      try:
+        ast = extractor.parse_file(file_path, use_cpp=True,
+          cpp_path=extractor.CPPPATH,
+          cpp_args=cpp_args,
+          parser=parser,
+          prune=prune,
+          compact=compact
+          )
+        writes, reads = extractor.file_sites(ast, site_types, renderer,
+                                             body_memo, select, calls,
+                                             rules)
+      except extractor.ExtractionError as e:
+        conn.send(e.failure(time.time() - start))
+        continue
+      if body_memo is not None:
+        counters = memo_pass.stats_since(body_memo, counters)
+      conn.send(FileResult(file_path, writes, reads, time.time() - start,
+                           counters))
+  conn.close()
+
+def _worker_main(conn, site_types, cpp_args, memory_limit, prune, compact,
+                 memo, function_patterns, calls, rules):
+  '''Worker process of the engine, see process_batches.
+
+  Args:
+    conn (Connection): Pipe to the engine
+    site_types (string): Type of site(s) to extract
+    cpp_args (list): Arguments for cpp
+    memory_limit (int): Address space limit in bytes, None for no limit
+    prune (bool): Drop the unused header declarations before parsing
+    compact (bool): Compact the blank lines and line markers before parsing
+    memo (bool): Memoize the site rule results of function bodies
+    function_patterns (list): Name patterns of the functions to extract the
+      sites of, None for all
+    calls (CallRules): Library call rules, None for no call sites
+    rules (RuleSet): Site rules, None for the built-in ones
+
+  Returns:
+    None
+  '''
+  if hasattr(os, 'setpgrp'):
+    # cpp runs in the worker's process group so a kill reaches it too
+    os.setpgrp()
+  if memory_limit and resource is not None:
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+  process_batches(conn, site_types, cpp_args, prune, compact, memo,
+                  function_patterns, calls, rules)
+
+class _Worker:
+  """Worker process and the files of its batch that are not answered yet.
+
+  Attributes:
+    process (Process): The worker process
+    conn (Connection): Pipe to the worker
+    batch (list): Files sent to the worker without an answer, the first one
+      is the file being processed
+    started (float): Time the first file of batch was started
+  """
+
+  def __init__(self, site_types, cpp_args, memory_limit, prune, compact,
+               memo, function_patterns, calls, rules):
+    """Starts a worker process.
+
+    Args:
+      site_types (string): Type of site(s) to extract
+      cpp_args (list): Arguments for cpp
+      memory_limit (int): Address space limit in bytes of the worker
+      prune (bool): Drop the unused header declarations before parsing
+      compact (bool): Compact the blank lines and line markers before
+        parsing
+      memo (bool): Memoize the site rule results of function bodies
+      function_patterns (list): Name patterns of the functions to extract
+        the sites of, None for all
+      calls (CallRules): Library call rules, None for no call sites
+      rules (RuleSet): Site rules, None for the built-in ones
+
+    Returns:
+      None
+    """
+    self.conn, child_conn = multiprocessing.Pipe()
+    self.process = multiprocessing.Process(target=_worker_main,
+      args=(child_conn, site_types, cpp_args, memory_limit, prune,
+            compact, memo, function_patterns, calls, rules))
+    self.process.daemon = True
+    self.process.start()
+    child_conn.close()
+    self.batch = []
+    self.started = None
+
+  def send(self, batch):
+    """Hands a batch of files to the worker.
+
+    Args:
+      batch (list): Paths of the files
+
+    Returns:
+      None
+    """
+    self.conn.send(batch)
+    self.batch = list(batch)
+    self.started = time.time()
+
+  def kill(self):
+    """Kills the worker and the cpp it may be running.
+
+    Args:
+      None
+
+    Returns:
+      None
+    """
+    try:
+      os.killpg(self.process.pid, signal.SIGKILL)
+    except (AttributeError, OSError):
+      self.process.kill()
+    self.process.join()
+    self.conn.close()
+
+  def stop(self):
+    """Asks the worker to exit and waits for it.
+
+    Args:
+      None
+
+    Returns:
+      None
+    """
+    try:
+      self.conn.send(None)
+    except OSError:
+      pass
+    self.process.join()
+    self.conn.close()
+
+class Engine:
+  """Pool of worker processes fed with cost ordered batches of files.
+
+  Attributes:
+    site_types (string): Type of site(s) to extract
+    jobs (int): Number of worker processes
+    profile (CostProfile): Timings used to order the files, updated with the
+      timings of this run
+    batch_size (int): Maximum number of small files in a batch
+    cost_order (bool): False keeps the order of the files given to run
+    timeout (float): Wall-clock limit in seconds for each file
+    memory_limit (int): Address space limit in bytes of each worker
+    retry (bool): True to retry failed files once, with RETRY_FACTOR times
+      the limits
+    prune (bool): True to drop the unused header declarations before parsing
+    compact (bool): True to compact the blank lines and line markers of the
+      preprocessed text before parsing
+    memo (bool): True to memoize the site rule results of function bodies in
+      each worker
+    function_patterns (list): Name patterns of the functions whose sites are
+      extracted, None for all the sites
+    calls (CallRules): Library call rules whose arguments are sites too,
+      None for no call sites
+    rules (RuleSet): Site rules run instead of the built-in ones, None for
+      the built-in ones
+    stats (dict): makespan, busy and idle seconds of the last run, and the
+      function body memo counters of the workers under 'memo' with memo
+    failures (list): Failure of each file of the last run that could not be
+      processed
+  """
+
+  def __init__(self, site_types='all', jobs=None, profile=None,
+               batch_size=BATCH_SIZE, cost_order=True, timeout=None,
+               memory_limit=None, retry=False, prune=False, compact=False,
+               memo=False, function_patterns=None, calls=None, rules=None):
+    """Constructor method.
+
+    Args:
+      site_types (optional[string]): Type of site(s) to extract
+      jobs (optional[int]): Number of worker processes, defaults to the
+        number of CPUs
+      profile (optional[CostProfile]): Timings of previous runs
+      batch_size (optional[int]): Maximum number of small files in a batch
+      cost_order (optional[bool]): Dispatch the most expensive files first
+      timeout (optional[float]): Seconds after which a file is killed
+      memory_limit (optional[int]): Bytes a worker may allocate
+      retry (optional[bool]): Retry failed files with doubled limits
+      prune (optional[bool]): Drop the header declarations each file does
+        not need before parsing it, see icse.prune
+      compact (optional[bool]): Compact the blank lines and line markers of
+        each preprocessed file, see icse.compact
+      memo (optional[bool]): Memoize the site rule results of function
+        bodies across the files of each worker, see icse.memo
+      function_patterns (optional[list]): Only extract the sites of the
+        functions whose name matches one of these patterns, see
+        icse.functions
+      calls (optional[CallRules]): Library call rules whose arguments are
+        sites too, see icse.calls
+      rules (optional[RuleSet]): Site rules run instead of the built-in
+        ones, see icse.rules
+
+    Returns:
+      None
+    """
+    self.site_types = site_types
+    self.jobs = jobs or os.cpu_count() or 1
+    self.profile = profile if profile is not None else schedule.CostProfile()
+    self.batch_size = batch_size
+    self.cost_order = cost_order
+    self.timeout = timeout
+    self.memory_limit = memory_limit
+    self.retry = retry
+    self.prune = prune
+    self.compact = compact
+    self.memo = memo
+    self.function_patterns = function_patterns
+    self.calls = calls
+    self.rules = rules
+    self.stats = {}
+    self.failures = []
+
+  def run(self, files):
+    """Extracts the sites of files, most expensive files first.
+
+    Notes: Fills self.stats and self.failures when all the files are done.
+      idle is the time the workers spent waiting: jobs * makespan minus the
+      time spent on files.
+
+    Args:
+      files (list): Paths of the files to process
+
+    Returns:
+      generator: FileResult of each file, in completion order
+    """
+    if self.cost_order:
+      costs = self.profile.estimate(files)
+      files = schedule.order_files(files, costs)
+    else:
+      costs = dict((f, 1.0) for f in files)
+    batches = schedule.make_batches(files, costs, self.batch_size)
+
+    self.failures = []
+    self._busy = 0.0
+    self._memo = {}
+    start = time.time()
+
+    for result in self._run_pass(batches, extractor.CPPARGS, self.timeout,
+                                 self.memory_limit):
+      yield result
+
+    if self.retry and self.failures:
+      retried = self.failures
+      self.failures = []
+      timeout = self.timeout and self.timeout * RETRY_FACTOR
+      memory_limit = self.memory_limit and self.memory_limit * RETRY_FACTOR
+      for result in self._run_pass([[f.filename] for f in retried],
+                                   extractor.CPPARGS, timeout,
+                                   memory_limit):
+        yield result
+
+    makespan = time.time() - start
+    workers = min(self.jobs, len(batches))
+    self.stats = {'makespan': makespan, 'busy': self._busy,
+                  'idle': max(0.0, workers * makespan - self._busy)}
+    if self.memo:
+      self.stats['memo'] = self._memo
+
+  def _run_pass(self, batches, cpp_args, timeout, memory_limit):
+    """Processes batches with one set of settings.
+
+    Notes: Appends a Failure to self.failures for each file that fails, times
+      out or crashes its worker.
+
+    Args:
+      batches (list): Lists of paths, in dispatch order
+      cpp_args (list): Arguments for cpp
+      timeout (float): Seconds after which a file is killed, None for no limit
+      memory_limit (int): Bytes a worker may allocate, None for no limit
+
+    Returns:
+      generator: FileResult of each file that succeeded
+    """
+    batches = collections.deque(batches)
+    workers = [_Worker(self.site_types, cpp_args, memory_limit, self.prune,
+                       self.compact, self.memo, self.function_patterns,
+                       self.calls, self.rules)
+               for i in range(min(self.jobs, len(batches)))]
+
+    def dispatch(worker):
+      if batches:
+        worker.send(batches.popleft())
+
+    def replace(worker, failure):
+      # the worker is gone, record its current file and requeue the others
+      self.failures.append(failure)
+      self._record(failure.filename, failure.elapsed)
+      workers.remove(worker)
+      if worker.batch[1:]:
+        batches.appendleft(worker.batch[1:])
+      if batches:
+        new_worker = _Worker(self.site_types, cpp_args, memory_limit,
+                             self.prune, self.compact, self.memo,
+                             self.function_patterns, self.calls,
+                             self.rules)
+        workers.append(new_worker)
+        dispatch(new_worker)
+
+    try:
+      for worker in workers:
+        dispatch(worker)
+
+      while True:
+        busy = dict((w.conn, w) for w in workers if w.batch)
+        if not busy:
+          break
+
+        wait_time = None
+        if timeout:
+          deadline = min(w.started for w in busy.values()) + timeout
+          wait_time = max(0.0, deadline - time.time())
+
+        for conn in wait(list(busy), wait_time):
+          worker = busy[conn]
+          try:
+            message = conn.recv()
+          except (EOFError, OSError):
+            worker.kill()
+            replace(worker, extractor.Failure(worker.batch[0], 'crash',
+              'worker exited with code %s' % worker.process.exitcode,
+              time.time() - worker.started))
+            continue
+
+          worker.batch.pop(0)
+          worker.started = time.time()
+          self._record(message.filename, message.elapsed)
+          if isinstance(message, extractor.Failure):
+            self.failures.append(message)
+          else:
+            memo_pass.add_stats(self._memo, message.memo)
+            yield message
+          if not worker.batch:
+            dispatch(worker)
+
+        if timeout:
+          now = time.time()
+          for worker in list(workers):
+            if worker.batch and now - worker.started > timeout:
+              worker.kill()
+              replace(worker, extractor.Failure(worker.batch[0], 'timeout',
+                'exceeded %gs' % timeout, now - worker.started))
+    finally:
+      for worker in workers:
+        if worker.batch:
+          worker.kill()
+        else:
+          worker.stop()
+
+  def _record(self, filename, elapsed):
+    """Accounts the time spent on a file.
+
+    Args:
+      filename (string): Path of the file
+      elapsed (float): Seconds spent on the file
+
+    Returns:
+      None
+    """
+    self._busy += elapsed
+    self.profile.record(filename, elapsed)
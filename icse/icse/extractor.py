@@ -6,11 +6,23 @@ import time
 import threading
 import queue
 import fnmatch
-from pycparser import c_ast, c_generator
+import collections
+from pycparser import c_ast
 from icse import site
 #from ocse.node_visitor import *
 from icse import buffer_write
 from icse import buffer_read
+from icse import functions
+from icse import calls as call_rules
+from icse import rules as site_rules
+from icse import engine
+from icse import coordinator
+from icse import shard
+from icse import compress
+from icse import render
+from icse import prune as prune_pass
+from icse import compact as compact_pass
+from icse import memo as memo_pass
 
 from subprocess import Popen, PIPE
 from pycparser import CParser
@@ -18,8 +30,47 @@ from pycparser import CParser
 #Path to the c preprocessor
 CPPPATH = 'cpp'
 
+# removed cpp_arg r'-D_WIN32'
+# r'-rquoteutils/testcasesupport' needed for #include "std_testcase.h"
+#     may fix by moving location of std_testcase.h
+CPPARGS = [r'-Iutils/fake_libc_include', r'-iquoteutils/testcasesupport']
+
+#Header line of the csv output
+CSV_HEADER = 'filename, type, line, value, function, start, end, kind'
+
+Failure = collections.namedtuple('Failure',
+                                 ['filename', 'stage', 'error', 'elapsed'])
+
+class ExtractionError(Exception):
+  """Raised when a stage of the pipeline fails on a file.
+
+  Attributes:
+    filename (string): File that failed
+    stage (string): 'read', 'preprocess', 'parse' or 'sites'
+    error (Exception): Original error
+  """
+
+  def __init__(self, filename, stage, error):
+    Exception.__init__(self, '%s: %s failed: %s: %s' % (filename, stage,
+                       type(error).__name__, error))
+    self.filename = filename
+    self.stage = stage
+    self.error = error
+
+  def failure(self, elapsed):
+    """Returns the Failure record of the error.
+
+    Args:
+      elapsed (float): Seconds spent on the file before the failure
+
+    Returns:
+      Failure: (filename, stage, error, elapsed)
+    """
+    return Failure(self.filename, self.stage,
+                   '%s: %s' % (type(self.error).__name__, self.error), elapsed)
+
 def parse_file(filename, use_cpp=False, cpp_path='cpp', cpp_args='',
-               parser=None):
+               parser=None, prune=False, compact=False):
   '''Modified version of pycparser's parse_file.
 
   Args:
@@ -28,23 +79,41 @@ def parse_file(filename, use_cpp=False, cpp_path='cpp', cpp_args='',
     cpp_path (optional[string]): Path to cpp
     cpp_args (optional[string]): Arguments for cpp
     parser (optional[CParser]): Parser to be used
+    prune (optional[bool]): True to drop the header declarations the file
+      does not need before parsing, see icse.prune
+    compact (optional[bool]): True to remove the blank lines and line
+      markers the lexer does not need from the cpp output, see icse.compact
 
   Returns:
-    tuple: (filename, source, AST)
-
-  '''
+    tuple: (filename, source, AST, NodeIndex), the NodeIndex is None when
+      the parser does not index the nodes
 
-  with open(filename, 'rU') as f:
-    text = f.read()
+  Raises:
+    ExtractionError: When reading, preprocessing or parsing the file fails
 
-  if use_cpp:
-    processedText = preprocess_file(filename, cpp_path, cpp_args)
-  else:
-    processedText = text
+  '''
+  stage = 'read'
+  try:
+    with open(filename, 'r') as f:
+      text = f.read()
 
-  if parser is None:
-    parser = CParser()
-  return (filename, text, parser.parse(processedText, filename))
+    stage = 'preprocess'
+    if use_cpp:
+      processedText = preprocess_file(filename, cpp_path, cpp_args)
+    else:
+      processedText = text
+    if prune:
+      processedText = prune_pass.prune(processedText)
+    if compact and use_cpp:
+      processedText = compact_pass.compact(processedText)
+
+    stage = 'parse'
+    if parser is None:
+      parser = CParser(index_nodes=True, scanner='fast', lr_parser='fast')
+    tree = parser.parse(processedText, filename)
+    return (filename, text, tree, parser.node_index)
+  except Exception as e:
+    raise ExtractionError(filename, stage, e)
 
 def preprocess_file(filename, cpp_path='cpp', cpp_args=''):
   '''Preprocesses the file, removes comments, expands macros, handles
@@ -75,44 +144,498 @@ def preprocess_file(filename, cpp_path='cpp', cpp_args=''):
 
   return text
 
+def list_files(root_path):
+  '''Navigates through the filepath tree and returns all C files.
+
+  Args:
+    root_path (string): File or directory with C source code
+
+  Returns:
+    files (list): Paths of the C files, in os.walk order
+  '''
+  files = []
+  if os.path.isfile( root_path ):
+    files.append( root_path )
+  else:
+    for root, dirnames, filenames in os.walk(root_path):
+      for filename in filenames:
+        if '.c' in filename[-2:]:
+          files.append( os.path.join( root, filename)  )
+  return files
+
+def buffer_write_file_sites(ast, renderer, memo=None, select=None,
+                            calls=None):
+  '''Finds the buffer write nodes of the ast, through the memo when one is
+  given, in its node index when the file was parsed with one, else with the
+  pycparser node visitor, and builds a site for each of them. When select is
+  given, only the nodes of the selected functions are kept. The sites get the
+  fields of their enclosing function, see icse.functions.
+
+  Args:
+    ast (tuple): (filename, source, AST, NodeIndex) as returned by parse_file
+    renderer (ValueRenderer): Renders the site info
+    memo (optional[BodyMemo]): Memoized rule results of function bodies
+    select (optional[function]): Tells whether the sites of a function are
+      extracted from its name, see functions.name_matcher
+    calls (optional[CallRules]): Library call rules, the written arguments
+      are sites too, after the assignments
+
+  Returns:
+    sites (list): Contains buffer write sites of the file
+  '''
+  if memo is not None:
+    found = memo.nodes(ast[2], select)
+    nodes, node_functions = found[0], found[2]
+  elif ast[3] is not None:
+    nodes = buffer_write.find_nodes(ast[3])
+    node_functions = functions.enclosing_functions(ast[3], nodes)
+    if select is not None:
+      nodes, node_functions = functions.keep_selected(nodes, node_functions,
+                                                      select)
+  else:
+    buffer_write_visitor = buffer_write.BufferWriteVisitor()
+    if select is None:
+      buffer_write_visitor.visit(ast[2])
+    else:
+      for funcdef in functions.selected_functions(ast[2], select):
+        buffer_write_visitor.visit(funcdef)
+    nodes = buffer_write_visitor.nodes
+    node_functions = buffer_write_visitor.functions
+  sourceText = ast[1].split('\n')
+  fields = {}
+  sites = []
+  for node, funcdef in zip(nodes, node_functions):
+    line = sourceText[node.coord.line-1].strip()
+    function = fields.get(funcdef)
+    if function is None:
+      function = fields[funcdef] = functions.function_fields(funcdef)
+
+    if(isinstance(node.lvalue, c_ast.ArrayRef)):
+      if(isinstance(node.lvalue.name, c_ast.ID)):
+        sites.append(site.Site(node.lvalue.coord.file, "buffer_write", node.lvalue.coord.line, line, renderer.render(node.lvalue.name), node.lvalue.coord.column, *function))
+      elif(isinstance(node.lvalue.name, c_ast.StructRef)):
+        sites.append(site.Site(node.lvalue.coord.file, "buffer_write", node.lvalue.coord.line, line, renderer.render(node.lvalue.name), node.lvalue.coord.column, *function))
+    elif(isinstance(node.lvalue, c_ast.UnaryOp)):
+      sites.append(site.Site(node.lvalue.coord.file, "buffer_write", node.lvalue.coord.line, line, renderer.render(node.lvalue.expr), node.lvalue.coord.column, *function))
+    else:
+      sites.append(site.Site(node.lvalue.coord.file, "buffer_write", node.lvalue.coord.line, line, renderer.render(node.lvalue), node.lvalue.coord.column, *function))
+
+  if calls is not None:
+    sites.extend(call_file_sites(ast, renderer, calls.writes, "buffer_write",
+                                 select))
+  return sites
+
+def buffer_read_file_sites(ast, renderer, memo=None, select=None, calls=None):
+  '''Finds the buffer read nodes of the ast, as buffer_write_file_sites
+  does, and builds a site for each of them. The site info is the rendered
+  name of the node, nodes without a name ('*(p + 1)') are not sites. The
+  sites get the fields of their enclosing function, see icse.functions.
+
+  Args:
+    ast (tuple): (filename, source, AST, NodeIndex) as returned by parse_file
+    renderer (ValueRenderer): Renders the site info
+    memo (optional[BodyMemo]): Memoized rule results of function bodies
+    select (optional[function]): Tells whether the sites of a function are
+      extracted from its name, see functions.name_matcher
+    calls (optional[CallRules]): Library call rules, the read arguments are
+      sites too, after the dereferences and array references
+
+  Returns:
+    sites (list): Contains buffer read sites of the file
+  '''
+  if memo is not None:
+    found = memo.nodes(ast[2], select)
+    nodes, node_functions = found[1], found[3]
+  elif ast[3] is not None:
+    nodes = buffer_read.find_nodes(ast[3])
+    node_functions = functions.enclosing_functions(ast[3], nodes)
+    if select is not None:
+      nodes, node_functions = functions.keep_selected(nodes, node_functions,
+                                                      select)
+  else:
+    buffer_read_visitor = buffer_read.BufferReadVisitor()
+    if select is None:
+      buffer_read_visitor.visit(ast[2])
+    else:
+      for funcdef in functions.selected_functions(ast[2], select):
+        buffer_read_visitor.visit(funcdef)
+    nodes = buffer_read_visitor.nodes
+    node_functions = buffer_read_visitor.functions
+  sourceText = ast[1].split('\n')
+  fields = {}
+  sites = []
+  for node, funcdef in zip(nodes, node_functions):
+    name = getattr(node, 'name', None)
+    if name is None:
+      continue
+    if not isinstance(name, str):
+      name = renderer.render(name)
+    line = sourceText[node.coord.line-1].strip()
+    function = fields.get(funcdef)
+    if function is None:
+      function = fields[funcdef] = functions.function_fields(funcdef)
+    sites.append(site.Site(node.coord.file, "buffer_read", node.coord.line, line, name, node.coord.column, *function))
+
+  if calls is not None:
+    sites.extend(call_file_sites(ast, renderer, calls.reads, "buffer_read",
+                                 select))
+  return sites
+
+def call_file_sites(ast, renderer, table, site_type, select=None):
+  '''Finds the call arguments a table of library call rules matches, in the
+  node index of the ast when the file was parsed with one, else with the
+  pycparser node visitor, and builds a site for each of them. The site info
+  is the rendered argument.
+
+  Args:
+    ast (tuple): (filename, source, AST, NodeIndex) as returned by parse_file
+    renderer (ValueRenderer): Renders the site info
+    table (dict): CallRules.writes or CallRules.reads
+    site_type (string): Type of the sites
+    select (optional[function]): Tells whether the sites of a function are
+      extracted from its name, see functions.name_matcher
+
+  Returns:
+    sites (list): Contains the call sites of the file
+  '''
+  if ast[3] is not None:
+    found_calls, nodes = call_rules.find_nodes(ast[3], table)
+    node_functions = functions.enclosing_functions(ast[3], found_calls)
+    nodes = list(zip(found_calls, nodes))
+    if select is not None:
+      nodes, node_functions = functions.keep_selected(nodes, node_functions,
+                                                      select)
+  else:
+    call_visitor = call_rules.CallVisitor(table)
+    if select is None:
+      call_visitor.visit(ast[2])
+    else:
+      for funcdef in functions.selected_functions(ast[2], select):
+        call_visitor.visit(funcdef)
+    nodes = list(zip(call_visitor.calls, call_visitor.nodes))
+    node_functions = call_visitor.functions
+  sourceText = ast[1].split('\n')
+  fields = {}
+  sites = []
+  for (call, node), funcdef in zip(nodes, node_functions):
+    # a few argument nodes have no coordinates, the call always has
+    coord = node.coord if node.coord is not None else call.coord
+    line = sourceText[coord.line-1].strip()
+    function = fields.get(funcdef)
+    if function is None:
+      function = fields[funcdef] = functions.function_fields(funcdef)
+    sites.append(site.Site(coord.file, site_type, coord.line, line, renderer.render(node), coord.column, *function))
+
+  return sites
+
+def rule_file_sites(ast, rules, renderer, site_types='all', select=None):
+  '''Finds the nodes a set of site rules matches in one pass, over the node
+  index of the ast when the file was parsed with one, else in one walk of the
+  tree, and builds a site for each of them. The sites get the fields of their
+  enclosing function, see icse.functions.
+
+  Args:
+    ast (tuple): (filename, source, AST, NodeIndex) as returned by parse_file
+    rules (RuleSet): The site rules, see icse.rules
+    renderer (ValueRenderer): Renders the site info
+    site_types (optional[string]): Site type to extract, 'all' for every
+      site type of rules
+    select (optional[function]): Tells whether the sites of a function are
+      extracted from its name, see functions.name_matcher
+
+  Returns:
+    sites (list): Contains the sites of each site type, in the order of the
+      site types of rules
+  '''
+  if ast[3] is not None:
+    found = rules.find_nodes(ast[3], site_types)
+    node_functions = functions.enclosing_functions(ast[3],
+                                                   [f[1] for f in found])
+    if select is not None:
+      found, node_functions = functions.keep_selected(found, node_functions,
+                                                      select)
+  else:
+    if select is None:
+      roots = [ast[2]]
+    else:
+      roots = functions.selected_functions(ast[2], select)
+    found, node_functions = rules.walk(roots, site_types)
+  sourceText = ast[1].split('\n')
+  fields = {}
+  sites = []
+  for (site_type, node, coord, info), funcdef in zip(found, node_functions):
+    line = sourceText[coord.line-1].strip()
+    function = fields.get(funcdef)
+    if function is None:
+      function = fields[funcdef] = functions.function_fields(funcdef)
+    if isinstance(info, c_ast.Node):
+      info = renderer.render(info)
+    sites.append(site.Site(coord.file, site_type, coord.line, line, info, coord.column, *function))
+
+  return sites
+
+def file_sites(ast, site_types, renderer, memo=None, select=None, calls=None,
+               rules=None):
+  '''Extracts the requested site types from one parsed file.
+
+  Args:
+    ast (tuple): (filename, source, AST, NodeIndex) as returned by parse_file
+    site_types (string): Type of site(s) to extract
+    renderer (ValueRenderer): Renders the site info
+    memo (optional[BodyMemo]): Memoized rule results of function bodies
+    select (optional[function]): Tells whether the sites of a function are
+      extracted from its name, None for all the sites of the file
+    calls (optional[CallRules]): Library call rules, None for no call sites
+    rules (optional[RuleSet]): Site rules run instead of the built-in ones,
+      the memo is not used with them
+
+  Returns:
+    tuple: (buffer_write_sites, buffer_read_sites), with rules the sites of
+      the site types other than buffer_write are in the second list
+
+  Raises:
+    ExtractionError: When a site rule fails on the AST
+  '''
+  writes = []
+  reads = []
+  try:
+    if rules is not None:
+      for s in rule_file_sites(ast, rules, renderer, site_types, select):
+        if s.site_type == site_rules.WRITE_KIND:
+          writes.append(s)
+        else:
+          reads.append(s)
+      if calls is not None:
+        if(site_types == 'buffer_write' or site_types == 'all'):
+          writes += call_file_sites(ast, renderer, calls.writes,
+                                    "buffer_write", select)
+        if(site_types == 'buffer_read' or site_types == 'all'):
+          reads += call_file_sites(ast, renderer, calls.reads, "buffer_read",
+                                   select)
+    else:
+      if(site_types == 'buffer_write' or site_types == 'all'):
+        writes = buffer_write_file_sites(ast, renderer, memo, select, calls)
+      if(site_types == 'buffer_read' or site_types == 'all'):
+        reads = buffer_read_file_sites(ast, renderer, memo, select, calls)
+  except Exception as e:
+    raise ExtractionError(ast[0], 'sites', e)
+  return (writes, reads)
+
 class Extractor:
   """Class to extract sites from C source code 
 
   Attributes:
     root_path (string): Path to file or directory with C source files
     parse_single_cwe (string): Type of site(s) to extract
-    files (list): All files in root_path
+    jobs (int): Number of worker processes, 1 runs the threaded pipeline
+    profile (CostProfile): Per-file timings used to schedule the files
+    timeout (float): Wall-clock limit in seconds for each file
+    memory_limit (int): Address space limit in bytes of each worker
+    retry (bool): True to retry failed files with doubled limits
+    journal (Journal): Journal of the finished files, None for no journal
+    shard (tuple): (index, count) of the part of the corpus to process, None
+      for the whole corpus
+    serve (tuple): (host, port) to hand the files out to remote workers on,
+      None to process them locally
+    authkey (string): Shared key of the remote workers
+    unchanged (function): Tells whether the sites of a file are already up to
+      date, None to process every file
+    sink (Sink): Output the sites of each file are sent to once the file is
+      finished, None for no output
+    prune (bool): True to drop the unused header declarations before parsing
+    compact (bool): True to compact the blank lines and line markers of the
+      preprocessed text before parsing
+    memo (BodyMemo): Memoized site rule results of the function bodies, None
+      to run the rules over every file
+    function_patterns (list): Name patterns of the functions whose sites are
+      extracted, None for all the sites, see icse.functions
+    select (function): Matcher of function_patterns, None without patterns
+    calls (CallRules): Library call rules whose arguments are sites too, None
+      for no call sites, see icse.calls
+    rules (RuleSet): Site rules run instead of the built-in ones, None for
+      the built-in ones, see icse.rules
+    files (list): Files in root_path that are not finished yet
+    finished (list): Files whose sites were extracted, by this run or by the
+      run the journal resumes
     ast_queue (Queue): Holds tuples (filename, source_code, AST) of each file
       in root_path
     ast_queue_done (bool): True when ast_queue is filled with all ASTs from 
       files in root_path
-    ast_buffer_writes (Queue): Holds tuples (node, source_line) for buffer_writes
-    ast_buffer_reads (Queue): Holds tuples (node, source_line) for buffer_reads
+    ast_buffer_writes (Queue): Holds the buffer write Sites of the finished
+      files
+    ast_buffer_reads (Queue): Holds the buffer read Sites of the finished
+      files
     parser (CParser): CParser for parsing files and generating AST
+    renderer (ValueRenderer): Renders the info of the buffer write sites
+    read_renderer (ValueRenderer): Renders the info of the buffer read sites,
+      the reads are extracted on their own thread
+    stats (dict): Makespan and idle time of the last parallel run, and
+      the counters of the function body memo under 'memo' when it is used
+    failures (list): Failure of each file that could not be processed
   """
 
-  def __init__(self, root_path, parse_single_cwe=None):
+  def __init__(self, root_path, parse_single_cwe=None, jobs=1, profile=None,
+               timeout=None, memory_limit=None, retry=False, journal=None,
+               shard=None, serve=None, authkey=coordinator.AUTHKEY,
+               unchanged=None, sink=None, prune=False, compact=False,
+               memo=False, function_patterns=None, calls=None, rules=None):
     """This constructor method prepares all the data structures to receive
       the Synthetic Trees informations from pycparser.
 
       Args:
         root_path (string): File or directory with C source code
         parse_single_cwe (optional[string]): Types of sites to extract
+        jobs (optional[int]): Number of worker processes
+        profile (optional[CostProfile]): Timings of previous runs, updated
+          with the timings of this run
+        timeout (optional[float]): Seconds after which a file is killed
+        memory_limit (optional[int]): Bytes a worker may allocate
+        retry (optional[bool]): Retry failed files with doubled limits
+        journal (optional[Journal]): Journal the finished files are appended
+          to. Files finished by the run it resumes are not processed again.
+        shard (optional[tuple]): (index, count), index counting from 0, to
+          only process one shard of the corpus, see icse.shard
+        serve (optional[tuple]): (host, port) of the coordinator that hands
+          the files out to remote workers, see icse.coordinator
+        authkey (optional[string]): Shared key of the remote workers
+        unchanged (optional[function]): Called with each file path, files
+          for which it returns True are not processed, see icse.store
+        sink (optional[Sink]): Output of the sites, see icse.sinks
+        prune (optional[bool]): Drop the header declarations each file does
+          not need before parsing it, see icse.prune
+        compact (optional[bool]): Compact the blank lines and line markers
+          of each preprocessed file, see icse.compact
+        memo (optional[bool]): Memoize the site rule results of function
+          bodies across files, see icse.memo
+        function_patterns (optional[list]): Only extract the sites of the
+          functions whose name matches one of these patterns, the rules
+          skip the other functions, see icse.functions
+        calls (optional[CallRules]): Library call rules, the arguments the
+          calls write and read are sites too, see icse.calls
+        rules (optional[RuleSet]): Site rules run instead of the built-in
+          ones, in one pass over each file, see icse.rules. parse_single_cwe
+          is then 'all' or one of their site types.
+
+      Notes: timeout, memory_limit and retry need worker processes, setting
+        any of them runs the parallel engine even with a single job.
 
       Returns:
         None
     """
     self.root_path = root_path
     self.parse_single_cwe = parse_single_cwe
+    self.jobs = jobs
+    self.profile = profile
+    self.timeout = timeout
+    self.memory_limit = memory_limit
+    self.retry = retry
+    self.journal = journal
+    self.shard = shard
+    self.serve = serve
+    self.authkey = authkey
+    self.unchanged = unchanged
+    self.sink = sink
+    self.prune = prune
+    self.compact = compact
+    self.memo = memo_pass.BodyMemo() if memo else None
+    self.function_patterns = function_patterns
+    self.select = None
+    if function_patterns:
+      self.select = functions.name_matcher(function_patterns)
+    self.calls = calls
+    self.rules = rules
     self.files = []
+    self.finished = []
     self.set_files_list()
     self.ast_queue = queue.Queue()
     self.ast_queue_done = False
     self.ast_buffer_writes = queue.Queue()
     self.ast_buffer_reads = queue.Queue()
-    self.parser = CParser()
-    self.generator = c_generator.CGenerator()
-    self.extract()
+    self.parser = CParser(index_nodes=True, scanner='fast', lr_parser='fast')
+    self.renderer = render.ValueRenderer()
+    self.read_renderer = render.ValueRenderer()
+    self.stats = {}
+    self.failures = []
+    if self.journal is not None:
+      self.resume()
+    try:
+      if self.jobs > 1 or timeout or memory_limit or retry or serve:
+        self.extract_parallel()
+      else:
+        self.extract()
+        if self.memo is not None:
+          self.stats['memo'] = self.memo.stats()
+    finally:
+      if self.journal is not None:
+        self.journal.flush()
+
+  def resume(self):
+    """Restores the sites and failures of the files finished by the run the
+    journal resumes, and removes these files from self.files. They are sent
+    to the sink again.
+
+    Args:
+      None
+
+    Returns:
+      None
+    """
+    finished = set()
+    for entry in self.journal.entries:
+      finished.add(entry.filename)
+      if entry.failure is not None:
+        self.failures.append(entry.failure)
+        if self.sink is not None:
+          self.sink.write_failure(entry.failure)
+        continue
+      self.finished.append(entry.filename)
+      for buffer_write_site in entry.writes:
+        self.ast_buffer_writes.put(buffer_write_site)
+      for buffer_read_site in entry.reads:
+        self.ast_buffer_reads.put(buffer_read_site)
+      if self.sink is not None:
+        self.sink.write_file(entry.filename, entry.writes, entry.reads)
+    if finished:
+      print("resuming, %d file(s) already finished" % len(finished))
+    self.files = [f for f in self.files if f not in finished]
+
+  def file_done(self, filename, writes, reads):
+    """Queues the sites of a finished file, sends them to the sink and
+    appends the file to the journal.
+
+    Args:
+      filename (string): Path of the file
+      writes (list): Buffer write Sites of the file
+      reads (list): Buffer read Sites of the file
+
+    Returns:
+      None
+    """
+    for buffer_write_site in writes:
+      self.ast_buffer_writes.put(buffer_write_site)
+    for buffer_read_site in reads:
+      self.ast_buffer_reads.put(buffer_read_site)
+    self.finished.append(filename)
+    if self.sink is not None:
+      self.sink.write_file(filename, writes, reads)
+    if self.journal is not None:
+      self.journal.record(filename, writes, reads)
+
+  def file_failed(self, failure):
+    """Records a failed file, sends it to the sink and appends it to the
+    journal.
+
+    Args:
+      failure (Failure): The failure of the file
+
+    Returns:
+      None
+    """
+    self.failures.append(failure)
+    if self.sink is not None:
+      self.sink.write_failure(failure)
+    if self.journal is not None:
+      self.journal.record_failure(failure)
 
   def extract(self):
     """Trigger the threads to generate the ATSs and navigate through them.
@@ -132,9 +655,43 @@ class Extractor:
     extract_th.join()
     populate_th.join()
 
+  def extract_parallel(self):
+    """Runs the whole pipeline of each file in worker processes, local ones
+    or remote ones when self.serve is set. Files are dispatched largest
+    first, see icse.schedule.
+
+    Args:
+      None
+
+    Returns:
+      None
+    """
+    if self.serve:
+      pool = coordinator.Coordinator(self.parse_single_cwe, self.serve,
+                                     self.authkey, self.profile,
+                                     timeout=self.timeout, prune=self.prune,
+                                     compact=self.compact,
+                                     memo=self.memo is not None,
+                                     function_patterns=self.function_patterns,
+                                     calls=self.calls, rules=self.rules)
+    else:
+      pool = engine.Engine(self.parse_single_cwe, self.jobs, self.profile,
+                           timeout=self.timeout,
+                           memory_limit=self.memory_limit, retry=self.retry,
+                           prune=self.prune, compact=self.compact,
+                           memo=self.memo is not None,
+                           function_patterns=self.function_patterns,
+                           calls=self.calls, rules=self.rules)
+    for result in pool.run(self.files):
+      self.file_done(result.filename, result.writes, result.reads)
+    self.stats = pool.stats
+    for failure in pool.failures:
+      self.file_failed(failure)
+
   def set_files_list(self):
     """Navigates through the filepath tree and appends all C files in the files
-    list.
+    list. Only the files of self.shard are kept when it is set, and the
+    files that self.unchanged reports are skipped.
 
     Args:
       None
@@ -142,20 +699,17 @@ class Extractor:
     Returns:
       None
     """
-    if os.path.isfile( self.root_path ):
-      self.files.append( self.root_path )
-    else:
-      for root, dirnames, filenames in os.walk(self.root_path):
-        for filename in filenames:
-          if '.c' in filename[-2:]:
-            self.files.append( os.path.join( root, filename)  )
+    self.files += list_files(self.root_path)
+    if self.shard is not None:
+      self.files = shard.shard_files(self.files, *self.shard)
+    if self.unchanged is not None:
+      self.files = [f for f in self.files if not self.unchanged(f)]
 
   def buffer_write_sites(self):
     """Returns list of buffer write sites.
     Buffer write sites are stack and heap based buffer overflows and buffer underwrites.
-    This method goes through each node that was selected by populate_ast_buffer_writes
-    method. It grabs the proper information and creates a site that is added
-    to a list.
+    This method drains the sites that were built by populate_ast_buffer_writes
+    method.
 
     Args:
       None
@@ -165,30 +719,15 @@ class Extractor:
     """
     sites = []
     while(not self.ast_buffer_writes.empty()):
-      buffer_write = self.ast_buffer_writes.get()
-      node = buffer_write[0]
-      line = buffer_write[1]
-
-      gen_line = (self.generator).visit(node)
-
-      if(isinstance(node.lvalue, c_ast.ArrayRef)):
-        if(isinstance(node.lvalue.name, c_ast.ID)):
-          sites.append(site.Site(node.lvalue.coord.file, "buffer_write", node.lvalue.coord.line, line, self.generator.visit(node.lvalue.name)))
-        elif(isinstance(node.lvalue.name, c_ast.StructRef)):
-          sites.append(site.Site(node.lvalue.coord.file, "buffer_write", node.lvalue.coord.line, line, self.generator.visit(node.lvalue.name)))
-      elif(isinstance(node.lvalue, c_ast.UnaryOp)):
-        sites.append(site.Site(node.lvalue.coord.file, "buffer_write", node.lvalue.coord.line, line, self.generator.visit(node.lvalue.expr)))
-      else: 
-        sites.append(site.Site(node.lvalue.coord.file, "buffer_write", node.lvalue.coord.line, line, self.generator.visit(node.lvalue)))
+      sites.append(self.ast_buffer_writes.get())
 
     return sites
 
   def buffer_read_sites(self):
     """Returns list of buffer read sites.
     Buffer read sites are stack and heap based buffer overflows and buffer underreads.
-    This method goes through each node that was selected by populate_ast_buffer_reads
-    method. It grabs the proper information and creates a site that is added
-    to a list.
+    This method drains the sites that were built by populate_ast_buffer_reads
+    method.
 
     Args:
       None
@@ -198,25 +737,25 @@ class Extractor:
     """
     sites = []
     while(not self.ast_buffer_reads.empty()):
-      buffer_read = self.ast_buffer_reads.get()
-
-      node = buffer_read[0]
-      line = buffer_read[1]
-
-      gen_line = (self.generator).visit(node)
-
-      sites.append(site.Site(node.coord.file, "buffer_read", node.coord.line, line, node.name))
+      sites.append(self.ast_buffer_reads.get())
 
     return sites
 
   @staticmethod
-  def to_csv(sites, csv_output_path = r'sites_list.csv'):
+  def to_csv(sites, csv_output_path = r'sites_list.csv', by_function=False):
     """Prints a list of sites to an csv file.
-       FileName, Site Type, Line Number, Info
+       FileName, Site Type, Line Number, Info, Function, Function Start,
+       Function End, Function Kind
+
+    Notes: Files are listed in (basename, path) order so the output does not
+      depend on the order the files were processed in, see icse.shard. The
+      output is compressed when its name ends with .gz, .bz2 or .xz.
     
     Args:
       sites (list): Contains Sites that will be written to file
       csv_output_path (optional[string]): Output filename
+      by_function (optional[bool]): List the sites of each file grouped by
+        enclosing function, see functions.group_sites
 
     Returns:
       None
@@ -225,26 +764,54 @@ class Extractor:
     for site in sites:
       files = files.union(set([site.filename]))
 
-    f = open(csv_output_path, 'w')
+    f = compress.open_file(csv_output_path, 'w')
 
-    f.write(str('filename, type, line, value' + '\n\n'))
+    f.write(str(CSV_HEADER + '\n\n'))
 
-    for filename in files:
-      for site in sites:
-        if(site.filename == filename):
-          f.write(str(os.path.basename(filename)) + ', ' + str(site.site_type) + ', '
-                      + 'line ' + str(site.line) + ', ' + str(site.info) + '\n')
-          #            + ', ' + str(site.code) + '\n')
+    for filename in sorted(files, key=lambda f: (os.path.basename(f), f)):
+      listed = [site for site in sites if site.filename == filename]
+      if by_function:
+        listed = functions.group_sites(listed)
+      for site in listed:
+        f.write(str(os.path.basename(filename)) + ', ' + str(site.site_type) + ', '
+                    + 'line ' + str(site.line) + ', ' + str(site.info) + ', '
+                    + str(site.function) + ', ' + str(site.function_start) + ', '
+                    + str(site.function_end) + ', ' + str(site.function_kind) + '\n')
+        #            + ', ' + str(site.code) + '\n')
       f.write('\n')
 
     f.close()
 
+  @staticmethod
+  def failures_to_csv(failures, csv_output_path = r'failures.csv'):
+    """Prints a list of failures to an csv file.
+       FileName, Stage, Elapsed, Error
+
+    Args:
+      failures (list): Contains Failures that will be written to file
+      csv_output_path (optional[string]): Output filename
+
+    Returns:
+      None
+    """
+    f = compress.open_file(csv_output_path, 'w')
+
+    f.write(str('filename, stage, elapsed, error' + '\n\n'))
+
+    for failure in failures:
+      f.write(str(failure.filename) + ', ' + str(failure.stage) + ', '
+                  + '%.3f' % failure.elapsed + ', '
+                  + ' '.join(str(failure.error).split()) + '\n')
+
+    f.close()
+
   def extract_ast(self):
     """Fills ast_queue with one AST for each file in the filepath. Calls
     parse_file method.
     
-    Notes: Changes self.ast_queue_done to True when it has finished parsing
-      all files.
+    Notes: Changes self.ast_queue_done to True and puts None in ast_queue
+      when it has finished parsing all files. Files that fail are added to
+      self.failures and skipped.
 
     Args:
       None
@@ -253,19 +820,27 @@ class Extractor:
       None
     """
     print("STARTED extract_ast thread")
-    for file_path in self.files:
-      ast = parse_file(file_path, use_cpp=True,
-        cpp_path=CPPPATH,
-        # removed cpp_arg r'-D_WIN32' 
-        # r'-rquoteutils/testcasesupport' needed for #include "std_testcase.h"
-        #     may fix by moving location of std_testcase.h
-        cpp_args=[r'-Iutils/fake_libc_include', r'-iquoteutils/testcasesupport'],
-        #cpp_args=[r'-Iutils/fake_libc_include', r'-iquoteutils/testcasesupport', r'-D_WIN32'],
-        parser=self.parser
-        )
-      self.ast_queue.put(ast)
-
-    self.ast_queue_done = True
+    try:
+      for file_path in self.files:
+        start = time.time()
+        try:
+          ast = parse_file(file_path, use_cpp=True,
+            cpp_path=CPPPATH,
+            cpp_args=CPPARGS,
+            parser=self.parser,
+            prune=self.prune,
+            compact=self.compact
+            )
+        except ExtractionError as e:
+          ast = None
+          self.file_failed(e.failure(time.time() - start))
+        if self.profile is not None:
+          self.profile.record(file_path, time.time() - start)
+        if ast is not None:
+          self.ast_queue.put(ast)
+    finally:
+      self.ast_queue_done = True
+      self.ast_queue.put(None)
 
   def populate_ast_attributes(self):
     """Calls all the methods to populate each AST list for each site type.
@@ -278,21 +853,28 @@ class Extractor:
       None
     """
     print("STARTED populate_ast_attributes thread")
-    while(not (self.ast_queue.empty() and self.ast_queue_done)):
+    while(True):
       ast = self.ast_queue.get()
       self.ast_queue.task_done()
-      
+      if ast is None:
+        break
+
       threads = []
+      results = {}
 
-      if(self.parse_single_cwe == 'buffer_write' 
+      if self.rules is not None:
+        threads.append( threading.Thread(None,
+          target=self.populate_ast_rules, args=(ast, results)) )
+
+      elif(self.parse_single_cwe == 'buffer_write' 
         or self.parse_single_cwe == 'all'):
         threads.append( threading.Thread(None, 
-          target=self.populate_ast_buffer_writes, args=(ast,)) )
+          target=self.populate_ast_buffer_writes, args=(ast, results)) )
       
-      if(self.parse_single_cwe == 'buffer_read' 
-        or self.parse_single_cwe == 'all'):
+      if(self.rules is None and (self.parse_single_cwe == 'buffer_read'
+        or self.parse_single_cwe == 'all')):
         threads.append( threading.Thread(None, 
-          target=self.populate_ast_buffer_reads, args=(ast,)) )
+          target=self.populate_ast_buffer_reads, args=(ast, results)) )
 
       for thread in threads:
         thread.start()
@@ -300,38 +882,72 @@ class Extractor:
       for thread in threads:
         thread.join()
 
-  def populate_ast_buffer_writes(self, ast):
-    """Calls pycparser node visitor in the ast. puts the buffer write
-    nodes in the ast_buffer_writes queue.
+      if 'failure' in results:
+        self.file_failed(results['failure'])
+      else:
+        self.file_done(ast[0], results.get('buffer_write', []),
+                       results.get('buffer_read', []))
 
-    Notes: Adds tuple (node, source_line) to self.ast_buffer_writes
+  def populate_ast_buffer_writes(self, ast, results):
+    """Calls pycparser node visitor in the ast. Builds the buffer write
+    sites of the file.
+
+    Notes: Sets results['buffer_write'] to the list of Sites, or
+      results['failure'] when the visitor fails
 
     Args:
       ast (c_ast): AST with source to be searched for sites
+      results (dict): Results of the file
 
     Return:
       None
     """
-    buffer_write_visitor = buffer_write.BufferWriteVisitor()
-    buffer_write_visitor.visit(ast[2])
-    sourceText = ast[1].split('\n')
-    for node in buffer_write_visitor.nodes:
-      self.ast_buffer_writes.put((node, sourceText[node.coord.line-1].strip()))
+    try:
+      results['buffer_write'] = buffer_write_file_sites(ast, self.renderer,
+                                                        self.memo, self.select,
+                                                        self.calls)
+    except Exception as e:
+      results['failure'] = ExtractionError(ast[0], 'sites', e).failure(0.0)
 
-  def populate_ast_buffer_reads(self, ast):
-    """Calls pycparser node visitor in the ast. puts the buffer reads
-    nodes in the ast_buffer_reads queue.
+  def populate_ast_buffer_reads(self, ast, results):
+    """Calls pycparser node visitor in the ast. Builds the buffer read
+    sites of the file.
 
-    Notes: Adds tuple (node, source_line) to self.ast_buffer_reads
+    Notes: Sets results['buffer_read'] to the list of Sites, or
+      results['failure'] when the visitor fails
 
     Args:
       ast (c_ast): AST with source to be searched for sites
+      results (dict): Results of the file
 
     Return:
       None
     """
-    buffer_read_visitor = buffer_read.BufferReadVisitor()
-    buffer_read_visitor.visit(ast[2])
-    sourceText = ast[1].split('\n')
-    for node in buffer_read_visitor.nodes:
-      self.ast_buffer_reads.put((node, sourceText[node.coord.line-1].strip()))
+    try:
+      results['buffer_read'] = buffer_read_file_sites(ast, self.read_renderer,
+                                                      self.memo, self.select,
+                                                      self.calls)
+    except Exception as e:
+      results['failure'] = ExtractionError(ast[0], 'sites', e).failure(0.0)
+
+  def populate_ast_rules(self, ast, results):
+    """Runs the site rules of self.rules in the ast. Builds the sites of
+    every site type of the file in one pass.
+
+    Notes: Sets results['buffer_write'] to the buffer write Sites and
+      results['buffer_read'] to the Sites of the other site types, or
+      results['failure'] when the rules fail
+
+    Args:
+      ast (c_ast): AST with source to be searched for sites
+      results (dict): Results of the file
+
+    Return:
+      None
+    """
+    try:
+      results['buffer_write'], results['buffer_read'] = file_sites(
+        ast, self.parse_single_cwe, self.renderer, None, self.select,
+        self.calls, self.rules)
+    except ExtractionError as e:
+      results['failure'] = e.failure(0.0)
@@ -0,0 +1,400 @@
+"""Flat, array backed representation of a pycparser AST.
+
+A FlatAST holds the nodes of a tree in preorder, one column per field, in
+typed arrays instead of one Python object per node, Coord and attribute:
+
+  kinds    uint8   node class, index in KINDS
+  parents  int32   position of the parent, -1 for the root
+  ends     uint32  position just past the node's subtree, the children of
+                   node i start at i + 1 and each one ends where the next
+                   one starts
+  fields   uint32  string id of the child attribute the node is in
+  lines    int32   coord line, -1 when there is none
+  columns  int32   coord column, -1 when there is none
+  files    uint32  string id of the coord file
+  attrs    uint32  string ids of the attributes of each node, in the order
+                   of its class' attr_names, from attr_starts
+
+Strings are interned in strings, NO_STRING stands for None. List attributes
+(quals, names, storage) are stored joined with spaces. The end_coord line of
+each Compound is kept in end_lines.
+
+Positions of one kind are found with bytes.find over the kind column, the
+site rules then only look at these positions and their neighbours. Nodes
+shared by several declarators are stored once per declarator, as a
+NodeVisitor visits them.
+"""
+
+import sys
+import array
+
+from pycparser import c_ast
+from icse import site
+from icse import functions
+from icse import extractor
+from icse import buffer_write
+from icse import buffer_read
+
+NO_STRING = 0xffffffff
+
+KINDS = sorted(name for name, klass in vars(c_ast).items()
+               if isinstance(klass, type) and issubclass(klass, c_ast.Node)
+               and klass is not c_ast.Node)
+KIND_CODES = dict((name, code) for code, name in enumerate(KINDS))
+
+#Position of each attribute in the attrs of a node, by kind
+ATTR_INDEX = [dict((attr, i) for i, attr in
+                   enumerate(getattr(c_ast, name).attr_names))
+              for name in KINDS]
+
+COMPOUND = KIND_CODES['Compound']
+FUNC_DEF = KIND_CODES['FuncDef']
+
+#Nodes that are never parenthesized when they are an operand, see CGenerator
+SIMPLE_KINDS = frozenset(KIND_CODES[name] for name in
+                         ['Constant', 'ID', 'ArrayRef', 'StructRef', 'FuncCall'])
+
+def _text(value):
+  '''Returns an attribute as stored, lists are joined with spaces.'''
+  if value is None or isinstance(value, str):
+    return value
+  return ' '.join(value)
+
+class FlatAST:
+  """Columnar AST, see the module documentation.
+
+  Attributes:
+    strings (list): Interned strings, by id
+    kinds, parents, ends, fields, lines, columns, files, attr_starts,
+    attrs (array): Columns of the nodes
+    end_lines (dict): Line of the closing brace of each Compound position
+  """
+
+  def __init__(self, tree):
+    """Converts a pycparser AST.
+
+    Args:
+      tree (c_ast.Node): Root of the AST
+
+    Returns:
+      None
+    """
+    self.strings = []
+    self.string_ids = {}
+    self.kinds = array.array('B')
+    self.parents = array.array('i')
+    self.ends = array.array('I')
+    self.fields = array.array('I')
+    self.lines = array.array('i')
+    self.columns = array.array('i')
+    self.files = array.array('I')
+    self.attr_starts = array.array('I')
+    self.attrs = array.array('I')
+    self.end_lines = {}
+    self._convert(tree)
+    self.kind_bytes = self.kinds.tobytes()
+
+  def intern(self, value):
+    """Returns the id of a string, NO_STRING for None."""
+    if value is None:
+      return NO_STRING
+    string_id = self.string_ids.get(value)
+    if string_id is None:
+      string_id = self.string_ids[value] = len(self.strings)
+      self.strings.append(value)
+    return string_id
+
+  def _convert(self, tree):
+    """Appends the nodes of tree in preorder."""
+    intern = self.intern
+    stack = [(tree, -1, NO_STRING)]
+    while stack:
+      node, parent, field = stack.pop()
+      if node is None:
+        # end of the subtree of parent
+        self.ends[parent] = len(self.kinds)
+        continue
+      position = len(self.kinds)
+      kind = KIND_CODES[type(node).__name__]
+      self.kinds.append(kind)
+      self.parents.append(parent)
+      self.ends.append(0)
+      self.fields.append(field)
+      coord = node.coord
+      if coord is None:
+        self.lines.append(-1)
+        self.columns.append(-1)
+        self.files.append(NO_STRING)
+      else:
+        self.lines.append(-1 if coord.line is None else coord.line)
+        self.columns.append(-1 if coord.column is None else coord.column)
+        self.files.append(intern(coord.file))
+      if kind == COMPOUND and node.end_coord is not None:
+        self.end_lines[position] = node.end_coord.line
+      self.attr_starts.append(len(self.attrs))
+      for attr in node.attr_names:
+        self.attrs.append(intern(_text(getattr(node, attr))))
+      stack.append((None, position, NO_STRING))
+      for name, child in reversed(node.children()):
+        stack.append((child, position, intern(name.split('[', 1)[0])))
+
+  def __len__(self):
+    return len(self.kinds)
+
+  def nbytes(self):
+    """Returns the memory used by the columns and the strings, in bytes."""
+    size = sum(sys.getsizeof(s) for s in self.strings)
+    for column in [self.kinds, self.parents, self.ends, self.fields,
+                   self.lines, self.columns, self.files, self.attr_starts,
+                   self.attrs]:
+      size += column.itemsize * len(column)
+    return size + sys.getsizeof(self.end_lines)
+
+  def positions(self, kind):
+    """Returns the positions of the nodes of a kind, in preorder.
+
+    Args:
+      kind (string): c_ast class name
+
+    Returns:
+      list: Node positions
+    """
+    code = bytes([KIND_CODES[kind]])
+    data = self.kind_bytes
+    found = []
+    i = data.find(code)
+    while i >= 0:
+      found.append(i)
+      i = data.find(code, i + 1)
+    return found
+
+  def kind(self, i):
+    """Returns the c_ast class name of node i."""
+    return KINDS[self.kinds[i]]
+
+  def is_kind(self, i, kind):
+    """Tells whether node i is of a kind, False for no node (-1)."""
+    return i >= 0 and self.kinds[i] == KIND_CODES[kind]
+
+  def attr(self, i, name):
+    """Returns an attribute of node i, see c_ast attr_names."""
+    string_id = self.attrs[self.attr_starts[i] + ATTR_INDEX[self.kinds[i]][name]]
+    return None if string_id == NO_STRING else self.strings[string_id]
+
+  def filename(self, i):
+    """Returns the coord file of node i."""
+    string_id = self.files[i]
+    return None if string_id == NO_STRING else self.strings[string_id]
+
+  def line(self, i):
+    """Returns the coord line of node i, None when there is none."""
+    return None if self.lines[i] < 0 else self.lines[i]
+
+  def column(self, i):
+    """Returns the coord column of node i, None when there is none."""
+    return None if self.columns[i] < 0 else self.columns[i]
+
+  def function_fields(self, i):
+    """Returns the site fields of the function node i is in, see
+    icse.functions.function_fields."""
+    while i >= 0 and self.kinds[i] != FUNC_DEF:
+      i = self.parents[i]
+    if i < 0:
+      return functions.NO_FUNCTION
+    name = self.attr(self.child(i, 'decl'), 'name')
+    return (name, self.line(i), self.end_lines.get(self.child(i, 'body')),
+            functions.classify(name))
+
+  def children(self, i):
+    """Returns the positions of the children of node i."""
+    found = []
+    child = i + 1
+    end = self.ends[i]
+    while child < end:
+      found.append(child)
+      child = self.ends[child]
+    return found
+
+  def child(self, i, field):
+    """Returns the position of the child of node i in a child attribute, -1
+    when there is none. For list attributes, returns the first item."""
+    field_id = self.string_ids.get(field)
+    child = i + 1
+    end = self.ends[i]
+    while child < end:
+      if self.fields[child] == field_id:
+        return child
+      child = self.ends[child]
+    return -1
+
+  def render(self, i):
+    """Renders the expression of node i as CGenerator does.
+
+    Args:
+      i (int): Node position
+
+    Returns:
+      string: C code
+
+    Raises:
+      ValueError: When the expression holds a declaration or statement
+    """
+    kind = KINDS[self.kinds[i]]
+    if kind == 'Constant':
+      return self.attr(i, 'value')
+    elif kind == 'ID':
+      return self.attr(i, 'name')
+    elif kind == 'ArrayRef':
+      return (self._operand(self.child(i, 'name')) + '['
+              + self.render(self.child(i, 'subscript')) + ']')
+    elif kind == 'StructRef':
+      return (self._operand(self.child(i, 'name')) + self.attr(i, 'type')
+              + self.render(self.child(i, 'field')))
+    elif kind == 'FuncCall':
+      args = self.child(i, 'args')
+      return (self._operand(self.child(i, 'name')) + '('
+              + (self.render(args) if args >= 0 else '') + ')')
+    elif kind == 'UnaryOp':
+      op = self.attr(i, 'op')
+      expr = self.child(i, 'expr')
+      if op == 'sizeof':
+        return 'sizeof(%s)' % self.render(expr)
+      operand = self._operand(expr)
+      if op == 'p++':
+        return '%s++' % operand
+      elif op == 'p--':
+        return '%s--' % operand
+      return '%s%s' % (op, operand)
+    elif kind == 'BinaryOp':
+      return '%s %s %s' % (self._operand(self.child(i, 'left')),
+                           self.attr(i, 'op'),
+                           self._operand(self.child(i, 'right')))
+    elif kind == 'Assignment':
+      rvalue = self.child(i, 'rvalue')
+      rvalue_str = self._expr(rvalue)
+      if self.is_kind(rvalue, 'Assignment'):
+        rvalue_str = '(' + rvalue_str + ')'
+      return '%s %s %s' % (self.render(self.child(i, 'lvalue')),
+                           self.attr(i, 'op'), rvalue_str)
+    elif kind == 'Cast':
+      return ('(' + self._type(self.child(i, 'to_type'), []) + ') '
+              + self._operand(self.child(i, 'expr')))
+    elif kind in ('ExprList', 'InitList'):
+      return ', '.join(self._expr(c) for c in self.children(i))
+    elif kind == 'TernaryOp':
+      return (self._expr(self.child(i, 'cond')) + ' ? '
+              + self._expr(self.child(i, 'iftrue')) + ' : '
+              + self._expr(self.child(i, 'iffalse')))
+    elif kind == 'Typename':
+      return self._type(self.child(i, 'type'), [])
+    raise ValueError("cannot render a %s node" % kind)
+
+  def _expr(self, i):
+    """Renders a sub-expression, as CGenerator._visit_expr."""
+    if self.is_kind(i, 'InitList'):
+      return '{' + self.render(i) + '}'
+    elif self.is_kind(i, 'ExprList'):
+      return '(' + self.render(i) + ')'
+    return self.render(i)
+
+  def _operand(self, i):
+    """Renders an operand, parenthesized unless it is simple."""
+    s = self._expr(i)
+    if self.kinds[i] not in SIMPLE_KINDS:
+      return '(' + s + ')'
+    return s
+
+  def _type(self, i, modifiers):
+    """Renders a type, as CGenerator._generate_type."""
+    kind = KINDS[self.kinds[i]]
+    if kind == 'TypeDecl':
+      s = ''
+      quals = self.attr(i, 'quals')
+      if quals:
+        s += quals + ' '
+      base = self.child(i, 'type')
+      base_kind = KINDS[self.kinds[base]]
+      if base_kind == 'IdentifierType':
+        s += self.attr(base, 'names')
+      elif base_kind in ('Struct', 'Union', 'Enum') and base + 1 == self.ends[base]:
+        s += base_kind.lower() + ' ' + (self.attr(base, 'name') or '')
+      else:
+        raise ValueError("cannot render a %s type" % base_kind)
+      nstr = self.attr(i, 'declname') or ''
+      for n, modifier in enumerate(modifiers):
+        modifier_kind = KINDS[self.kinds[modifier]]
+        follows_ptr = n != 0 and self.is_kind(modifiers[n - 1], 'PtrDecl')
+        if modifier_kind == 'ArrayDecl':
+          if follows_ptr:
+            nstr = '(' + nstr + ')'
+          dim = self.child(modifier, 'dim')
+          nstr += '[' + (self.render(dim) if dim >= 0 else '') + ']'
+        elif modifier_kind == 'PtrDecl':
+          quals = self.attr(modifier, 'quals')
+          if quals:
+            nstr = '* %s %s' % (quals, nstr)
+          else:
+            nstr = '*' + nstr
+        else:
+          raise ValueError("cannot render a %s type" % modifier_kind)
+      if nstr:
+        s += ' ' + nstr
+      return s
+    elif kind == 'Typename':
+      return self._type(self.child(i, 'type'), modifiers)
+    elif kind == 'IdentifierType':
+      return self.attr(i, 'names') + ' '
+    elif kind in ('ArrayDecl', 'PtrDecl'):
+      return self._type(self.child(i, 'type'), modifiers + [i])
+    raise ValueError("cannot render a %s type" % kind)
+
+def file_sites(flat, filename, source, site_types):
+  '''Extracts the requested site types from a FlatAST, the Sites are the ones
+  extractor.file_sites builds from the object tree.
+
+  Args:
+    flat (FlatAST): The AST of the file
+    filename (string): Path of the file
+    source (string): Source of the file, for the code of the sites
+    site_types (string): Type of site(s) to extract
+
+  Returns:
+    tuple: (buffer_write_sites, buffer_read_sites)
+
+  Raises:
+    ExtractionError: When a site rule fails on the AST
+  '''
+  sourceText = source.split('\n')
+  writes = []
+  reads = []
+  try:
+    if(site_types == 'buffer_write' or site_types == 'all'):
+      for node in buffer_write.find_flat_nodes(flat):
+        lvalue = flat.child(node, 'lvalue')
+        line = sourceText[flat.lines[node]-1].strip()
+        if(flat.is_kind(lvalue, 'ArrayRef')):
+          name = flat.child(lvalue, 'name')
+          if(not(flat.is_kind(name, 'ID') or flat.is_kind(name, 'StructRef'))):
+            continue
+          info = flat.render(name)
+        else:
+          info = flat.render(flat.child(lvalue, 'expr'))
+        writes.append(site.Site(flat.filename(lvalue), "buffer_write",
+                                flat.line(lvalue), line, info,
+                                flat.column(lvalue),
+                                *flat.function_fields(node)))
+    if(site_types == 'buffer_read' or site_types == 'all'):
+      for node in buffer_read.find_flat_nodes(flat):
+        line = sourceText[flat.lines[node]-1].strip()
+        if(flat.is_kind(node, 'ID')):
+          info = flat.attr(node, 'name')
+        elif(flat.child(node, 'name') >= 0):
+          info = flat.render(flat.child(node, 'name'))
+        else:
+          continue
+        reads.append(site.Site(flat.filename(node), "buffer_read",
+                               flat.line(node), line, info, flat.column(node),
+                               *flat.function_fields(node)))
+  except Exception as e:
+    raise extractor.ExtractionError(filename, 'sites', e)
+  return (writes, reads)
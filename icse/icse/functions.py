@@ -0,0 +1,199 @@
+"""Enclosing functions of the sites.
+
+Every site records the FuncDef it is in: its name, the lines of its
+declarator and of the closing brace of its body, and its kind. Juliet test
+cases name their functions after the flow they exercise, so the kind is read
+from the last part of the name (after the last '_'):
+
+  bad     the flawed flow, 'CWE121_..._01_bad', '..._badSink', 'helperBad'
+  good    the fixed flows, 'goodG2B', 'goodB2G1', '..._goodG2BSink'
+  helper  anything else, 'main', 'printLine'
+
+Sites outside of any function (file scope initializers) have None for all of
+them.
+
+Extraction can be limited to the functions whose name matches patterns: glob
+patterns ('*_bad', 'goodG2B*') or regular expressions prefixed with 're:'
+('re:_(bad|goodG2B)$'). The visitors and the memo then skip the other
+FuncDefs and the file scope; the node index rules, which do not walk the
+tree, drop the nodes outside of the selected functions.
+"""
+
+import re
+import fnmatch
+
+from pycparser import c_ast
+
+#Kinds of the functions
+BAD = 'bad'
+GOOD = 'good'
+HELPER = 'helper'
+
+#Site fields of the functions, in Site order
+NO_FUNCTION = (None, None, None, None)
+
+#Prefix of the name patterns that are regular expressions
+REGEX_PREFIX = 're:'
+
+def classify(name):
+  '''Returns the kind of a function from its name.
+
+  Args:
+    name (string): Name of the function
+
+  Returns:
+    string: BAD, GOOD or HELPER
+  '''
+  part = name.rsplit('_', 1)[-1].lower()
+  if 'bad' in part:
+    return BAD
+  if 'good' in part:
+    return GOOD
+  return HELPER
+
+def function_fields(funcdef):
+  '''Returns the site fields of a function.
+
+  Args:
+    funcdef (c_ast.FuncDef): The function, None for no function
+
+  Returns:
+    tuple: (name, start line, end line, kind), NO_FUNCTION for None. The end
+      line is None when the parser did not record the closing brace.
+  '''
+  if funcdef is None:
+    return NO_FUNCTION
+  name = funcdef.decl.name
+  end_coord = funcdef.body.end_coord
+  return (name, funcdef.coord.line if funcdef.coord is not None else None,
+          end_coord.line if end_coord is not None else None, classify(name))
+
+def enclosing_functions(index, nodes):
+  '''Finds the FuncDef each node is in from the parent links of a NodeIndex.
+
+  Args:
+    index (NodeIndex): Node index of the parsed file
+    nodes (list): Nodes of the tree
+
+  Returns:
+    list: FuncDef of each node, None for the nodes outside of a function
+  '''
+  # the FuncDef of the nodes met while climbing, most sites share ancestors
+  found = {}
+  functions = []
+  for node in nodes:
+    path = []
+    while node is not None and node not in found:
+      if isinstance(node, c_ast.FuncDef):
+        found[node] = node
+        break
+      path.append(node)
+      node = index.parent(node)
+    funcdef = found.get(node)
+    for climbed in path:
+      found[climbed] = funcdef
+    functions.append(funcdef)
+  return functions
+
+def parse_patterns(text):
+  '''Parses a comma separated list of function name patterns.
+
+  Args:
+    text (string): 'PATTERN[,PATTERN...]'
+
+  Returns:
+    list: The patterns
+
+  Raises:
+    ValueError: When a pattern is empty or an invalid regular expression
+  '''
+  patterns = [pattern.strip() for pattern in text.split(',')]
+  for pattern in patterns:
+    if not pattern or pattern == REGEX_PREFIX:
+      raise ValueError("empty function pattern in '%s'" % text)
+    if pattern.startswith(REGEX_PREFIX):
+      try:
+        re.compile(pattern[len(REGEX_PREFIX):])
+      except re.error as e:
+        raise ValueError("invalid function pattern '%s': %s" % (pattern, e))
+  return patterns
+
+def name_matcher(patterns):
+  '''Compiles function name patterns.
+
+  Args:
+    patterns (list): Glob patterns, matched against the whole name, and
+      regular expressions prefixed with REGEX_PREFIX, searched in the name
+
+  Returns:
+    function: Tells whether a name matches one of the patterns
+  '''
+  globs = []
+  regexes = []
+  for pattern in patterns:
+    if pattern.startswith(REGEX_PREFIX):
+      regexes.append('(?:%s)' % pattern[len(REGEX_PREFIX):])
+    else:
+      globs.append(fnmatch.translate(pattern))
+  glob = re.compile('|'.join(globs)) if globs else None
+  regex = re.compile('|'.join(regexes)) if regexes else None
+
+  def matches(name):
+    return ((glob is not None and glob.match(name) is not None)
+            or (regex is not None and regex.search(name) is not None))
+  return matches
+
+def selected_functions(tree, select):
+  '''Returns the functions of a tree whose name is selected.
+
+  Args:
+    tree (c_ast.FileAST): AST of the file
+    select (function): Tells whether a function name is selected, see
+      name_matcher
+
+  Returns:
+    list: The selected FuncDefs, in file order
+  '''
+  return [ext for ext in tree.ext
+          if isinstance(ext, c_ast.FuncDef) and select(ext.decl.name)]
+
+def keep_selected(nodes, node_functions, select):
+  '''Keeps the nodes of the selected functions.
+
+  Args:
+    nodes (list): Nodes found by the rules
+    node_functions (list): FuncDef of each node, None outside of functions
+    select (function): Tells whether a function name is selected, see
+      name_matcher
+
+  Returns:
+    tuple: (nodes, node_functions) of the nodes in a selected function
+  '''
+  # select runs once per function, not once per node
+  selected = {}
+  kept = []
+  kept_functions = []
+  for node, funcdef in zip(nodes, node_functions):
+    if funcdef is None:
+      continue
+    keep = selected.get(funcdef)
+    if keep is None:
+      keep = selected[funcdef] = bool(select(funcdef.decl.name))
+    if keep:
+      kept.append(node)
+      kept_functions.append(funcdef)
+  return (kept, kept_functions)
+
+def group_sites(sites):
+  '''Groups sites by enclosing function.
+
+  Args:
+    sites (list): Sites of one file
+
+  Returns:
+    list: The sites outside of functions, then the sites of each function
+      in the order the functions start. Each group keeps the order of sites.
+  '''
+  return sorted(sites, key=lambda s: (s.function is not None,
+                                      s.function_start or 0,
+                                      s.function or ''))
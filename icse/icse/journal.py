@@ -0,0 +1,208 @@
+"""Run journal for checkpointed extraction.
+
+Every finished file is appended to the journal with its sites, or with its
+Failure. An interrupted run restarted with resume=True reloads the finished
+files from the journal and only processes the remaining ones. The first
+line of the journal holds the options of the run, whatever decides the sites
+of a file; a journal written with other options is discarded instead of
+resumed.
+
+Entries are buffered and written in batches, the journal is only flushed and
+synced to disk every JOURNAL_BATCH files or JOURNAL_INTERVAL seconds.
+"""
+
+import os
+import json
+import time
+import threading
+import collections
+
+from icse import site
+from icse import extractor
+
+#Number of buffered files that triggers a write of the journal
+JOURNAL_BATCH = 64
+
+#Seconds after which buffered files are written anyway
+JOURNAL_INTERVAL = 5.0
+
+JournalEntry = collections.namedtuple('JournalEntry',
+                                      ['filename', 'writes', 'reads', 'failure'])
+
+def _encode_site(s):
+  '''Returns the JSON representation of a Site.'''
+  return [s.filename, s.site_type, s.line, s.code, s.info, s.column,
+          s.function, s.function_start, s.function_end, s.function_kind]
+
+def _decode_site(record):
+  '''Returns the Site of a JSON representation.'''
+  return site.Site(*record)
+
+class Journal:
+  """Append-only journal of the files finished by a run.
+
+  Attributes:
+    path (string): Journal file
+    options (string): Options of the run, see get_sites.main
+    batch_size (int): Number of buffered files that triggers a write
+    interval (float): Seconds after which buffered files are written anyway
+    entries (list): JournalEntry of each file finished by previous runs
+  """
+
+  def __init__(self, path, resume=False, options='all',
+               batch_size=JOURNAL_BATCH, interval=JOURNAL_INTERVAL):
+    """Opens the journal. Without resume, or when it was written with other
+    options, the journal of a previous run is discarded.
+
+    Args:
+      path (string): Journal file
+      resume (optional[bool]): True to load the files finished by a previous
+        run
+      options (optional[string]): Options of the run, the site types and
+        whatever else decides the sites of a file
+      batch_size (optional[int]): Number of buffered files that triggers a
+        write
+      interval (optional[float]): Seconds after which buffered files are
+        written anyway
+
+    Returns:
+      None
+    """
+    self.path = path
+    self.options = options
+    self.batch_size = batch_size
+    self.interval = interval
+    self.entries = []
+    self.lock = threading.Lock()
+    self.buffer = []
+    self.last_flush = time.time()
+    if resume and os.path.exists(path) and self.load():
+      self.f = open(path, 'a')
+    else:
+      self.f = open(path, 'w')
+      self.f.write(json.dumps({'options': options}) + '\n')
+      self.f.flush()
+
+  def load(self):
+    """Reads the finished files of previous runs into self.entries.
+
+    Notes: A last line cut by an interruption is dropped and the journal is
+      truncated after the last complete entry.
+
+    Args:
+      None
+
+    Returns:
+      bool: False, and no entries, when the journal was written with other
+        options
+    """
+    end = 0
+    with open(self.path, 'r') as f:
+      try:
+        options = json.loads(f.readline())['options']
+      except (ValueError, TypeError, KeyError):
+        options = None
+      if options != self.options:
+        print("journal '%s' was written with other options, starting over"
+              % self.path)
+        return False
+      end = f.tell()
+      while True:
+        line = f.readline()
+        if not line.endswith('\n'):
+          break
+        try:
+          record = json.loads(line)
+        except ValueError:
+          break
+        end = f.tell()
+        if 'failure' in record:
+          failure = extractor.Failure(record['file'], *record['failure'])
+          self.entries.append(JournalEntry(record['file'], [], [], failure))
+        else:
+          self.entries.append(JournalEntry(record['file'],
+            [_decode_site(r) for r in record['writes']],
+            [_decode_site(r) for r in record['reads']], None))
+    with open(self.path, 'r+') as f:
+      f.truncate(end)
+    return True
+
+  def record(self, filename, writes, reads):
+    """Appends a finished file and its sites.
+
+    Args:
+      filename (string): Path of the file
+      writes (list): Buffer write Sites of the file
+      reads (list): Buffer read Sites of the file
+
+    Returns:
+      None
+    """
+    self._append({'file': filename,
+                  'writes': [_encode_site(s) for s in writes],
+                  'reads': [_encode_site(s) for s in reads]})
+
+  def record_failure(self, failure):
+    """Appends a file that failed.
+
+    Args:
+      failure (Failure): The failure of the file
+
+    Returns:
+      None
+    """
+    self._append({'file': failure.filename,
+                  'failure': [failure.stage, failure.error, failure.elapsed]})
+
+  def _append(self, record):
+    """Buffers a record, writes the buffer when it is full or old enough."""
+    with self.lock:
+      self.buffer.append(json.dumps(record) + '\n')
+      if (len(self.buffer) >= self.batch_size
+          or time.time() - self.last_flush >= self.interval):
+        self._flush()
+
+  def flush(self):
+    """Writes the buffered records and syncs the journal to disk.
+
+    Args:
+      None
+
+    Returns:
+      None
+    """
+    with self.lock:
+      self._flush()
+
+  def _flush(self):
+    if self.buffer and not self.f.closed:
+      self.f.write(''.join(self.buffer))
+      self.f.flush()
+      os.fsync(self.f.fileno())
+    self.buffer = []
+    self.last_flush = time.time()
+
+  def close(self):
+    """Flushes and closes the journal.
+
+    Args:
+      None
+
+    Returns:
+      None
+    """
+    with self.lock:
+      self._flush()
+      self.f.close()
+
+  def remove(self):
+    """Closes and deletes the journal, once the output is written.
+
+    Args:
+      None
+
+    Returns:
+      None
+    """
+    self.close()
+    os.remove(self.path)
@@ -0,0 +1,239 @@
+"""Memoization of the site rules over structurally identical function bodies.
+
+Near-duplicate files (the _01/_02 variants, the memcpy/memmove variants) hold
+many function bodies that only differ in their names and positions. BodyMemo
+hashes each FuncDef body with its identifiers renamed in order of first use
+and its coordinates left out, and keeps, per hash, the preorder positions of
+the nodes the site rules matched in it. A body whose hash is known gets its
+nodes back from these positions without running the rules, so the sites are
+built from the nodes of the new body, with its own names and coordinates.
+
+The rules must not depend on the abstracted names: names they do look at are
+given as significant_names and hashed verbatim.
+"""
+
+import time
+import hashlib
+import threading
+
+from pycparser import c_ast
+from icse import buffer_write
+from icse import buffer_read
+
+#Attribute holding the identifier of each node kind, abstracted in the hash
+NAME_ATTRS = {
+  'ID': 'name',
+  'Decl': 'name',
+  'TypeDecl': 'declname',
+  'Typename': 'name',
+  'Typedef': 'name',
+  'Struct': 'name',
+  'Union': 'name',
+  'Enum': 'name',
+  'Enumerator': 'name',
+  'Label': 'name',
+  'Goto': 'name',
+}
+
+#Maximum number of memoized bodies
+MEMO_SIZE = 1 << 16
+
+def body_signature(body, significant_names=frozenset()):
+  '''Hashes a function body with its identifiers and coordinates abstracted.
+
+  Args:
+    body (c_ast.Node): Body of a FuncDef
+    significant_names (optional[frozenset]): Names hashed as they are
+
+  Returns:
+    tuple: (digest, nodes), nodes are the nodes of body in preorder, the
+      positions the memoized results refer to
+  '''
+  parts = []
+  nodes = []
+  renamed = {}
+  stack = [body]
+  while stack:
+    node = stack.pop()
+    nodes.append(node)
+    kind = type(node).__name__
+    parts.append(kind)
+    name_attr = NAME_ATTRS.get(kind)
+    for attr in node.attr_names:
+      value = getattr(node, attr)
+      if (attr == name_attr and value is not None
+          and value not in significant_names):
+        parts.append('$%d' % renamed.setdefault(value, len(renamed)))
+      else:
+        parts.append(repr(value))
+    children = node.children()
+    for child_name, child in children:
+      parts.append(child_name)
+    parts.append(';')
+    for child_name, child in reversed(children):
+      stack.append(child)
+  data = '\x00'.join(parts).encode('utf-8', 'surrogatepass')
+  return (hashlib.blake2b(data, digest_size=16).digest(), nodes)
+
+class BodyMemo:
+  """Site rule results of function bodies, by structural hash.
+
+  Attributes:
+    significant_names (frozenset): Names the rules depend on
+    entries (dict): (write positions, read positions, seconds the rules
+      took) of each hash
+    bodies (int): Function bodies looked up
+    hits (int): Bodies found in entries
+    rule_time (float): Seconds the rules took on the bodies not found
+    hit_time (float): Seconds the rules took, when memoized, on the bodies
+      found
+    overhead (float): Seconds spent hashing bodies and rebasing results
+    lock (Lock): Serializes the lookups of the threads of a file
+  """
+
+  def __init__(self, significant_names=()):
+    """Constructor method.
+
+    Args:
+      significant_names (optional[iterable]): Names the rules depend on
+
+    Returns:
+      None
+    """
+    self.significant_names = frozenset(significant_names)
+    self.entries = {}
+    self.bodies = 0
+    self.hits = 0
+    self.rule_time = 0.0
+    self.hit_time = 0.0
+    self.overhead = 0.0
+    self.lock = threading.Lock()
+    self._tree = None
+    self._nodes = None
+
+  def nodes(self, tree, select=None):
+    """Returns the nodes the site rules match in a tree.
+
+    Notes: The result for the last tree is kept, the buffer write and the
+      buffer read rules of a file share it, so they must give the same
+      select.
+
+    Args:
+      tree (c_ast.FileAST): AST of the file
+      select (optional[function]): Tells whether the nodes of a function are
+        found from its name, see functions.name_matcher. The other functions
+        and the file scope are skipped.
+
+    Returns:
+      tuple: (buffer write nodes, buffer read nodes, FuncDef of each buffer
+        write node, FuncDef of each buffer read node) in the order of
+        BufferWriteVisitor and BufferReadVisitor
+    """
+    with self.lock:
+      if tree is not self._tree:
+        self._nodes = self._find_nodes(tree, select)
+        self._tree = tree
+      return self._nodes
+
+  def _find_nodes(self, tree, select):
+    '''Runs the rules over the top-level nodes of tree, the FuncDef bodies
+    through the memo.'''
+    writes = []
+    reads = []
+    write_functions = []
+    read_functions = []
+    for ext in tree.ext:
+      if select is not None and not (isinstance(ext, c_ast.FuncDef)
+                                     and select(ext.decl.name)):
+        continue
+      if isinstance(ext, c_ast.FuncDef) and ext.body is not None:
+        _visit(ext.decl, writes, reads)
+        body_writes, body_reads = self._body_nodes(ext.body)
+        writes.extend(body_writes)
+        reads.extend(body_reads)
+        for decl in ext.param_decls or []:
+          _visit(decl, writes, reads)
+        write_functions.extend([ext] * (len(writes) - len(write_functions)))
+        read_functions.extend([ext] * (len(reads) - len(read_functions)))
+      else:
+        _visit(ext, writes, reads)
+        write_functions.extend([None] * (len(writes) - len(write_functions)))
+        read_functions.extend([None] * (len(reads) - len(read_functions)))
+    return (writes, reads, write_functions, read_functions)
+
+  def _body_nodes(self, body):
+    '''Matching nodes of a function body, memoized.'''
+    start = time.time()
+    digest, nodes = body_signature(body, self.significant_names)
+    self.bodies += 1
+    entry = self.entries.get(digest)
+    if entry is not None:
+      self.hits += 1
+      self.hit_time += entry[2]
+      result = ([nodes[i] for i in entry[0]], [nodes[i] for i in entry[1]])
+      self.overhead += time.time() - start
+      return result
+
+    hashed = time.time()
+    writes = []
+    reads = []
+    _visit(body, writes, reads)
+    elapsed = time.time() - hashed
+    self.rule_time += elapsed
+    if len(self.entries) < MEMO_SIZE:
+      positions = dict((id(node), i) for i, node in enumerate(nodes))
+      self.entries[digest] = (tuple(positions[id(node)] for node in writes),
+                              tuple(positions[id(node)] for node in reads),
+                              elapsed)
+    self.overhead += time.time() - start - elapsed
+    return (writes, reads)
+
+  def stats(self):
+    """Returns the counters of the memo.
+
+    Args:
+      None
+
+    Returns:
+      dict: bodies, hits, hit_time, the rule time of the hits, and
+        overhead, the time spent hashing and rebasing, in seconds
+    """
+    return {'bodies': self.bodies, 'hits': self.hits,
+            'hit_time': self.hit_time, 'overhead': self.overhead}
+
+def add_stats(total, stats):
+  '''Adds the counters of stats to total.
+
+  Args:
+    total (dict): Counters as returned by BodyMemo.stats, updated
+    stats (dict): Counters to add, None for none
+
+  Returns:
+    dict: total
+  '''
+  if stats is not None:
+    for key, value in stats.items():
+      total[key] = total.get(key, 0) + value
+  return total
+
+def stats_since(memo, before):
+  '''Returns the counters of a memo since an earlier call to its stats.
+
+  Args:
+    memo (BodyMemo): The memo
+    before (dict): Its earlier stats
+
+  Returns:
+    dict: Counters of the lookups made since before
+  '''
+  return dict((key, value - before[key])
+              for key, value in memo.stats().items())
+
+def _visit(node, writes, reads):
+  '''Runs the site rule visitors over a subtree.'''
+  write_visitor = buffer_write.BufferWriteVisitor()
+  write_visitor.visit(node)
+  writes.extend(write_visitor.nodes)
+  read_visitor = buffer_read.BufferReadVisitor()
+  read_visitor.visit(node)
+  reads.extend(read_visitor.nodes)
@@ -0,0 +1,194 @@
+"""Pruning of the unused header declarations of preprocessed text.
+
+After cpp most of a translation unit is the prototypes and typedefs of the
+headers, which the file never refers to. prune splits the text into top-level
+declarations with a cheap token scan, keeps the declarations of the primary
+file (the first file of the line markers) and the header declarations that
+define a name the kept declarations refer to, transitively, and blanks out
+the others. Removed declarations are replaced by their newlines, so every
+line keeps its number.
+
+Names are approximated on the safe side: a declaration refers to every
+identifier it contains, and defines every identifier outside of parameter
+lists, array dimensions, struct and union bodies and function bodies, plus
+its tags and enumerators. Header function definitions, declarations that span a line
+marker and declarations that define no name are always kept.
+"""
+
+import re
+import collections
+
+from pycparser.c_lexer import CLexer
+
+_TOKEN = re.compile(r'''
+    (?P<directive>^[ \t]*\#[^\n]*)
+  | (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<number>\.?[0-9](?:[eEpP][+-]|[\w.])*)
+  | (?P<name>[A-Za-z_$][\w$]*)
+  | (?P<punct>[{}()\[\];,])
+''', re.M | re.X)
+
+_LINE_MARKER = re.compile(r'[ \t]*#[ \t]*(?:line[ \t]+)?\d+[ \t]+'
+                          r'"((?:[^"\\]|\\.)*)"')
+
+KEYWORDS = frozenset(CLexer.keyword_map)
+
+#Contexts whose identifiers are not declared at file scope
+_HIDDEN = ('params', 'record', 'body', 'index')
+
+Declaration = collections.namedtuple('Declaration',
+  ['start', 'end', 'file', 'defines', 'uses', 'function', 'mixed'])
+
+def split_declarations(text):
+  '''Splits preprocessed text into its top-level declarations.
+
+  Args:
+    text (string): Preprocessed C source
+
+  Returns:
+    tuple: (primary file, list of Declaration), the primary file is None
+      when the text has no line markers. start and end delimit the text of
+      the declaration, function is True for a function definition, mixed
+      is True when a line marker is inside the declaration.
+  '''
+  primary = None
+  current = None
+  declarations = []
+  typedefs = set()
+
+  start = None
+  defines = uses = None
+  stack = []
+  hidden = 0
+  prev = before = None
+  tag = False
+  typedef = False
+  mixed = False
+
+  for m in _TOKEN.finditer(text):
+    kind = m.lastgroup
+    value = m.group()
+    if kind == 'directive':
+      marker = _LINE_MARKER.match(value)
+      if marker is not None:
+        current = re.sub(r'\\(.)', r'\1', marker.group(1))
+        if primary is None:
+          primary = current
+      if start is not None:
+        mixed = True
+      continue
+
+    if start is None:
+      start = m.start()
+      declaration_file = current
+      defines = set()
+      uses = set()
+      typedef = False
+      mixed = False
+
+    if kind == 'name':
+      if value in KEYWORDS:
+        if value in ('struct', 'union', 'enum'):
+          tag = True
+        elif value == 'typedef' and not stack:
+          typedef = True
+      else:
+        uses.add(value)
+        if tag or not hidden or (stack and stack[-1] == 'enum'):
+          defines.add(value)
+        tag = False
+    elif kind == 'punct':
+      end = False
+      if value == '(':
+        if prev == ')' or prev == ']' or (
+            prev is not None and prev not in KEYWORDS
+            and prev not in typedefs and _is_name(prev)):
+          stack.append('params')
+        else:
+          stack.append('group')
+      elif value == '[':
+        stack.append('index')
+      elif value == '{':
+        keyword = prev if prev in KEYWORDS else before
+        if keyword == 'enum':
+          stack.append('enum')
+        elif keyword in ('struct', 'union'):
+          stack.append('record')
+        elif prev == ')' and not stack:
+          stack.append('body')
+        else:
+          stack.append('init')
+      elif value in ')]}':
+        if stack:
+          context = stack.pop()
+          if value == '}' and context == 'body' and not stack:
+            end = True
+      elif value == ';' and not stack:
+        end = True
+      hidden = sum(1 for context in stack if context in _HIDDEN)
+      tag = False
+      if end:
+        declarations.append(Declaration(start, m.end(), declaration_file,
+                                        defines, uses, value == '}', mixed))
+        if typedef:
+          typedefs.update(defines)
+        start = None
+    else:
+      tag = False
+
+    before = prev
+    prev = value
+
+  return (primary, declarations)
+
+def _is_name(token):
+  '''Tells whether a token is an identifier or a keyword.'''
+  return token[0].isalpha() or token[0] in '_$'
+
+def prune(text):
+  '''Blanks out the header declarations the primary file does not need.
+
+  Args:
+    text (string): Preprocessed C source, with line markers
+
+  Returns:
+    string: The text with the unneeded declarations replaced by their
+      newlines, text itself when there are no line markers
+  '''
+  primary, declarations = split_declarations(text)
+  if primary is None:
+    return text
+
+  keep = [False] * len(declarations)
+  definers = collections.defaultdict(list)
+  needed = []
+  for i, declaration in enumerate(declarations):
+    if (declaration.file == primary or declaration.function
+        or declaration.mixed or not declaration.defines):
+      keep[i] = True
+      needed.extend(declaration.uses)
+    else:
+      for name in declaration.defines:
+        definers[name].append(i)
+
+  seen = set()
+  while needed:
+    name = needed.pop()
+    if name in seen:
+      continue
+    seen.add(name)
+    for i in definers.get(name, ()):
+      if not keep[i]:
+        keep[i] = True
+        needed.extend(declarations[i].uses)
+
+  parts = []
+  last = 0
+  for i, declaration in enumerate(declarations):
+    if keep[i]:
+      continue
+    parts.append(text[last:declaration.start])
+    parts.append('\n' * text.count('\n', declaration.start, declaration.end))
+    last = declaration.end
+  parts.append(text[last:])
+  return ''.join(parts)
@@ -0,0 +1,81 @@
+"""Rendering of the expressions that become site values.
+
+Site values are short lvalue expressions: names, struct member chains,
+array references, casts and unary operators. ValueRenderer builds their text
+directly and hands any other node to CGenerator, so the result is always the
+text CGenerator would produce.
+"""
+
+from pycparser import c_ast, c_generator
+
+#Nodes CGenerator never parenthesizes as operands
+SIMPLE_NODES = (c_ast.Constant, c_ast.ID, c_ast.ArrayRef, c_ast.StructRef,
+                c_ast.FuncCall)
+
+class ValueRenderer:
+  """Renders site values as CGenerator does.
+
+  Attributes:
+    generator (CGenerator): Fallback for the nodes without a fast path
+  """
+
+  def __init__(self, generator=None):
+    """Initializes the renderer.
+
+    Args:
+      generator (optional[CGenerator]): Fallback generator, a new one when
+        None
+
+    Returns:
+      None
+    """
+    self.generator = generator if generator is not None else c_generator.CGenerator()
+
+  def render(self, node):
+    """Renders an expression.
+
+    Args:
+      node (c_ast.Node): Expression node
+
+    Returns:
+      string: The text CGenerator.visit returns for node
+    """
+    if node is None:
+      return ''
+
+    kind = type(node)
+    if kind is c_ast.ID:
+      text = node.name
+    elif kind is c_ast.Constant:
+      text = node.value
+    elif kind is c_ast.StructRef:
+      text = self._operand(node.name) + node.type + self.render(node.field)
+    elif kind is c_ast.ArrayRef:
+      text = self._operand(node.name) + '[' + self.render(node.subscript) + ']'
+    elif kind is c_ast.UnaryOp:
+      if node.op == 'sizeof':
+        text = 'sizeof(' + self.render(node.expr) + ')'
+      elif node.op == 'p++':
+        text = self._operand(node.expr) + '++'
+      elif node.op == 'p--':
+        text = self._operand(node.expr) + '--'
+      else:
+        text = node.op + self._operand(node.expr)
+    elif kind is c_ast.Cast:
+      text = ('(' + self.generator._generate_type(node.to_type) + ') '
+              + self._operand(node.expr))
+    else:
+      text = self.generator.visit(node)
+    return text
+
+  def _operand(self, node):
+    '''Renders an operand, parenthesized unless it is simple.'''
+    if isinstance(node, c_ast.InitList):
+      text = '{' + self.render(node) + '}'
+    elif isinstance(node, c_ast.ExprList):
+      text = '(' + self.render(node) + ')'
+    else:
+      text = self.render(node)
+    if isinstance(node, SIMPLE_NODES):
+      return text
+    return '(' + text + ')'
@@ -0,0 +1,395 @@
+"""Site rules described declaratively.
+
+A rule specification maps each site type to its rules, in JSON:
+
+  {
+    "buffer_write": [
+      {"node": "Assignment",
+       "match": {"lvalue": {"is": "UnaryOp"}, "lvalue.op": "*"},
+       "site": "lvalue", "info": "lvalue.expr"}
+    ],
+    "pointer_arithmetic": [
+      {"node": "BinaryOp", "match": {"op": {"in": ["+", "-"]}},
+       "unless": [{"parent": "Assignment", "as": "rvalue"}]}
+    ]
+  }
+
+A rule matches the nodes of a c_ast class:
+
+  node     the class name
+  match    tests on the fields of the node, by path
+  context  conditions on the parent of the node, all of them must hold
+  unless   conditions on the parent of the node, none of them may hold
+  site     path of the node whose coordinates are the site, the node itself
+           by default
+  info     path of the site info, the site path by default. It must lead to
+           a node, rendered as CGenerator would, or to a name, kept as it is.
+
+A path is a dotted list of fields from the node, numbers index lists:
+'lvalue.name', 'args.exprs.0'. A test is a value the field must equal, or
+an object with one of:
+
+  is    a class name or a list of class names, the field is one of them
+  in    a list of values, the field is one of them
+  not   a test, the field must fail it
+
+A parent condition has a 'parent' class name or list of names, an 'as'
+field the node must be, and 'match' tests on the fields of the parent:
+{"parent": "UnaryOp", "match": {"op": "&"}}.
+
+The rules of a site type are tried in order, the first one that matches a
+node makes its site; a rule whose site or info path is missing, or whose
+info is neither a node nor a name, does not match. The rules of all the site
+types are compiled into one table from the node class to its rules, so a file
+is searched in one pass whatever the number of site types: over the nodes of
+the classes of the table in the node index, or in one walk of the tree
+without one.
+
+DEFAULT_SPEC holds the rules of BufferWriteVisitor and BufferReadVisitor.
+"""
+
+import json
+import re
+
+from pycparser import c_ast
+
+#Site type whose sites are the buffer write sites of the pipeline, the sites
+#of all the other site types follow the buffer read sites
+WRITE_KIND = 'buffer_write'
+
+#Keys of the rules and of the parent conditions
+RULE_KEYS = frozenset(['node', 'match', 'context', 'unless', 'site', 'info'])
+CONTEXT_KEYS = frozenset(['parent', 'as', 'match'])
+
+#Rules of the built-in site types
+DEFAULT_SPEC = {
+  'buffer_write': [
+    {'node': 'Assignment',
+     'match': {'lvalue': {'is': 'ArrayRef'},
+               'lvalue.name': {'is': ['ID', 'StructRef']}},
+     'site': 'lvalue', 'info': 'lvalue.name'},
+    {'node': 'Assignment',
+     'match': {'lvalue': {'is': 'UnaryOp'}, 'lvalue.op': '*'},
+     'site': 'lvalue', 'info': 'lvalue.expr'},
+  ],
+  'buffer_read': [
+    {'node': 'UnaryOp',
+     'match': {'op': '*'},
+     'unless': [{'parent': 'Assignment', 'as': 'lvalue'}],
+     'site': 'expr', 'info': 'expr.name'},
+    {'node': 'ArrayRef',
+     'unless': [{'parent': 'Assignment', 'as': 'lvalue'},
+                {'parent': 'UnaryOp', 'match': {'op': '&'}}],
+     'site': 'name', 'info': 'name.name'},
+  ],
+}
+
+_PATH_PART = re.compile(r'[A-Za-z_]\w*|\d+$')
+
+#Value of a missing path
+_MISSING = object()
+
+class RuleSet:
+  """Site rules compiled into a dispatch table.
+
+  Attributes:
+    spec (dict): The rules, see the module docstring
+    kinds (list): Site types of the rules, in the order of spec
+    table (dict): Rules of each c_ast class, by site type in the order of
+      kinds, then in the order of spec
+  """
+
+  def __init__(self, spec=DEFAULT_SPEC):
+    """Constructor method.
+
+    Args:
+      spec (optional[dict]): The rules, the rules of the built-in site types
+        when not given
+
+    Returns:
+      None
+
+    Raises:
+      ValueError: When the rules are malformed
+    """
+    if not isinstance(spec, dict) or not spec:
+      raise ValueError('site rules must be a non empty object')
+    self.spec = spec
+    self.kinds = []
+    self.table = {}
+    for kind, rules in spec.items():
+      if not isinstance(kind, str) or not kind or kind == 'all':
+        raise ValueError("invalid site type '%s'" % kind)
+      if not isinstance(rules, list) or not rules:
+        raise ValueError("rules of '%s' must be a non empty list" % kind)
+      self.kinds.append(kind)
+      for i, rule in enumerate(rules):
+        compiled = _Rule(kind, rule, '%s rule %d' % (kind, i + 1))
+        self.table.setdefault(compiled.node_class, []).append(compiled)
+
+  def __reduce__(self):
+    # the compiled tests are closures, the workers compile the spec again
+    return (RuleSet, (self.spec,))
+
+  def spec_text(self):
+    """Returns the rules as a string, equal for equal rules.
+
+    Args:
+      None
+
+    Returns:
+      string: The rules in JSON, keys sorted
+    """
+    return json.dumps(self.spec, sort_keys=True, separators=(',', ':'))
+
+  def _tables(self, site_types):
+    '''Dispatch table restricted to the rules of site_types.'''
+    if site_types == 'all':
+      return self.table
+    table = {}
+    for node_class, rules in self.table.items():
+      kept = [rule for rule in rules if rule.kind == site_types]
+      if kept:
+        table[node_class] = kept
+    return table
+
+  def find_nodes(self, index, site_types='all'):
+    """Applies the rules to the nodes of the classes of the table in a
+    NodeIndex, without walking the tree.
+
+    Args:
+      index (NodeIndex): Node index of the parsed file
+      site_types (optional[string]): Site type whose rules are applied, all
+        of them for 'all'
+
+    Returns:
+      list: (site type, node, coord, info) of each match, by site type in
+        the order of kinds, then in preorder
+    """
+    matched = dict((kind, {}) for kind in self.kinds)
+    for node_class, rules in self._tables(site_types).items():
+      for node in index.nodes(node_class):
+        parent = index.parent(node)
+        for rule in rules:
+          found = matched[rule.kind]
+          if node not in found:
+            site = rule.match(node, parent)
+            if site is not None:
+              found[node] = site
+    result = []
+    for kind in self.kinds:
+      found = matched[kind]
+      for node in index.preorder(found):
+        result.append((kind, node) + found[node])
+    return result
+
+  def walk(self, roots, site_types='all'):
+    """Applies the rules in one walk of subtrees, in the order a NodeVisitor
+    visits them.
+
+    Args:
+      roots (list): Roots of the subtrees, FileAST or FuncDef nodes
+      site_types (optional[string]): Site type whose rules are applied, all
+        of them for 'all'
+
+    Returns:
+      tuple: (matches, functions), matches as find_nodes returns them,
+        functions the FuncDef each match is in, None outside of functions
+    """
+    table = self._tables(site_types)
+    matched = dict((kind, []) for kind in self.kinds)
+    stack = [(root, None, None) for root in reversed(roots)]
+    while stack:
+      node, parent, function = stack.pop()
+      if type(node) is c_ast.FuncDef:
+        function = node
+      rules = table.get(type(node))
+      if rules is not None:
+        kinds = set()
+        for rule in rules:
+          if rule.kind not in kinds:
+            site = rule.match(node, parent)
+            if site is not None:
+              kinds.add(rule.kind)
+              matched[rule.kind].append(((rule.kind, node) + site, function))
+      for child_name, child in reversed(node.children()):
+        stack.append((child, node, function))
+    result = []
+    functions = []
+    for kind in self.kinds:
+      for match, function in matched[kind]:
+        result.append(match)
+        functions.append(function)
+    return (result, functions)
+
+def load_rules(path):
+  '''Loads a rule specification file.
+
+  Args:
+    path (string): JSON file of rules, see the module docstring
+
+  Returns:
+    RuleSet: The compiled rules
+
+  Raises:
+    ValueError: When the file is not valid JSON or the rules are malformed
+    OSError: When the file cannot be read
+  '''
+  with open(path) as f:
+    spec = json.load(f)
+  return RuleSet(spec)
+
+class _Rule:
+  """One compiled rule."""
+
+  def __init__(self, kind, rule, where):
+    if not isinstance(rule, dict):
+      raise ValueError('%s must be an object' % where)
+    unknown = set(rule) - RULE_KEYS
+    if unknown:
+      raise ValueError("%s: unknown key '%s'" % (where, sorted(unknown)[0]))
+    if 'node' not in rule:
+      raise ValueError("%s: missing 'node'" % where)
+    if isinstance(rule['node'], list):
+      raise ValueError("%s: 'node' must be one class name" % where)
+    self.kind = kind
+    self.node_class = _classes(rule['node'], where)[0]
+    self.tests = _compile_tests(rule.get('match', {}), where)
+    self.context = [_compile_context(context, where)
+                    for context in _list(rule.get('context', []), where)]
+    self.unless = [_compile_context(context, where)
+                   for context in _list(rule.get('unless', []), where)]
+    self.site = _path(rule.get('site', ''), where)
+    self.info = _path(rule['info'], where) if 'info' in rule else self.site
+
+  def match(self, node, parent):
+    '''Returns (coord, info) of the site when the rule matches node, else
+    None.'''
+    for path, test in self.tests:
+      if not test(_resolve(node, path)):
+        return None
+    for context in self.context:
+      if not context(node, parent):
+        return None
+    for context in self.unless:
+      if context(node, parent):
+        return None
+    site = _resolve(node, self.site)
+    info = _resolve(node, self.info)
+    if site is _MISSING or site is None:
+      return None
+    if not isinstance(info, (str, c_ast.Node)):
+      return None
+    coord = getattr(site, 'coord', None) or node.coord
+    if coord is None:
+      return None
+    return (coord, info)
+
+def _list(value, where):
+  '''Checks a list of the rule.'''
+  if not isinstance(value, list):
+    raise ValueError('%s: parent conditions must be a list' % where)
+  return value
+
+def _classes(names, where):
+  '''Returns the c_ast classes of a class name or list of names.'''
+  if not isinstance(names, list):
+    names = [names]
+  classes = []
+  for name in names:
+    node_class = getattr(c_ast, name, None) if isinstance(name, str) else None
+    if (not isinstance(node_class, type) or node_class is c_ast.Node
+        or not issubclass(node_class, c_ast.Node)):
+      raise ValueError("%s: unknown node class '%s'" % (where, name))
+    classes.append(node_class)
+  if not classes:
+    raise ValueError('%s: empty list of node classes' % where)
+  return tuple(classes)
+
+def _path(text, where):
+  '''Splits a path into field names and list indices.'''
+  if not isinstance(text, str):
+    raise ValueError('%s: invalid path %r' % (where, text))
+  if not text:
+    return ()
+  path = []
+  for part in text.split('.'):
+    if not _PATH_PART.match(part):
+      raise ValueError("%s: invalid path '%s'" % (where, text))
+    path.append(int(part) if part.isdigit() else part)
+  return tuple(path)
+
+def _resolve(node, path):
+  '''Value at path from node, _MISSING when a part is missing.'''
+  value = node
+  for part in path:
+    if type(part) is int:
+      if not isinstance(value, (list, tuple)) or part >= len(value):
+        return _MISSING
+      value = value[part]
+    else:
+      value = getattr(value, part, _MISSING)
+      if value is _MISSING:
+        return value
+  return value
+
+def _compile_tests(tests, where):
+  '''Returns the (path, test) pairs of a match object.'''
+  if not isinstance(tests, dict):
+    raise ValueError("%s: 'match' must be an object" % where)
+  return [(_path(path, where), _compile_test(test, where))
+          for path, test in tests.items()]
+
+def _compile_test(test, where):
+  '''Returns the function of a test, see the module docstring.'''
+  if isinstance(test, dict):
+    if len(test) != 1:
+      raise ValueError('%s: a test has one of is, in, not' % where)
+    op, argument = next(iter(test.items()))
+    if op == 'is':
+      classes = _classes(argument, where)
+      return lambda value: isinstance(value, classes)
+    if op == 'in':
+      if (not isinstance(argument, list)
+          or not all(_is_scalar(value) for value in argument)):
+        raise ValueError("%s: 'in' takes a list of values" % where)
+      # compared with ==, a field may hold a list
+      values = tuple(argument)
+      return lambda value: value in values
+    if op == 'not':
+      inner = _compile_test(argument, where)
+      return lambda value: not inner(value)
+    raise ValueError("%s: unknown test '%s'" % (where, op))
+  if isinstance(test, list):
+    raise ValueError("%s: use {\"in\": [...]} to test a list of values" % where)
+  return lambda value: value is not _MISSING and value == test
+
+def _is_scalar(value):
+  '''Tells whether a JSON value is a string, a number, a boolean or null.'''
+  return value is None or isinstance(value, (str, int, float))
+
+def _compile_context(context, where):
+  '''Returns the function of a parent condition.'''
+  if not isinstance(context, dict):
+    raise ValueError('%s: a parent condition must be an object' % where)
+  unknown = set(context) - CONTEXT_KEYS
+  if unknown:
+    raise ValueError("%s: unknown key '%s'" % (where, sorted(unknown)[0]))
+  classes = _classes(context['parent'], where) if 'parent' in context else None
+  field = context.get('as')
+  if field is not None and not isinstance(field, str):
+    raise ValueError("%s: 'as' must be a field name" % where)
+  tests = _compile_tests(context.get('match', {}), where)
+
+  def holds(node, parent):
+    if parent is None:
+      return False
+    if classes is not None and not isinstance(parent, classes):
+      return False
+    if field is not None and getattr(parent, field, None) is not node:
+      return False
+    for path, test in tests:
+      if not test(_resolve(parent, path)):
+        return False
+    return True
+  return holds
@@ -0,0 +1,141 @@
+"""Cost based ordering of the files to extract.
+
+The wall time of a parallel run is dominated by its tail: a huge file started
+last keeps one worker busy after every other worker is done. Files are
+therefore dispatched by decreasing estimated cost (longest processing time
+first), and files that are much more expensive than the average are never
+batched with others so each one gets a worker of its own.
+"""
+
+import os
+import json
+
+#Files costing more than LARGE_FACTOR times the mean are dispatched alone
+LARGE_FACTOR = 4.0
+
+class CostProfile:
+  """Per-file timings recorded by previous runs.
+
+  Attributes:
+    path (string): JSON file the timings are loaded from and saved to
+    timings (dict): Seconds spent on each file, keyed by file path
+  """
+
+  def __init__(self, path=None):
+    """Loads the timings in path, if it exists.
+
+    Args:
+      path (optional[string]): JSON file with the timings of previous runs
+
+    Returns:
+      None
+    """
+    self.path = path
+    self.timings = {}
+    if path is not None and os.path.exists(path):
+      with open(path) as f:
+        self.timings = json.load(f).get('timings', {})
+
+  def record(self, filename, seconds):
+    """Records the time spent on filename during this run.
+
+    Args:
+      filename (string): Path of the processed file
+      seconds (float): Wall time spent on the file
+
+    Returns:
+      None
+    """
+    self.timings[filename] = seconds
+
+  def save(self):
+    """Writes the timings back to the profile file.
+
+    Args:
+      None
+
+    Returns:
+      None
+    """
+    if self.path is None:
+      return
+    with open(self.path, 'w') as f:
+      json.dump({'timings': self.timings}, f, indent=1, sort_keys=True)
+
+  def estimate(self, files):
+    """Estimates the cost in seconds of each file.
+    Files with a recorded timing use it. The other ones are estimated from
+    their size, scaled by the seconds per byte observed on the timed files.
+
+    Args:
+      files (list): Paths of the files to estimate
+
+    Returns:
+      costs (dict): Estimated seconds keyed by file path
+    """
+    sizes = {}
+    for filename in files:
+      try:
+        sizes[filename] = os.path.getsize(filename)
+      except OSError:
+        sizes[filename] = 0
+
+    timed = [f for f in files if f in self.timings]
+    timed_bytes = sum(sizes[f] for f in timed)
+    if timed_bytes:
+      rate = sum(self.timings[f] for f in timed) / timed_bytes
+    else:
+      rate = 1.0
+
+    costs = {}
+    for filename in files:
+      if filename in self.timings:
+        costs[filename] = self.timings[filename]
+      else:
+        costs[filename] = sizes[filename] * rate
+    return costs
+
+def order_files(files, costs):
+  """Sorts the files by decreasing cost. Ties keep the path order so the
+  schedule is deterministic.
+
+  Args:
+    files (list): Paths of the files to schedule
+    costs (dict): Estimated cost keyed by file path
+
+  Returns:
+    list: Paths, most expensive first
+  """
+  return sorted(files, key=lambda f: (-costs.get(f, 0), f))
+
+def make_batches(files, costs, batch_size, large_factor=LARGE_FACTOR):
+  """Groups the cost ordered files into batches that are handed to the
+  workers. Large files are alone in their batch so they get a dedicated
+  worker, the cheap tail is grouped to save dispatch round trips.
+
+  Args:
+    files (list): Paths, most expensive first (see order_files)
+    costs (dict): Estimated cost keyed by file path
+    batch_size (int): Maximum number of files in a batch of small files
+    large_factor (optional[float]): Files costing more than large_factor
+      times the mean cost get a batch of their own
+
+  Returns:
+    batches (list): Lists of paths
+  """
+  if not files:
+    return []
+  mean = sum(costs.get(f, 0) for f in files) / len(files)
+  batches = []
+  small = []
+  for filename in files:
+    if costs.get(filename, 0) > mean * large_factor:
+      batches.append([filename])
+    else:
+      small.append(filename)
+      if len(small) == batch_size:
+        batches.append(small)
+        small = []
+  if small:
+    batches.append(small)
+  return batches
@@ -0,0 +1,313 @@
+"""Compact serialization of pycparser ASTs, for caches and inter-process
+transfer.
+
+dumps encodes a tree in preorder into a few typed streams instead of pickle's
+object graph:
+
+  tags    uint8   per node its kind (index in flat.KINDS, NONE_KIND for a
+                  None list item), then a tag for its coord and for its
+                  other coords (the end_coord of a Compound), for each of
+                  its attributes and for each of its child slots
+  strings         ids in the string table, which is in first use order
+  lines           coord line deltas from the previous coord
+  counts          list lengths and coord columns
+  table           UTF-8 strings and their lengths
+
+Each integer stream uses the smallest array typecode its values fit in, and
+the whole is stored little-endian after MAGIC. The coord file is only stored
+when it changes. The encoding only depends on the tree, so dumps(loads(data))
+== data.
+
+Notes: pickle keeps the subtrees shared by several declarators (struct S
+{ ... } a, b;) shared, loads returns one copy per declarator.
+"""
+
+import sys
+import array
+import struct
+
+from pycparser import c_ast
+from pycparser.plyparser import Coord
+from icse import flat
+
+MAGIC = b'ICSEAST\x01'
+
+#Kind tag of a None item in a list of children
+NONE_KIND = 255
+
+#Tags of the values of attributes and child slots
+NONE_TAG = 0
+ONE_TAG = 1
+LIST_TAG = 2
+
+#Coord tags, NEW_FILE and HAS_COLUMN are flags
+NO_COORD = 0
+SAME_FILE = 1
+NEW_FILE = 2
+HAS_COLUMN = 4
+
+#Typecodes tried for the integer streams, smallest first
+SIGNED_TYPES = 'bhiq'
+UNSIGNED_TYPES = 'BHIQ'
+
+_STREAM = struct.Struct('<cQ')
+
+KIND_CLASSES = [getattr(c_ast, name) for name in flat.KINDS]
+ATTR_NAMES = [klass.attr_names for klass in KIND_CLASSES]
+
+#Coord slots of each kind besides coord
+COORD_SLOTS = [tuple(slot for slot in klass.__slots__
+                     if slot.endswith('_coord'))
+               for klass in KIND_CLASSES]
+
+#Child slots of each kind: the __slots__ that are neither attributes nor
+#coords, in the order of children()
+CHILD_SLOTS = [tuple(slot for slot in klass.__slots__
+                     if slot not in klass.attr_names
+                     and slot not in ('coord', '__weakref__')
+                     and not slot.endswith('_coord'))
+               for klass in KIND_CLASSES]
+
+def _pack(values, typecodes):
+  '''Packs integers in the smallest typecode they fit in.
+
+  Args:
+    values (list): Integers
+    typecodes (string): Candidate typecodes, smallest first
+
+  Returns:
+    bytes: Typecode and length header followed by the little-endian data
+  '''
+  for typecode in typecodes:
+    try:
+      packed = array.array(typecode, values)
+      break
+    except OverflowError:
+      continue
+  if sys.byteorder == 'big':
+    packed.byteswap()
+  data = packed.tobytes()
+  return _STREAM.pack(typecode.encode('ascii'), len(data)) + data
+
+def _unpack(data, offset):
+  '''Reads a stream written by _pack.
+
+  Returns:
+    tuple: (array, offset just past the stream)
+  '''
+  typecode, length = _STREAM.unpack_from(data, offset)
+  offset += _STREAM.size
+  values = array.array(typecode.decode('ascii'))
+  values.frombytes(data[offset:offset + length])
+  if sys.byteorder == 'big':
+    values.byteswap()
+  return (values, offset + length)
+
+def dumps(tree):
+  '''Serializes a pycparser AST.
+
+  Args:
+    tree (c_ast.Node): Root of the AST
+
+  Returns:
+    bytes: Encoded tree, see loads
+
+  Raises:
+    TypeError: When an attribute is not a string, a list of strings or None
+  '''
+  tags = bytearray()
+  strings = []
+  lines = []
+  counts = []
+  table = []
+  string_ids = {}
+  kind_codes = flat.KIND_CODES
+
+  def string(value):
+    string_id = string_ids.get(value)
+    if string_id is None:
+      string_id = string_ids[value] = len(table)
+      table.append(value)
+    strings.append(string_id)
+
+  last_file = None
+  last_line = 0
+
+  def put_coord(coord):
+    nonlocal last_file, last_line
+    if coord is None:
+      tags.append(NO_COORD)
+      return
+    tag = SAME_FILE
+    if coord.file != last_file:
+      tag |= NEW_FILE
+    if coord.column is not None:
+      tag |= HAS_COLUMN
+    tags.append(tag)
+    if tag & NEW_FILE:
+      string(coord.file)
+      last_file = coord.file
+    lines.append(coord.line - last_line)
+    last_line = coord.line
+    if tag & HAS_COLUMN:
+      counts.append(coord.column)
+
+  stack = [tree]
+  while stack:
+    node = stack.pop()
+    if node is None:
+      tags.append(NONE_KIND)
+      continue
+    kind = kind_codes[type(node).__name__]
+    tags.append(kind)
+
+    put_coord(node.coord)
+    for slot in COORD_SLOTS[kind]:
+      put_coord(getattr(node, slot))
+
+    for attr in ATTR_NAMES[kind]:
+      value = getattr(node, attr)
+      if value is None:
+        tags.append(NONE_TAG)
+      elif isinstance(value, str):
+        tags.append(ONE_TAG)
+        string(value)
+      elif isinstance(value, list):
+        tags.append(LIST_TAG)
+        counts.append(len(value))
+        for item in value:
+          string(item)
+      else:
+        raise TypeError("cannot serialize %s.%s of type %s"
+                        % (type(node).__name__, attr, type(value).__name__))
+
+    children = []
+    for slot in CHILD_SLOTS[kind]:
+      value = getattr(node, slot)
+      if value is None:
+        tags.append(NONE_TAG)
+      elif isinstance(value, list):
+        tags.append(LIST_TAG)
+        counts.append(len(value))
+        children.extend(value)
+      else:
+        tags.append(ONE_TAG)
+        children.append(value)
+    children.reverse()
+    stack.extend(children)
+
+  encoded = [s.encode('utf-8', 'surrogatepass') for s in table]
+  return b''.join([MAGIC, _STREAM.pack(b'B', len(tags)), bytes(tags),
+                   _pack(strings, UNSIGNED_TYPES),
+                   _pack(lines, SIGNED_TYPES),
+                   _pack(counts, UNSIGNED_TYPES),
+                   _pack([len(s) for s in encoded], UNSIGNED_TYPES)]
+                  + encoded)
+
+def loads(data):
+  '''Deserializes a tree written by dumps.
+
+  Args:
+    data (bytes): Encoded tree
+
+  Returns:
+    c_ast.Node: Root of the AST, equal strings are one object
+
+  Raises:
+    ValueError: When data was not written by dumps
+  '''
+  if not data.startswith(MAGIC):
+    raise ValueError('not a serialized AST')
+  offset = len(MAGIC)
+  typecode, length = _STREAM.unpack_from(data, offset)
+  offset += _STREAM.size
+  tags = data[offset:offset + length]
+  offset += length
+  strings, offset = _unpack(data, offset)
+  lines, offset = _unpack(data, offset)
+  counts, offset = _unpack(data, offset)
+  lengths, offset = _unpack(data, offset)
+  table = []
+  for length in lengths:
+    table.append(data[offset:offset + length].decode('utf-8', 'surrogatepass'))
+    offset += length
+  strings = [table[string_id] for string_id in strings]
+
+  tag_i = string_i = line_i = count_i = 0
+  coord_file = None
+  coord_line = 0
+
+  def get_coord():
+    nonlocal tag_i, string_i, line_i, count_i, coord_file, coord_line
+    tag = tags[tag_i]
+    tag_i += 1
+    if tag == NO_COORD:
+      return None
+    if tag & NEW_FILE:
+      coord_file = strings[string_i]
+      string_i += 1
+    coord_line += lines[line_i]
+    line_i += 1
+    column = None
+    if tag & HAS_COLUMN:
+      column = counts[count_i]
+      count_i += 1
+    return Coord(coord_file, coord_line, column)
+
+  root = None
+  # (object, key) that each next node fills, a slot name or a list index
+  pending = [(None, None)]
+  while pending:
+    owner, key = pending.pop()
+    kind = tags[tag_i]
+    tag_i += 1
+    if kind == NONE_KIND:
+      node = None
+    else:
+      klass = KIND_CLASSES[kind]
+      node = klass.__new__(klass)
+
+      node.coord = get_coord()
+      for slot in COORD_SLOTS[kind]:
+        setattr(node, slot, get_coord())
+
+      for attr in ATTR_NAMES[kind]:
+        tag = tags[tag_i]
+        tag_i += 1
+        if tag == NONE_TAG:
+          value = None
+        elif tag == ONE_TAG:
+          value = strings[string_i]
+          string_i += 1
+        else:
+          count = counts[count_i]
+          count_i += 1
+          value = strings[string_i:string_i + count]
+          string_i += count
+        setattr(node, attr, value)
+
+      children = []
+      for slot in CHILD_SLOTS[kind]:
+        tag = tags[tag_i]
+        tag_i += 1
+        if tag == NONE_TAG:
+          setattr(node, slot, None)
+        elif tag == ONE_TAG:
+          setattr(node, slot, None)
+          children.append((node, slot))
+        else:
+          count = counts[count_i]
+          count_i += 1
+          items = [None] * count
+          setattr(node, slot, items)
+          children.extend((items, i) for i in range(count))
+      children.reverse()
+      pending.extend(children)
+
+    if owner is None:
+      root = node
+    elif isinstance(key, int):
+      owner[key] = node
+    else:
+      setattr(owner, key, node)
+  return root
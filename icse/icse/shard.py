@@ -0,0 +1,131 @@
+"""Static sharding of a corpus across several nodes, and merge of the shard
+outputs.
+
+Every node discovers the same file list and keeps its own part of it. Files
+are grouped by basename, since the csv output identifies files by basename,
+and the groups are assigned largest first to the least loaded shard, ties
+broken by a stable hash of the name. The partition only depends on the
+corpus, so every node computes the same one.
+
+The csv output lists files in (basename, path) order, so the shard outputs
+can be merged group by group without loading them in memory, and the merged
+output is identical to the output of a single node run.
+"""
+
+import os
+import heapq
+import hashlib
+
+from icse import compress
+from icse import extractor
+
+def parse_shard(text):
+  '''Parses an 'i/N' shard specification, i counts from 1.
+
+  Args:
+    text (string): Shard specification
+
+  Returns:
+    tuple: (index, count), index counts from 0
+
+  Raises:
+    ValueError: When text is not a valid specification
+  '''
+  index, count = [int(x) for x in text.split('/')]
+  if count < 1 or not 1 <= index <= count:
+    raise ValueError("invalid shard '%s'" % text)
+  return (index - 1, count)
+
+def _stable_hash(name):
+  '''Returns a hash of name that is the same on every node and run.'''
+  return hashlib.md5(name.encode('utf-8')).hexdigest()
+
+def shard_files(files, index, count):
+  '''Returns the files that belong to a shard.
+
+  Args:
+    files (list): Paths of all the files of the corpus
+    index (int): Shard to return, counts from 0
+    count (int): Number of shards
+
+  Returns:
+    list: Paths of the files of the shard, in the order of files
+  '''
+  groups = {}
+  for filename in files:
+    groups.setdefault(os.path.basename(filename), []).append(filename)
+
+  sizes = {}
+  for name, group in groups.items():
+    size = 0
+    for filename in group:
+      try:
+        size += os.path.getsize(filename)
+      except OSError:
+        pass
+    sizes[name] = size
+
+  loads = [(0, i) for i in range(count)]
+  selected = set()
+  for name in sorted(groups, key=lambda n: (-sizes[n], _stable_hash(n))):
+    load, shard = heapq.heappop(loads)
+    if shard == index:
+      selected.update(groups[name])
+    heapq.heappush(loads, (load + sizes[name], shard))
+
+  return [f for f in files if f in selected]
+
+def _csv_groups(f):
+  '''Reads the groups of lines of one file from a csv output.
+
+  Args:
+    f (file): Opened csv output, see Extractor.to_csv, after its header
+
+  Returns:
+    generator: (basename, lines) of each group
+  '''
+  f.readline()
+  lines = []
+  for line in f:
+    if line == '\n':
+      if lines:
+        yield (lines[0].split(',', 1)[0], lines)
+      lines = []
+    else:
+      lines.append(line)
+  if lines:
+    yield (lines[0].split(',', 1)[0], lines)
+
+def merge_csv(inputs, csv_output_path):
+  '''k-way merges csv outputs of the shards into one csv output. Only one
+  group of lines per input is held in memory. Compressed inputs and output
+  are handled by icse.compress.
+
+  Args:
+    inputs (list): Paths of the csv outputs of the shards
+    csv_output_path (string): Output filename
+
+  Returns:
+    None
+
+  Raises:
+    ValueError: When an input is not a csv output
+  '''
+  files = [compress.open_file(path, 'r') for path in inputs]
+  try:
+    for path, f in zip(inputs, files):
+      try:
+        header = f.readline()
+      except UnicodeDecodeError:
+        header = None
+      if header != extractor.CSV_HEADER + '\n':
+        raise ValueError("'%s' is not a csv output" % path)
+    streams = [_csv_groups(f) for f in files]
+    with compress.open_file(csv_output_path, 'w') as out:
+      out.write(str(extractor.CSV_HEADER + '\n\n'))
+      for name, lines in heapq.merge(*streams, key=lambda group: group[0]):
+        out.write(''.join(lines))
+        out.write('\n')
+  finally:
+    for f in files:
+      f.close()
@@ -0,0 +1,317 @@
+"""Output sinks of the extracted sites.
+
+A sink receives the sites of each file as soon as the file is finished and
+runs in a background thread (see BackgroundWriter), so output I/O overlaps
+with parsing. Available formats:
+
+  csv     The historical 'filename, type, line, value' layout, followed by
+          the enclosing function, its start and end lines and its kind.
+          Files are listed in (basename, path) order, so this sink holds
+          the sites until it is closed.
+  sqlite  Incremental database, see icse.store.
+  jsonl   One JSON object per site with every Site field.
+  binary  Length-prefixed records with a string table, for fast reading
+          by other tools, see read_binary.
+
+Binary layout: the file starts with BINARY_MAGIC, then records made of a
+little-endian uint32 payload length, a uint8 kind and the payload:
+
+  kind 0 (string)  UTF-8 bytes, the string gets the next id, from 0
+  kind 1 (site)    uint32 file, filename, type ids, int32 line, column,
+                   uint32 code, info, function ids, int32 function start,
+                   end lines, uint32 function kind id; NO_STRING for a
+                   missing string, -1 for a missing line or column
+
+file is the path of the processed file, filename is the file the site is in.
+
+Outputs whose name ends with .gz, .bz2 or .xz are compressed, see
+icse.compress. The csv, jsonl and binary sinks can list the sites of each
+file grouped by enclosing function, see functions.group_sites.
+"""
+
+import json
+import queue
+import struct
+import threading
+
+from icse import site
+from icse import store
+from icse import extractor
+from icse import compress
+from icse import functions
+
+#Maximum number of finished files waiting for the background writer
+QUEUE_SIZE = 256
+
+BINARY_MAGIC = b'ICSESITE\x01'
+NO_STRING = 0xffffffff
+
+_HEADER = struct.Struct('<IB')
+_SITE = struct.Struct('<IIIiiIIIiiI')
+
+def _line(value):
+  '''Returns a line or column as stored in the binary output.'''
+  return -1 if value is None else value
+
+class Sink:
+  """Base class of the sinks."""
+
+  def write_file(self, filename, writes, reads):
+    """Receives the sites of a finished file.
+
+    Args:
+      filename (string): Path of the processed file
+      writes (list): Buffer write Sites of the file
+      reads (list): Buffer read Sites of the file
+
+    Returns:
+      None
+    """
+    pass
+
+  def write_failure(self, failure):
+    """Receives a file that failed.
+
+    Args:
+      failure (Failure): The failure of the file
+
+    Returns:
+      None
+    """
+    pass
+
+  def close(self):
+    """Finalizes the output.
+
+    Args:
+      None
+
+    Returns:
+      None
+    """
+    pass
+
+class CsvSink(Sink):
+  """Writes the csv layout of Extractor.to_csv when closed."""
+
+  def __init__(self, path, by_function=False):
+    self.path = path
+    self.by_function = by_function
+    self.writes = []
+    self.reads = []
+
+  def write_file(self, filename, writes, reads):
+    self.writes += writes
+    self.reads += reads
+
+  def close(self):
+    extractor.Extractor.to_csv(self.writes + self.reads, self.path,
+                               self.by_function)
+
+class SqliteSink(Sink):
+  """Updates an icse.store database file by file."""
+
+  def __init__(self, path, site_types='all'):
+    self.store = store.SiteStore(path, site_types)
+    self.unchanged = self.store.is_unchanged
+
+  def write_file(self, filename, writes, reads):
+    self.store.add(filename, writes + reads)
+
+  def write_failure(self, failure):
+    self.store.remove([failure.filename])
+
+  def close(self):
+    self.store.close()
+
+class JsonlSink(Sink):
+  """Writes one JSON object per site."""
+
+  def __init__(self, path, by_function=False):
+    self.f = compress.open_file(path, 'w')
+    self.by_function = by_function
+
+  def write_file(self, filename, writes, reads):
+    sites = writes + reads
+    if self.by_function:
+      sites = functions.group_sites(sites)
+    lines = []
+    for s in sites:
+      lines.append(json.dumps({'file': filename, 'filename': s.filename,
+                               'type': s.site_type, 'line': s.line,
+                               'column': s.column, 'code': s.code,
+                               'info': s.info,
+                               'function': s.function,
+                               'function_start': s.function_start,
+                               'function_end': s.function_end,
+                               'function_kind': s.function_kind}) + '\n')
+    self.f.write(''.join(lines))
+
+  def close(self):
+    self.f.close()
+
+class BinarySink(Sink):
+  """Writes length-prefixed site records with a string table."""
+
+  def __init__(self, path, by_function=False):
+    self.f = compress.open_file(path, 'wb')
+    self.f.write(BINARY_MAGIC)
+    self.by_function = by_function
+    self.strings = {}
+
+  def _string(self, value, out):
+    """Returns the id of a string, adds the string record to out when the
+    string is new."""
+    if value is None:
+      return NO_STRING
+    string_id = self.strings.get(value)
+    if string_id is None:
+      string_id = self.strings[value] = len(self.strings)
+      data = value.encode('utf-8')
+      out.append(_HEADER.pack(len(data), 0))
+      out.append(data)
+    return string_id
+
+  def write_file(self, filename, writes, reads):
+    out = []
+    file_id = self._string(filename, out)
+    sites = writes + reads
+    if self.by_function:
+      sites = functions.group_sites(sites)
+    for s in sites:
+      record = _SITE.pack(file_id, self._string(s.filename, out),
+                          self._string(s.site_type, out),
+                          _line(s.line), _line(s.column),
+                          self._string(s.code, out),
+                          self._string(s.info, out),
+                          self._string(s.function, out),
+                          _line(s.function_start), _line(s.function_end),
+                          self._string(s.function_kind, out))
+      out.append(_HEADER.pack(len(record), 1))
+      out.append(record)
+    self.f.write(b''.join(out))
+
+  def close(self):
+    self.f.close()
+
+def read_binary(path):
+  '''Reads a binary output.
+
+  Args:
+    path (string): Binary output file
+
+  Returns:
+    generator: (file, Site) of each site, file is the processed file
+
+  Raises:
+    ValueError: When path is not a binary output
+  '''
+  with compress.open_file(path, 'rb') as f:
+    data = f.read()
+  if not data.startswith(BINARY_MAGIC):
+    raise ValueError("'%s' is not a binary site output" % path)
+  strings = []
+  offset = len(BINARY_MAGIC)
+  unpack_header = _HEADER.unpack_from
+  unpack_site = _SITE.unpack_from
+  while offset < len(data):
+    length, kind = unpack_header(data, offset)
+    offset += _HEADER.size
+    if kind == 0:
+      strings.append(data[offset:offset + length].decode('utf-8'))
+    elif kind == 1:
+      (f, filename, site_type, line, column, code, info, function,
+       function_start, function_end, function_kind) = unpack_site(data, offset)
+      yield (strings[f], site.Site(strings[filename], strings[site_type],
+                                   None if line < 0 else line,
+                                   None if code == NO_STRING else strings[code],
+                                   None if info == NO_STRING else strings[info],
+                                   None if column < 0 else column,
+                                   None if function == NO_STRING else strings[function],
+                                   None if function_start < 0 else function_start,
+                                   None if function_end < 0 else function_end,
+                                   None if function_kind == NO_STRING
+                                   else strings[function_kind]))
+    offset += length
+
+SINKS = {'csv': CsvSink, 'sqlite': SqliteSink, 'jsonl': JsonlSink,
+         'binary': BinarySink}
+
+class BackgroundWriter:
+  """Runs a sink in a background thread.
+
+  Attributes:
+    sink (Sink): The sink, one of SINKS
+    unchanged (function): is_unchanged of the sqlite sink, None otherwise
+  """
+
+  def __init__(self, sink):
+    """Starts the writer thread.
+
+    Args:
+      sink (Sink): The sink
+
+    Returns:
+      None
+    """
+    self.sink = sink
+    self.unchanged = getattr(sink, 'unchanged', None)
+    self.queue = queue.Queue(QUEUE_SIZE)
+    self.error = None
+    self.thread = threading.Thread(None, target=self._run)
+    self.thread.daemon = True
+    self.thread.start()
+
+  def _run(self):
+    while True:
+      item = self.queue.get()
+      if item is None:
+        break
+      if self.error is not None:
+        continue
+      try:
+        item[0](*item[1:])
+      except Exception as e:
+        self.error = e
+
+  def write_file(self, filename, writes, reads):
+    """Queues the sites of a finished file, see Sink.write_file."""
+    self.queue.put((self.sink.write_file, filename, writes, reads))
+
+  def write_failure(self, failure):
+    """Queues a file that failed, see Sink.write_failure."""
+    self.queue.put((self.sink.write_failure, failure))
+
+  def close(self):
+    """Waits for the queued files, closes the sink and raises the error the
+    sink may have hit.
+
+    Args:
+      None
+
+    Returns:
+      None
+    """
+    self.queue.put((self.sink.close,))
+    self.queue.put(None)
+    self.thread.join()
+    if self.error is not None:
+      raise self.error
+
+def open_sink(output_format, path, site_types='all', by_function=False):
+  '''Creates the sink of a format, running in a background thread.
+
+  Args:
+    output_format (string): One of SINKS
+    path (string): Output file
+    site_types (optional[string]): Type of site(s) extracted by the run, and
+      whatever else decides which sites of a file are stored
+    by_function (optional[bool]): Group the sites of each file by enclosing
+      function, the sqlite sink has no order
+
+  Returns:
+    BackgroundWriter: The sink
+  '''
+  if output_format == 'sqlite':
+    return BackgroundWriter(SqliteSink(path, site_types))
+  return BackgroundWriter(SINKS[output_format](path, by_function))
@@ -11,6 +11,11 @@ class Site:
       line,
       code,
       info=None,
+      column=None,
+      function=None,
+      function_start=None,
+      function_end=None,
+      function_kind=None,
       ):
     """Constructor for Site class:
 
@@ -20,9 +25,20 @@ class Site:
     line is the line where the site is present in filename.
     code is the entire line where the site is.
     info is the variable causing the possible bug.
+    column is the column of the site in line.
+    function is the name of the function the site is in, None outside of
+    functions.
+    function_start and function_end are the lines of the function's
+    declarator and of the closing brace of its body.
+    function_kind is 'bad', 'good' or 'helper', see icse.functions.
     """
     self.filename = filename
     self.site_type = site_type
     self.line = line
     self.code = code
     self.info = info
+    self.column = column
+    self.function = function
+    self.function_start = function_start
+    self.function_end = function_end
+    self.function_kind = function_kind
@@ -0,0 +1,220 @@
+"""SQLite store of the extracted sites.
+
+Sites are written in large transactions into a WAL mode database with
+indexes on file, site type, line and info, so downstream questions are a
+query instead of a pass over a flat file:
+
+  SELECT files.path, sites.line FROM sites JOIN files ON files.id = file_id
+  WHERE type = 'buffer_read' AND info = 'data' AND path LIKE '%CWE126%'
+
+Every file is stored with the hash of its content and of the extracted site
+types. An incremental run skips the files whose hash did not change and only
+replaces the rows of the files it processed.
+"""
+
+import os
+import sqlite3
+import hashlib
+
+#Number of site rows inserted per transaction
+STORE_BATCH = 50000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+  id INTEGER PRIMARY KEY,
+  path TEXT UNIQUE NOT NULL,
+  hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sites (
+  file_id INTEGER NOT NULL REFERENCES files(id),
+  type TEXT NOT NULL,
+  line INTEGER,
+  col INTEGER,
+  code TEXT,
+  info TEXT,
+  function TEXT,
+  function_start INTEGER,
+  function_end INTEGER,
+  function_kind TEXT
+);
+CREATE INDEX IF NOT EXISTS sites_file_line ON sites(file_id, line);
+CREATE INDEX IF NOT EXISTS sites_type_line ON sites(type, line);
+CREATE INDEX IF NOT EXISTS sites_info ON sites(info);
+'''
+
+def content_hash(filename, site_types):
+  '''Returns the hash of the content of a file and of the site types.
+
+  Args:
+    filename (string): Path of the file
+    site_types (string): Type of site(s) extracted from the file
+
+  Returns:
+    string: Hex digest
+  '''
+  digest = hashlib.sha1(site_types.encode('utf-8'))
+  with open(filename, 'rb') as f:
+    digest.update(f.read())
+  return digest.hexdigest()
+
+class SiteStore:
+  """SQLite database of sites, updated file by file.
+
+  Attributes:
+    path (string): Database file
+    site_types (string): Type of site(s) extracted by the run
+    db (Connection): Connection to the database
+    hashes (dict): Hash of the files checked by is_unchanged
+    stored (dict): Hash of the files in the database when it was opened
+    pending (list): (path, sites) of the files not written yet
+    pending_rows (int): Number of sites in pending
+  """
+
+  def __init__(self, path, site_types='all'):
+    """Opens or creates the database.
+
+    Args:
+      path (string): Database file
+      site_types (optional[string]): Type of site(s) extracted by the run
+
+    Returns:
+      None
+    """
+    self.path = path
+    self.site_types = site_types
+    # the sinks write from a background thread, one thread at a time
+    self.db = sqlite3.connect(path, check_same_thread=False)
+    self.db.execute('PRAGMA journal_mode=WAL')
+    self.db.execute('PRAGMA synchronous=NORMAL')
+    self.db.executescript(SCHEMA)
+    self.hashes = {}
+    self.stored = dict(self.db.execute('SELECT path, hash FROM files'))
+    self.pending = []
+    self.pending_rows = 0
+
+  def is_unchanged(self, filename):
+    """Tells whether the stored sites of a file are up to date.
+
+    Args:
+      filename (string): Path of the file
+
+    Returns:
+      bool: True when the file and the site types did not change since the
+        file was stored
+    """
+    try:
+      self.hashes[filename] = content_hash(filename, self.site_types)
+    except OSError:
+      return False
+    return self.stored.get(filename) == self.hashes[filename]
+
+  def update(self, filenames, sites, failed=()):
+    """Replaces the rows of the processed files by their new sites.
+
+    Notes: Files that failed or no longer exist are removed from the
+      database.
+
+    Args:
+      filenames (list): Paths of the files processed by the run
+      sites (list): Sites of these files
+      failed (optional[list]): Paths of the files that failed
+
+    Returns:
+      None
+    """
+    by_file = dict((f, []) for f in filenames)
+    for s in sites:
+      by_file.setdefault(s.filename, []).append(s)
+    for path, file_sites in by_file.items():
+      self.add(path, file_sites)
+    self.remove(failed)
+    self.flush()
+
+  def add(self, path, sites):
+    """Queues the new sites of a processed file. Files are written in
+    transactions of about STORE_BATCH rows, a file's hash is committed
+    together with its rows.
+
+    Args:
+      path (string): Path of the file
+      sites (list): Sites of the file
+
+    Returns:
+      None
+    """
+    self.pending.append((path, sites))
+    self.pending_rows += len(sites)
+    if self.pending_rows >= STORE_BATCH:
+      self._write(self.pending)
+      self.pending = []
+      self.pending_rows = 0
+
+  def remove(self, paths):
+    """Removes files and their rows, for files that failed.
+
+    Args:
+      paths (list): Paths of the files
+
+    Returns:
+      None
+    """
+    with self.db:
+      for path in paths:
+        if path in self.stored:
+          self._delete(path)
+          self.db.execute('DELETE FROM files WHERE path = ?', (path,))
+
+  def flush(self):
+    """Writes the queued files and removes the files that no longer exist.
+
+    Args:
+      None
+
+    Returns:
+      None
+    """
+    self._write(self.pending)
+    self.pending = []
+    self.pending_rows = 0
+    self.remove([path for path in self.stored if not os.path.exists(path)])
+
+  def _delete(self, path):
+    """Deletes the site rows of a file."""
+    self.db.execute('DELETE FROM sites WHERE file_id = '
+                    '(SELECT id FROM files WHERE path = ?)', (path,))
+
+  def _write(self, chunk):
+    """Replaces the rows of a chunk of (path, sites) in one transaction."""
+    with self.db:
+      for path, file_sites in chunk:
+        file_hash = self.hashes.get(path)
+        if file_hash is None:
+          try:
+            file_hash = content_hash(path, self.site_types)
+          except OSError:
+            file_hash = ''
+        self._delete(path)
+        self.db.execute('INSERT INTO files (path, hash) VALUES (?, ?) '
+                        'ON CONFLICT(path) DO UPDATE SET hash = excluded.hash',
+                        (path, file_hash))
+        file_id = self.db.execute('SELECT id FROM files WHERE path = ?',
+                                  (path,)).fetchone()[0]
+        self.db.executemany('INSERT INTO sites (file_id, type, line, col, code, info, '
+                            'function, function_start, function_end, function_kind) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            [(file_id, s.site_type, s.line, s.column, s.code,
+                              s.info, s.function, s.function_start,
+                              s.function_end, s.function_kind)
+                             for s in file_sites])
+
+  def close(self):
+    """Writes the queued files and closes the database.
+
+    Args:
+      None
+
+    Returns:
+      None
+    """
+    self.flush()
+    self.db.close()
@@ -232,10 +232,11 @@ class Cast(Node):
     attr_names = ()
 
 class Compound(Node):
-    __slots__ = ('block_items', 'coord', '__weakref__')
-    def __init__(self, block_items, coord=None):
+    __slots__ = ('block_items', 'coord', 'end_coord', '__weakref__')
+    def __init__(self, block_items, coord=None, end_coord=None):
         self.block_items = block_items
         self.coord = coord
+        self.end_coord = end_coord
 
     def children(self):
         nodelist = []
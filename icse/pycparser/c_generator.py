@@ -405,3 +405,444 @@ class CGenerator(object):
         """
         return isinstance(n,(   c_ast.Constant, c_ast.ID, c_ast.ArrayRef,
                                 c_ast.StructRef, c_ast.FuncCall))
+
+
+class CStreamGenerator(object):
+    """ Generates the same code as CGenerator, without recursion and
+        without building intermediate strings.
+
+        The tree is walked with an explicit stack of work items. Each
+        _emit_* method returns, in output order, the items a node expands
+        to:
+
+        *   a string, written to the output as is;
+        *   a node (or None), to be expanded in turn;
+        *   a tuple (method, args...), a deferred call to one of the
+            helpers below, for the output that depends on the state of
+            the generator when it is reached (indentation).
+
+        The output fragments go to a single list, joined once by generate
+        or written in batches to a file object by write, so very large
+        translation units need not be held as one string.
+    """
+    def __init__(self):
+        # Indentation of the statements, as CGenerator.indent_level
+        self.indent_level = 0
+        self._emitters = {}
+
+    def generate(self, node):
+        """ Returns the code CGenerator.visit returns for node.
+        """
+        out = []
+        self._walk(node, out.append, None, 0)
+        return ''.join(out)
+
+    visit = generate
+
+    def write(self, node, stream, batch=4096):
+        """ Writes the code of node to stream, a file object opened for
+            text, batch fragments at a time.
+        """
+        out = []
+
+        def flush():
+            stream.write(''.join(out))
+            del out[:]
+
+        self._walk(node, out.append, flush, batch)
+        flush()
+
+    def _walk(self, node, append, flush, batch):
+        emitters = self._emitters
+        stack = [node]
+        pop = stack.pop
+        extend = stack.extend
+        count = 0
+        while stack:
+            item = pop()
+            cls = item.__class__
+            if cls is str:
+                append(item)
+                count += 1
+                if count == batch:
+                    flush()
+                    count = 0
+                continue
+            if item is None:
+                continue
+            if cls is c_ast.ID or cls is c_ast.Constant:
+                append(item.name if cls is c_ast.ID else item.value)
+                count += 1
+                if count == batch:
+                    flush()
+                    count = 0
+                continue
+            if cls is tuple:
+                items = item[0](*item[1:])
+            else:
+                emitter = emitters.get(cls)
+                if emitter is None:
+                    emitter = emitters[cls] = getattr(
+                        self, '_emit_' + cls.__name__, self._emit_generic)
+                items = emitter(item)
+            if items:
+                items.reverse()
+                extend(items)
+
+    # Deferred helpers
+
+    def _indent(self, extra=0):
+        return [' ' * (self.indent_level + extra)]
+
+    def _add_indent(self, amount):
+        self.indent_level += amount
+
+    def _set_indent(self, level):
+        self.indent_level = level
+
+    def _stmt(self, n, add_indent=False):
+        """ Same as CGenerator._generate_stmt. The indentation is computed
+            when the statement is reached.
+        """
+        typ = type(n)
+        indent = ' ' * (self.indent_level + 2 if add_indent
+                        else self.indent_level)
+        if typ in _SEMICOLON_STMTS:
+            return [indent, n, ';\n']
+        elif typ is c_ast.Compound:
+            return [n]
+        else:
+            return [indent, n, '\n']
+
+    def _decl_no_type(self, n):
+        return self._emit_Decl(n, no_type=True)
+
+    # Items of the helpers of CGenerator
+
+    def _expr(self, n):
+        """ Items of CGenerator._visit_expr.
+        """
+        if isinstance(n, c_ast.InitList):
+            return ['{', n, '}']
+        elif isinstance(n, c_ast.ExprList):
+            return ['(', n, ')']
+        else:
+            return [n]
+
+    def _unless_simple(self, n):
+        """ Items of CGenerator._parenthesize_unless_simple.
+        """
+        items = self._expr(n)
+        if isinstance(n, _SIMPLE_NODES):
+            return items
+        return ['('] + items + [')']
+
+    def _joined(self, nodes, expr=False):
+        """ Items of ', '.join of the code of nodes.
+        """
+        items = []
+        for i, n in enumerate(nodes):
+            if i:
+                items.append(', ')
+            if expr:
+                items.extend(self._expr(n))
+            else:
+                items.append(n)
+        return items
+
+    def _decl(self, n):
+        """ Items of CGenerator._generate_decl.
+        """
+        items = []
+        if n.funcspec: items.append(' '.join(n.funcspec) + ' ')
+        if n.storage: items.append(' '.join(n.storage) + ' ')
+        items.extend(self._type(n.type))
+        return items
+
+    def _type(self, n):
+        """ Items of CGenerator._generate_type. The modifiers are collected
+            in a loop, and the declarator is built as the text the
+            modifiers put before the name, reversed, then the name, then
+            the text they put after it.
+        """
+        modifiers = []
+        while True:
+            typ = type(n)
+            if typ is c_ast.TypeDecl:
+                break
+            elif typ is c_ast.Decl:
+                return self._decl(n.type)
+            elif typ is c_ast.Typename:
+                n = n.type
+                modifiers = []
+            elif typ is c_ast.IdentifierType:
+                return [' '.join(n.names) + ' ']
+            elif typ in (c_ast.ArrayDecl, c_ast.PtrDecl, c_ast.FuncDecl):
+                modifiers.append(n)
+                n = n.type
+            else:
+                return [n]
+
+        items = []
+        if n.quals: items.append(' '.join(n.quals) + ' ')
+        items.append(n.type)
+        if not (n.declname or modifiers):
+            return items
+
+        before = []
+        after = []
+        for i, modifier in enumerate(modifiers):
+            if isinstance(modifier, c_ast.PtrDecl):
+                if modifier.quals:
+                    before.append('* %s ' % ' '.join(modifier.quals))
+                else:
+                    before.append('*')
+                continue
+            if i != 0 and isinstance(modifiers[i - 1], c_ast.PtrDecl):
+                before.append('(')
+                after.append(')')
+            if isinstance(modifier, c_ast.ArrayDecl):
+                after.extend(('[', modifier.dim, ']'))
+            else:
+                after.extend(('(', modifier.args, ')'))
+        before.reverse()
+        items.append(' ')
+        items.extend(before)
+        if n.declname: items.append(n.declname)
+        items.extend(after)
+        return items
+
+    def _struct_union(self, n, name):
+        """ Items of CGenerator._generate_struct_union.
+        """
+        items = [name + ' ' + (n.name or '')]
+        if n.decls:
+            items.extend(('\n', (self._indent,), (self._add_indent, 2),
+                          '{\n'))
+            items.extend((self._stmt, decl) for decl in n.decls)
+            items.extend(((self._add_indent, -2), (self._indent,), '}'))
+        return items
+
+    # Items of each node, as its CGenerator.visit_* method
+
+    def _emit_generic(self, n):
+        return [c for c_name, c in n.children()]
+
+    def _emit_Constant(self, n):
+        return [n.value]
+
+    def _emit_ID(self, n):
+        return [n.name]
+
+    def _emit_Pragma(self, n):
+        if n.string:
+            return ['#pragma ' + n.string]
+        return ['#pragma']
+
+    def _emit_ArrayRef(self, n):
+        return self._unless_simple(n.name) + ['[', n.subscript, ']']
+
+    def _emit_StructRef(self, n):
+        return self._unless_simple(n.name) + [n.type, n.field]
+
+    def _emit_FuncCall(self, n):
+        return self._unless_simple(n.name) + ['(', n.args, ')']
+
+    def _emit_UnaryOp(self, n):
+        if n.op == 'p++':
+            return self._unless_simple(n.expr) + ['++']
+        elif n.op == 'p--':
+            return self._unless_simple(n.expr) + ['--']
+        elif n.op == 'sizeof':
+            return ['sizeof(', n.expr, ')']
+        else:
+            return [n.op] + self._unless_simple(n.expr)
+
+    def _emit_BinaryOp(self, n):
+        return (self._unless_simple(n.left) + [' ' + n.op + ' '] +
+                self._unless_simple(n.right))
+
+    def _emit_Assignment(self, n):
+        items = [n.lvalue, ' ' + n.op + ' '] + self._expr(n.rvalue)
+        if isinstance(n.rvalue, c_ast.Assignment):
+            items[2:] = ['('] + items[2:] + [')']
+        return items
+
+    def _emit_IdentifierType(self, n):
+        return [' '.join(n.names)]
+
+    def _emit_Decl(self, n, no_type=False):
+        items = [n.name] if no_type else self._decl(n)
+        if n.bitsize: items.extend((' : ', n.bitsize))
+        if n.init:
+            items.append(' = ')
+            items.extend(self._expr(n.init))
+        return items
+
+    def _emit_DeclList(self, n):
+        items = [n.decls[0]]
+        for decl in n.decls[1:]:
+            items.extend((', ', (self._decl_no_type, decl)))
+        return items
+
+    def _emit_Typedef(self, n):
+        items = []
+        if n.storage: items.append(' '.join(n.storage) + ' ')
+        items.extend(self._type(n.type))
+        return items
+
+    def _emit_Cast(self, n):
+        return (['('] + self._type(n.to_type) + [') '] +
+                self._unless_simple(n.expr))
+
+    def _emit_ExprList(self, n):
+        return self._joined(n.exprs, expr=True)
+
+    def _emit_InitList(self, n):
+        return self._joined(n.exprs, expr=True)
+
+    def _emit_Enum(self, n):
+        items = ['enum']
+        if n.name: items.append(' ' + n.name)
+        if n.values:
+            items.append(' {')
+            enumerators = n.values.enumerators
+            for i, enumerator in enumerate(enumerators):
+                items.append(enumerator.name)
+                if enumerator.value:
+                    items.extend((' = ', enumerator.value))
+                if i != len(enumerators) - 1:
+                    items.append(', ')
+            items.append('}')
+        return items
+
+    def _emit_FuncDef(self, n):
+        # CGenerator visits the K&R parameter declarations after the body,
+        # with the indentation back to 0, as here.
+        items = [n.decl, (self._set_indent, 0), '\n']
+        if n.param_decls:
+            for p in n.param_decls:
+                items.extend((p, ';\n'))
+        items.extend((n.body, '\n'))
+        return items
+
+    def _emit_FileAST(self, n):
+        items = []
+        for ext in n.ext:
+            items.append(ext)
+            if isinstance(ext, c_ast.Pragma):
+                items.append('\n')
+            elif not isinstance(ext, c_ast.FuncDef):
+                items.append(';\n')
+        return items
+
+    def _emit_Compound(self, n):
+        items = [(self._indent,), '{\n', (self._add_indent, 2)]
+        if n.block_items:
+            items.extend((self._stmt, stmt) for stmt in n.block_items)
+        items.extend(((self._add_indent, -2), (self._indent,), '}\n'))
+        return items
+
+    def _emit_EmptyStatement(self, n):
+        return [';']
+
+    def _emit_ParamList(self, n):
+        return self._joined(n.params)
+
+    def _emit_Return(self, n):
+        if n.expr:
+            return ['return ', n.expr, ';']
+        return ['return;']
+
+    def _emit_Break(self, n):
+        return ['break;']
+
+    def _emit_Continue(self, n):
+        return ['continue;']
+
+    def _emit_TernaryOp(self, n):
+        return (self._expr(n.cond) + [' ? '] + self._expr(n.iftrue) +
+                [' : '] + self._expr(n.iffalse))
+
+    def _emit_If(self, n):
+        items = ['if (', n.cond, ')\n',
+                 (self._stmt, n.iftrue, True)]
+        if n.iffalse:
+            items.extend(((self._indent,), 'else\n',
+                          (self._stmt, n.iffalse, True)))
+        return items
+
+    def _emit_For(self, n):
+        items = ['for (']
+        if n.init: items.append(n.init)
+        items.append(';')
+        if n.cond: items.extend((' ', n.cond))
+        items.append(';')
+        if n.next: items.extend((' ', n.next))
+        items.extend((')\n', (self._stmt, n.stmt, True)))
+        return items
+
+    def _emit_While(self, n):
+        return ['while (', n.cond, ')\n',
+                (self._stmt, n.stmt, True)]
+
+    def _emit_DoWhile(self, n):
+        return ['do\n', (self._stmt, n.stmt, True), (self._indent,),
+                'while (', n.cond, ');']
+
+    def _emit_Switch(self, n):
+        return ['switch (', n.cond, ')\n', (self._stmt, n.stmt, True)]
+
+    def _emit_Case(self, n):
+        items = ['case ', n.expr, ':\n']
+        items.extend((self._stmt, stmt, True) for stmt in n.stmts)
+        return items
+
+    def _emit_Default(self, n):
+        items = ['default:\n']
+        items.extend((self._stmt, stmt, True) for stmt in n.stmts)
+        return items
+
+    def _emit_Label(self, n):
+        return [n.name + ':\n', (self._stmt, n.stmt)]
+
+    def _emit_Goto(self, n):
+        return ['goto ' + n.name + ';']
+
+    def _emit_EllipsisParam(self, n):
+        return ['...']
+
+    def _emit_Struct(self, n):
+        return self._struct_union(n, 'struct')
+
+    def _emit_Typename(self, n):
+        return self._type(n.type)
+
+    def _emit_Union(self, n):
+        return self._struct_union(n, 'union')
+
+    def _emit_NamedInitializer(self, n):
+        items = []
+        for name in n.name:
+            if isinstance(name, c_ast.ID):
+                items.append('.' + name.name)
+            elif isinstance(name, c_ast.Constant):
+                items.append('[' + name.value + ']')
+        items.append(' = ')
+        items.extend(self._expr(n.expr))
+        return items
+
+    def _emit_FuncDecl(self, n):
+        return self._type(n)
+
+
+# Statements CGenerator._generate_stmt ends with a semicolon
+_SEMICOLON_STMTS = (
+    c_ast.Decl, c_ast.Assignment, c_ast.Cast, c_ast.UnaryOp,
+    c_ast.BinaryOp, c_ast.TernaryOp, c_ast.FuncCall, c_ast.ArrayRef,
+    c_ast.StructRef, c_ast.Constant, c_ast.ID, c_ast.Typedef,
+    c_ast.ExprList)
+
+# Nodes that CGenerator._is_simple_node accepts
+_SIMPLE_NODES = (c_ast.Constant, c_ast.ID, c_ast.ArrayRef, c_ast.StructRef,
+                 c_ast.FuncCall)
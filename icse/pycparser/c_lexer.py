@@ -11,6 +11,7 @@ import sys
 
 from .ply import lex
 from .ply.lex import TOKEN
+from .c_scanner import CScanner
 
 
 class CLexer(object):
@@ -23,7 +24,7 @@ class CLexer(object):
         directives.
     """
     def __init__(self, error_func, on_lbrace_func, on_rbrace_func,
-                 type_lookup_func):
+                 type_lookup_func, track_columns=True, scanner='ply'):
         """ Create a new Lexer.
 
             error_func:
@@ -39,16 +40,31 @@ class CLexer(object):
                 A type lookup function. Given a string, it must
                 return True IFF this string is a name of a type
                 that was defined with a typedef earlier.
+
+            track_columns:
+                Set the column attribute of the tokens, from the
+                offset of the current line start that the lexer keeps
+                as it consumes newlines. Set to False when only line
+                numbers are needed.
+
+            scanner:
+                'ply' runs the rules with PLY's lexer runtime, 'fast'
+                with CScanner, which returns the same tokens faster.
         """
         self.error_func = error_func
         self.on_lbrace_func = on_lbrace_func
         self.on_rbrace_func = on_rbrace_func
         self.type_lookup_func = type_lookup_func
         self.filename = ''
+        self.track_columns = track_columns
+        self.scanner = scanner
 
         # Keeps track of the last token returned from self.token()
         self.last_token = None
 
+        # Offset in the input of the start of the current line
+        self.line_start = 0
+
         # Allow either "# line" or "# <num>" to support GCC's
         # cpp output
         #
@@ -64,6 +80,12 @@ class CLexer(object):
             __init__
         """
         self.lexer = lex.lex(object=self, **kwargs)
+        if self.scanner == 'fast':
+            # CScanner.token does all the work of token()
+            self.lexer = CScanner(self, self.lexer)
+            self.token = self.lexer.token
+        elif self.scanner != 'ply':
+            raise ValueError("unknown scanner '%s'" % self.scanner)
 
     def reset_lineno(self):
         """ Resets the internal line number counter of the lexer.
@@ -72,14 +94,19 @@ class CLexer(object):
 
     def input(self, text):
         self.lexer.input(text)
+        self.line_start = 0
 
     def token(self):
         self.last_token = self.lexer.token()
+        if self.track_columns and self.last_token is not None:
+            self.last_token.column = self.last_token.lexpos - self.line_start + 1
         return self.last_token
 
     def find_tok_column(self, token):
         """ Find the column of the token in its line.
         """
+        if token.lexpos >= self.line_start:
+            return token.lexpos - self.line_start + 1
         last_cr = self.lexer.lexdata.rfind('\n', 0, token.lexpos)
         return token.lexpos - last_cr
 
@@ -284,6 +311,7 @@ class CLexer(object):
             if self.pp_filename is not None:
                 self.filename = self.pp_filename
 
+        self.line_start = t.lexpos + 1
         t.lexer.begin('INITIAL')
 
     def t_ppline_PPLINE(self, t):
@@ -301,6 +329,7 @@ class CLexer(object):
     def t_pppragma_NEWLINE(self, t):
         r'\n'
         t.lexer.lineno += 1
+        self.line_start = t.lexpos + 1
         t.lexer.begin('INITIAL')
 
     def t_pppragma_PPPRAGMA(self, t):
@@ -326,6 +355,7 @@ class CLexer(object):
     def t_NEWLINE(self, t):
         r'\n+'
         t.lexer.lineno += t.value.count("\n")
+        self.line_start = t.lexpos + len(t.value)
 
     # Operators
     t_PLUS              = r'\+'
@@ -0,0 +1,271 @@
+#------------------------------------------------------------------------------
+# pycparser: c_lrparser.py
+#
+# CLRParser: an allocation-lean replacement for the PLY LR parse loop of
+# CParser.
+#
+# Copyright (C) 2008-2015, Eli Bendersky
+# License: BSD
+#------------------------------------------------------------------------------
+from .ply.yacc import YaccSymbol
+
+
+class Production(object):
+    """ The object passed to the grammar actions, in place of PLY's
+        YaccProduction. One is reused for every reduction: p[n] reads the
+        value stack of the parser directly instead of a slice of symbols.
+
+        p[n], p[0] = ..., len(p), p.lineno(n), p.set_lineno(n, lineno) and
+        p.slice[n] behave as with PLY. Negative indices are not supported.
+    """
+    __slots__ = ('values', 'symbols', 'base', 'length', 'result', 'symbol',
+                 'slice', 'lexer', 'parser')
+
+    def __init__(self, values, symbols):
+        self.values = values
+        self.symbols = symbols
+        self.base = 0
+        self.length = 0
+        self.result = None
+        self.symbol = None
+        self.slice = _Slice(self)
+        self.lexer = None
+        self.parser = None
+
+    def __getitem__(self, n):
+        if n:
+            return self.values[self.base + n]
+        return self.result
+
+    def __setitem__(self, n, value):
+        if n:
+            self.values[self.base + n] = value
+        else:
+            self.result = value
+
+    def __len__(self):
+        return self.length
+
+    def lineno(self, n):
+        token = self.symbols[self.base + n] if n else self.symbol
+        return getattr(token, 'lineno', 0) if token is not None else 0
+
+    def set_lineno(self, n, lineno):
+        """ Sets the line number of symbol n. The result of the reduction
+            keeps the line number p.set_lineno(0, ...) gives it, as with
+            PLY: p.lineno() returns it in the actions that take the result
+            as a symbol.
+        """
+        if n:
+            token = self.symbols[self.base + n]
+            if token is None:
+                token = self.symbols[self.base + n] = YaccSymbol()
+                token.value = self.values[self.base + n]
+        else:
+            token = self.symbol
+            if token is None:
+                token = self.symbol = YaccSymbol()
+        token.lineno = lineno
+
+
+class _Slice(object):
+    """ p.slice of a Production: the token of a terminal, a YaccSymbol
+        made on demand for a nonterminal or the result.
+    """
+    __slots__ = ('p',)
+
+    def __init__(self, p):
+        self.p = p
+
+    def __getitem__(self, n):
+        p = self.p
+        token = p.symbols[p.base + n] if n else p.symbol
+        if token is not None:
+            if not n:
+                token.value = p.result
+            return token
+        symbol = YaccSymbol()
+        symbol.value = p[n]
+        return symbol
+
+    def __len__(self):
+        return self.p.length
+
+
+class CLRParser(object):
+    """ LR parse loop for the tables PLY built for CParser. It makes the
+        same reductions, in the same order with respect to the tokens it
+        reads, as LRParser.parseopt_notrack, with less work per step:
+
+        *   The action and goto tables are dense rows of integers indexed
+            by terminal and nonterminal ids, instead of dicts keyed by
+            symbol names.
+        *   The parser keeps a stack of values and a stack of tokens (None
+            for a nonterminal, unless its action set its line number)
+            instead of a YaccSymbol per reduction, and the grammar actions
+            get one reused Production.
+        *   Single symbol productions whose action only passes p[1] up
+            (unit_actions) change the top state without calling it. Most
+            reductions of C code are expression and declaration chains of
+            such productions.
+
+        CParser's p_error raises on the first syntax error, so there is no
+        error recovery: an error function that returns ends the parse with
+        a RuntimeError. Actions must not raise SyntaxError either. parse()
+        with a debug level runs PLY's own loop.
+    """
+    def __init__(self, lrparser, unit_actions=()):
+        """ lrparser:
+                The LRParser yacc built, after the production callables
+                are final (see CParser's index_nodes)
+
+            unit_actions:
+                Names of the grammar actions that set p[0] = p[1] and do
+                nothing else for their single symbol productions
+        """
+        self.lrparser = lrparser
+        self.errorfunc = lrparser.errorfunc
+        self.reductions = 0
+
+        action = lrparser.action
+        goto = lrparser.goto
+        states = list(action.keys()) if isinstance(action, dict) \
+            else range(len(action))
+        terminals = set()
+        nonterminals = set()
+        for state in states:
+            terminals.update(action[state])
+            if isinstance(goto, dict):
+                nonterminals.update(goto.get(state, {}))
+            else:
+                nonterminals.update(goto[state] or {})
+
+        # Unknown token types get the id just past the terminals, which
+        # is an error in every state
+        self.terminal_ids = dict(
+            (name, i) for i, name in enumerate(sorted(terminals)))
+        self.end_id = self.terminal_ids['$end']
+        self.unknown_id = len(self.terminal_ids)
+        nonterminal_ids = dict(
+            (name, i) for i, name in enumerate(sorted(nonterminals)))
+
+        size = max(states) + 1
+        self.action = [[None] * (self.unknown_id + 1) for i in range(size)]
+        self.goto = [[None] * len(nonterminal_ids) for i in range(size)]
+        for state in states:
+            row = self.action[state]
+            for name, value in action[state].items():
+                row[self.terminal_ids[name]] = value
+            gotos = goto.get(state) if isinstance(goto, dict) \
+                else goto[state]
+            row = self.goto[state]
+            for name, value in (gotos or {}).items():
+                row[nonterminal_ids[name]] = value
+
+        # (length, left hand side id, callable) of each production, the
+        # callable is None for the unit productions
+        unit_actions = set(unit_actions)
+        self.productions = []
+        for production in lrparser.productions:
+            unit = production.len == 1 and production.func in unit_actions
+            self.productions.append((
+                production.len,
+                nonterminal_ids.get(production.name),
+                None if unit else production.callable))
+
+    def parse(self, input=None, lexer=None, debug=0, tracking=0,
+              tokenfunc=None):
+        """ Same arguments and result as LRParser.parse.
+        """
+        if debug or tracking:
+            return self.lrparser.parse(input, lexer, debug, tracking,
+                                       tokenfunc)
+
+        if input is not None:
+            lexer.input(input)
+        get_token = lexer.token if tokenfunc is None else tokenfunc
+
+        action = self.action
+        goto = self.goto
+        productions = self.productions
+        terminal_ids = self.terminal_ids
+        end_id = self.end_id
+        unknown_id = self.unknown_id
+
+        # The bottom entries stand for PLY's '$end' symbol
+        states = [0]
+        values = [None]
+        symbols = [None]
+        p = Production(values, symbols)
+        p.lexer = lexer
+        p.parser = self
+        reductions = 0
+
+        state = 0
+        token = None
+        token_id = None
+        while True:
+            if token_id is None:
+                token = get_token()
+                if token is None:
+                    token_id = end_id
+                else:
+                    token_id = terminal_ids.get(token.type, unknown_id)
+
+            t = action[state][token_id]
+
+            if t is None:
+                self.reductions += reductions
+                return self._error(token, lexer)
+
+            if t > 0:
+                # shift
+                states.append(t)
+                values.append(token.value)
+                symbols.append(token)
+                state = t
+                token_id = None
+                continue
+
+            if t < 0:
+                # reduce
+                length, lhs, callable = productions[-t]
+                if callable is None:
+                    symbols[-1] = None
+                    state = goto[states[-2]][lhs]
+                    states[-1] = state
+                    reductions += 1
+                    continue
+                p.base = len(values) - length - 1
+                p.length = length + 1
+                p.result = None
+                callable(p)
+                if length:
+                    del values[-length:]
+                    del symbols[-length:]
+                    del states[-length:]
+                values.append(p.result)
+                symbol = p.symbol
+                if symbol is not None:
+                    # a line number set with p.set_lineno(0, ...)
+                    symbol.value = p.result
+                    p.symbol = None
+                symbols.append(symbol)
+                state = goto[states[-1]][lhs]
+                states.append(state)
+                reductions += 1
+                continue
+
+            # accept
+            self.reductions += reductions
+            return values[-1]
+
+    def _error(self, token, lexer):
+        """ Calls the error function on a syntax error, as PLY does.
+        """
+        if token is not None and not hasattr(token, 'lexer'):
+            token.lexer = lexer
+        if self.errorfunc is not None:
+            self.errorfunc(token)
+        raise RuntimeError(
+            'yacc: syntax error, error recovery is not supported')
@@ -14,6 +14,8 @@ from . import c_ast
 from .c_lexer import CLexer
 from .plyparser import PLYParser, Coord, ParseError
 from .ast_transforms import fix_switch_cases
+from .node_index import NodeIndex
+from .c_lrparser import CLRParser
 
 
 class CParser(PLYParser):
@@ -24,7 +26,11 @@ class CParser(PLYParser):
             yacc_optimize=True,
             yacctab='pycparser.yacctab',
             yacc_debug=False,
-            taboutputdir=''):
+            taboutputdir='',
+            index_nodes=False,
+            track_columns=True,
+            scanner='ply',
+            lr_parser='ply'):
         """ Create a new CParser.
 
             Some arguments for controlling the debug/optimization
@@ -69,12 +75,30 @@ class CParser(PLYParser):
             taboutputdir:
                 Set this parameter to control the location of generated
                 lextab and yacctab files.
+
+            track_columns:
+                Set to False to leave the column of the coords unset
+                when only line numbers are needed, see CLexer.
+
+            scanner:
+                Lexer runtime, 'ply' or 'fast', see CLexer.
+
+            lr_parser:
+                LR parse loop, 'ply' for PLY's or 'fast' for CLRParser,
+                which builds the same ASTs with less allocation.
+
+            index_nodes:
+                Set to True to index the nodes by class as the grammar
+                actions create them. The index of the last parse is
+                node_index, see NodeIndex.
         """
         self.clex = CLexer(
             error_func=self._lex_error_func,
             on_lbrace_func=self._lex_on_lbrace_func,
             on_rbrace_func=self._lex_on_rbrace_func,
-            type_lookup_func=self._lex_type_lookup_func)
+            type_lookup_func=self._lex_type_lookup_func,
+            track_columns=track_columns,
+            scanner=scanner)
 
         self.clex.build(
             optimize=lex_optimize,
@@ -110,19 +134,43 @@ class CParser(PLYParser):
             tabmodule=yacctab,
             outputdir=taboutputdir)
 
-        # Stack of scopes for keeping track of symbols. _scope_stack[-1] is
-        # the current (topmost) scope. Each scope is a dictionary that
-        # specifies whether a name is a type. If _scope_stack[n][name] is
-        # True, 'name' is currently a type in the scope. If it's False,
-        # 'name' is used in the scope but not as a type (for instance, if we
-        # saw: int name;
-        # If 'name' is not a key in _scope_stack[n] then 'name' was not defined
-        # in this scope at all.
-        self._scope_stack = [dict()]
+        # Symbol table of the scopes. _symbols maps each name that is
+        # visible to (is_type, depth) for its innermost declaration: is_type
+        # is True if 'name' is a type in that scope, False if 'name' is
+        # used in it but not as a type (for instance, if we saw: int name;)
+        # and depth is the number of scopes open at the declaration. A name
+        # that was not declared in any open scope is not a key.
+        # Declaring a name in a scope logs its previous binding in _undo,
+        # _scope_marks holds the length of _undo at the opening of each
+        # scope, and leaving a scope restores the bindings logged since.
+        self._symbols = dict()
+        self._undo = []
+        self._scope_marks = []
 
         # Keeps track of the last token given to yacc (the lookahead token)
         self._last_yielded_token = None
 
+        # Coords by packed value, shared by the trees of all the parses
+        # (headers repeat the same coords in every file), see _coord
+        self._coords = dict()
+
+        # NodeIndex of the last parse, when index_nodes is set
+        self.node_index = None
+        self._index_nodes = index_nodes
+        if index_nodes:
+            for production in self.cparser.productions:
+                if production.callable is not None:
+                    production.callable = self._indexed_action(
+                        production.callable)
+
+        if lr_parser == 'fast':
+            self.cparser = CLRParser(
+                self.cparser,
+                self._unit_actions +
+                tuple('p_%s_opt' % rule for rule in rules_with_opt))
+        elif lr_parser != 'ply':
+            raise ValueError("unknown lr_parser '%s'" % lr_parser)
+
     def parse(self, text, filename='', debuglevel=0):
         """ Parses C code and returns an AST.
 
@@ -138,50 +186,114 @@ class CParser(PLYParser):
         """
         self.clex.filename = filename
         self.clex.reset_lineno()
-        self._scope_stack = [dict()]
+        self._symbols = dict()
+        self._undo = []
+        self._scope_marks = []
         self._last_yielded_token = None
-        return self.cparser.parse(
+        if self._index_nodes:
+            self.node_index = NodeIndex()
+        ast = self.cparser.parse(
                 input=text,
                 lexer=self.clex,
                 debug=debuglevel)
+        if self._index_nodes:
+            self.node_index.root = ast
+        return ast
+
+    # Grammar actions that only pass p[1] up for their single symbol
+    # productions, CLRParser skips them. The _opt rules are added to these.
+    _unit_actions = (
+        'p_external_declaration_2',
+        'p_statement',
+        'p_type_specifier_2',
+        'p_declarator_1',
+        'p_parameter_type_list',
+        'p_expression',
+        'p_assignment_expression',
+        'p_conditional_expression',
+        'p_binary_expression',
+        'p_cast_expression_1',
+        'p_unary_expression_1',
+        'p_postfix_expression_1',
+        'p_primary_expression_1',
+        'p_primary_expression_2',
+    )
 
     ######################--   PRIVATE   --######################
 
+    def _indexed_action(self, action):
+        """ Wraps a grammar action so that the nodes it creates are added
+            to node_index.
+        """
+        Node = c_ast.Node
+        def indexed(p):
+            action(p)
+            value = p[0]
+            if isinstance(value, Node):
+                self.node_index.add(value)
+        return indexed
+
     def _push_scope(self):
-        self._scope_stack.append(dict())
+        self._scope_marks.append(len(self._undo))
 
     def _pop_scope(self):
-        assert len(self._scope_stack) > 1
-        self._scope_stack.pop()
+        assert self._scope_marks
+        mark = self._scope_marks.pop()
+        undo = self._undo
+        symbols = self._symbols
+        for i in range(len(undo) - 1, mark - 1, -1):
+            name, binding = undo[i]
+            if binding is None:
+                del symbols[name]
+            else:
+                symbols[name] = binding
+        del undo[mark:]
+
+    def _bind(self, name, is_type):
+        """ Binds *name* in the current scope, logging the binding of an
+            outer scope it shadows.
+        """
+        depth = len(self._scope_marks)
+        binding = self._symbols.get(name)
+        if binding is None or binding[1] != depth:
+            self._undo.append((name, binding))
+        self._symbols[name] = (is_type, depth)
+
+    def _in_current_scope(self, name):
+        """ Returns True if *name* is a type in the current scope, False if
+            it is a non-type and None if it was not declared in it.
+        """
+        binding = self._symbols.get(name)
+        if binding is None or binding[1] != len(self._scope_marks):
+            return None
+        return binding[0]
 
     def _add_typedef_name(self, name, coord):
         """ Add a new typedef name (ie a TYPEID) to the current scope
         """
-        if not self._scope_stack[-1].get(name, True):
+        if self._in_current_scope(name) is False:
             self._parse_error(
                 "Typedef %r previously declared as non-typedef "
                 "in this scope" % name, coord)
-        self._scope_stack[-1][name] = True
+        self._bind(name, True)
 
     def _add_identifier(self, name, coord):
         """ Add a new object, function, or enum member name (ie an ID) to the
             current scope
         """
-        if self._scope_stack[-1].get(name, False):
+        if self._in_current_scope(name):
             self._parse_error(
                 "Non-typedef %r previously declared as typedef "
                 "in this scope" % name, coord)
-        self._scope_stack[-1][name] = False
+        self._bind(name, False)
 
     def _is_type_in_scope(self, name):
         """ Is *name* a typedef-name in the current scope?
         """
-        for scope in reversed(self._scope_stack):
-            # If name is an identifier in this scope it shadows typedefs in
-            # higher scopes.
-            in_scope = scope.get(name)
-            if in_scope is not None: return in_scope
-        return False
+        # The innermost declaration of name shadows the ones of the outer
+        # scopes, whether it is an identifier or a typedef.
+        binding = self._symbols.get(name)
+        return binding[0] if binding is not None else False
 
     def _lex_error_func(self, msg, line, column):
         self._parse_error(msg, self._coord(line, column))
@@ -198,8 +310,8 @@ class CParser(PLYParser):
             Passed to the lexer for recognizing identifiers that
             are types.
         """
-        is_type = self._is_type_in_scope(name)
-        return is_type
+        binding = self._symbols.get(name)
+        return binding[0] if binding is not None else False
 
     def _get_yacc_lookahead_token(self):
         """ We need access to yacc's lookahead token in certain cases.
@@ -550,16 +662,16 @@ class CParser(PLYParser):
         """ pp_directive  : PPHASH
         """
         self._parse_error('Directives not supported yet',
-                          self._coord(p.lineno(1)))
+                          self._token_coord(p, 1))
 
     def p_pppragma_directive(self, p):
         """ pppragma_directive      : PPPRAGMA
                                     | PPPRAGMA PPPRAGMASTR
         """
         if len(p) == 3:
-            p[0] = c_ast.Pragma(p[2], self._coord(p.lineno(2)))
+            p[0] = c_ast.Pragma(p[2], self._token_coord(p, 2))
         else:
-            p[0] = c_ast.Pragma("", self._coord(p.lineno(1)))
+            p[0] = c_ast.Pragma("", self._token_coord(p, 1))
 
     # In function definitions, the declarator can be followed by
     # a declaration list, for old "K&R style" function definitios.
@@ -572,7 +684,7 @@ class CParser(PLYParser):
             qual=[],
             storage=[],
             type=[c_ast.IdentifierType(['int'],
-                                       coord=self._coord(p.lineno(1)))],
+                                       coord=self._token_coord(p, 1))],
             function=[])
 
         p[0] = self._build_function_definition(
@@ -733,7 +845,7 @@ class CParser(PLYParser):
                             | SIGNED
                             | UNSIGNED
         """
-        p[0] = c_ast.IdentifierType([p[1]], coord=self._coord(p.lineno(1)))
+        p[0] = c_ast.IdentifierType([p[1]], coord=self._token_coord(p, 1))
 
     def p_type_specifier_2(self, p):
         """ type_specifier  : typedef_name
@@ -803,7 +915,7 @@ class CParser(PLYParser):
         p[0] = klass(
             name=p[2],
             decls=None,
-            coord=self._coord(p.lineno(2)))
+            coord=self._token_coord(p, 2))
 
     def p_struct_or_union_specifier_2(self, p):
         """ struct_or_union_specifier : struct_or_union brace_open struct_declaration_list brace_close
@@ -812,7 +924,7 @@ class CParser(PLYParser):
         p[0] = klass(
             name=None,
             decls=p[3],
-            coord=self._coord(p.lineno(2)))
+            coord=self._token_coord(p, 2))
 
     def p_struct_or_union_specifier_3(self, p):
         """ struct_or_union_specifier   : struct_or_union ID brace_open struct_declaration_list brace_close
@@ -822,7 +934,7 @@ class CParser(PLYParser):
         p[0] = klass(
             name=p[2],
             decls=p[4],
-            coord=self._coord(p.lineno(2)))
+            coord=self._token_coord(p, 2))
 
     def p_struct_or_union(self, p):
         """ struct_or_union : STRUCT
@@ -925,18 +1037,18 @@ class CParser(PLYParser):
         """ enum_specifier  : ENUM ID
                             | ENUM TYPEID
         """
-        p[0] = c_ast.Enum(p[2], None, self._coord(p.lineno(1)))
+        p[0] = c_ast.Enum(p[2], None, self._token_coord(p, 1))
 
     def p_enum_specifier_2(self, p):
         """ enum_specifier  : ENUM brace_open enumerator_list brace_close
         """
-        p[0] = c_ast.Enum(None, p[3], self._coord(p.lineno(1)))
+        p[0] = c_ast.Enum(None, p[3], self._token_coord(p, 1))
 
     def p_enum_specifier_3(self, p):
         """ enum_specifier  : ENUM ID brace_open enumerator_list brace_close
                             | ENUM TYPEID brace_open enumerator_list brace_close
         """
-        p[0] = c_ast.Enum(p[2], p[4], self._coord(p.lineno(1)))
+        p[0] = c_ast.Enum(p[2], p[4], self._token_coord(p, 1))
 
     def p_enumerator_list(self, p):
         """ enumerator_list : enumerator
@@ -958,11 +1070,11 @@ class CParser(PLYParser):
         if len(p) == 2:
             enumerator = c_ast.Enumerator(
                         p[1], None,
-                        self._coord(p.lineno(1)))
+                        self._token_coord(p, 1))
         else:
             enumerator = c_ast.Enumerator(
                         p[1], p[3],
-                        self._coord(p.lineno(1)))
+                        self._token_coord(p, 1))
         self._add_identifier(enumerator.name, enumerator.coord)
 
         p[0] = enumerator
@@ -988,7 +1100,7 @@ class CParser(PLYParser):
             declname=p[2],
             type=None,
             quals=None,
-            coord=self._coord(p.lineno(2)))
+            coord=self._token_coord(p, 2))
 
         p[0] = self._type_modify_decl(decl, p[1])
 
@@ -999,7 +1111,7 @@ class CParser(PLYParser):
             declname=p[1],
             type=None,
             quals=None,
-            coord=self._coord(p.lineno(1)))
+            coord=self._token_coord(p, 1))
 
     def p_direct_declarator_2(self, p):
         """ direct_declarator   : LPAREN declarator RPAREN
@@ -1046,7 +1158,7 @@ class CParser(PLYParser):
         """
         arr = c_ast.ArrayDecl(
             type=None,
-            dim=c_ast.ID(p[4], self._coord(p.lineno(4))),
+            dim=c_ast.ID(p[4], self._token_coord(p, 4)),
             dim_quals=p[3] if p[3] != None else [],
             coord=p[1].coord)
 
@@ -1084,7 +1196,7 @@ class CParser(PLYParser):
         """ pointer : TIMES type_qualifier_list_opt
                     | TIMES type_qualifier_list_opt pointer
         """
-        coord = self._coord(p.lineno(1))
+        coord = self._token_coord(p, 1)
         # Pointer decls nest from inside out. This is important when different
         # levels have different qualifiers. For example:
         #
@@ -1121,7 +1233,7 @@ class CParser(PLYParser):
                                 | parameter_list COMMA ELLIPSIS
         """
         if len(p) > 2:
-            p[1].params.append(c_ast.EllipsisParam(self._coord(p.lineno(3))))
+            p[1].params.append(c_ast.EllipsisParam(self._token_coord(p, 3)))
 
         p[0] = p[1]
 
@@ -1141,7 +1253,7 @@ class CParser(PLYParser):
         spec = p[1]
         if not spec['type']:
             spec['type'] = [c_ast.IdentifierType(['int'],
-                coord=self._coord(p.lineno(1)))]
+                coord=self._token_coord(p, 1))]
         p[0] = self._build_declarations(
             spec=spec,
             decls=[dict(decl=p[2])])[0]
@@ -1152,7 +1264,7 @@ class CParser(PLYParser):
         spec = p[1]
         if not spec['type']:
             spec['type'] = [c_ast.IdentifierType(['int'],
-                coord=self._coord(p.lineno(1)))]
+                coord=self._token_coord(p, 1))]
 
         # Parameters can have the same names as typedefs.  The trouble is that
         # the parameter's name gets grouped into declaration_specifiers, making
@@ -1171,7 +1283,7 @@ class CParser(PLYParser):
                 name='',
                 quals=spec['qual'],
                 type=p[2] or c_ast.TypeDecl(None, None, None),
-                coord=self._coord(p.lineno(2)))
+                coord=self._token_coord(p, 2))
             typename = spec['type']
             decl = self._fix_decl_name_type(decl, typename)
 
@@ -1197,7 +1309,7 @@ class CParser(PLYParser):
                         | brace_open initializer_list COMMA brace_close
         """
         if p[2] is None:
-            p[0] = c_ast.InitList([], self._coord(p.lineno(1)))
+            p[0] = c_ast.InitList([], self._token_coord(p, 1))
         else:
             p[0] = p[2]
 
@@ -1246,7 +1358,7 @@ class CParser(PLYParser):
             name='',
             quals=p[1]['qual'],
             type=p[2] or c_ast.TypeDecl(None, None, None),
-            coord=self._coord(p.lineno(2)))
+            coord=self._token_coord(p, 2))
 
         p[0] = self._fix_decl_name_type(typename, p[1]['type'])
 
@@ -1295,14 +1407,14 @@ class CParser(PLYParser):
             type=c_ast.TypeDecl(None, None, None),
             dim=p[2],
             dim_quals=[],
-            coord=self._coord(p.lineno(1)))
+            coord=self._token_coord(p, 1))
 
     def p_direct_abstract_declarator_4(self, p):
         """ direct_abstract_declarator  : direct_abstract_declarator LBRACKET TIMES RBRACKET
         """
         arr = c_ast.ArrayDecl(
             type=None,
-            dim=c_ast.ID(p[3], self._coord(p.lineno(3))),
+            dim=c_ast.ID(p[3], self._token_coord(p, 3)),
             dim_quals=[],
             coord=p[1].coord)
 
@@ -1313,9 +1425,9 @@ class CParser(PLYParser):
         """
         p[0] = c_ast.ArrayDecl(
             type=c_ast.TypeDecl(None, None, None),
-            dim=c_ast.ID(p[3], self._coord(p.lineno(3))),
+            dim=c_ast.ID(p[3], self._token_coord(p, 3)),
             dim_quals=[],
-            coord=self._coord(p.lineno(1)))
+            coord=self._token_coord(p, 1))
 
     def p_direct_abstract_declarator_6(self, p):
         """ direct_abstract_declarator  : direct_abstract_declarator LPAREN parameter_type_list_opt RPAREN
@@ -1333,7 +1445,7 @@ class CParser(PLYParser):
         p[0] = c_ast.FuncDecl(
             args=p[2],
             type=c_ast.TypeDecl(None, None, None),
-            coord=self._coord(p.lineno(1)))
+            coord=self._token_coord(p, 1))
 
     # declaration is a list, statement isn't. To make it consistent, block_item
     # will always be a list
@@ -1357,72 +1469,73 @@ class CParser(PLYParser):
         """ compound_statement : brace_open block_item_list_opt brace_close """
         p[0] = c_ast.Compound(
             block_items=p[2],
-            coord=self._coord(p.lineno(1)))
+            coord=self._token_coord(p, 1),
+            end_coord=self._coord(p.lineno(3)))
 
     def p_labeled_statement_1(self, p):
         """ labeled_statement : ID COLON statement """
-        p[0] = c_ast.Label(p[1], p[3], self._coord(p.lineno(1)))
+        p[0] = c_ast.Label(p[1], p[3], self._token_coord(p, 1))
 
     def p_labeled_statement_2(self, p):
         """ labeled_statement : CASE constant_expression COLON statement """
-        p[0] = c_ast.Case(p[2], [p[4]], self._coord(p.lineno(1)))
+        p[0] = c_ast.Case(p[2], [p[4]], self._token_coord(p, 1))
 
     def p_labeled_statement_3(self, p):
         """ labeled_statement : DEFAULT COLON statement """
-        p[0] = c_ast.Default([p[3]], self._coord(p.lineno(1)))
+        p[0] = c_ast.Default([p[3]], self._token_coord(p, 1))
 
     def p_selection_statement_1(self, p):
         """ selection_statement : IF LPAREN expression RPAREN statement """
-        p[0] = c_ast.If(p[3], p[5], None, self._coord(p.lineno(1)))
+        p[0] = c_ast.If(p[3], p[5], None, self._token_coord(p, 1))
 
     def p_selection_statement_2(self, p):
         """ selection_statement : IF LPAREN expression RPAREN statement ELSE statement """
-        p[0] = c_ast.If(p[3], p[5], p[7], self._coord(p.lineno(1)))
+        p[0] = c_ast.If(p[3], p[5], p[7], self._token_coord(p, 1))
 
     def p_selection_statement_3(self, p):
         """ selection_statement : SWITCH LPAREN expression RPAREN statement """
         p[0] = fix_switch_cases(
-                c_ast.Switch(p[3], p[5], self._coord(p.lineno(1))))
+                c_ast.Switch(p[3], p[5], self._token_coord(p, 1)))
 
     def p_iteration_statement_1(self, p):
         """ iteration_statement : WHILE LPAREN expression RPAREN statement """
-        p[0] = c_ast.While(p[3], p[5], self._coord(p.lineno(1)))
+        p[0] = c_ast.While(p[3], p[5], self._token_coord(p, 1))
 
     def p_iteration_statement_2(self, p):
         """ iteration_statement : DO statement WHILE LPAREN expression RPAREN SEMI """
-        p[0] = c_ast.DoWhile(p[5], p[2], self._coord(p.lineno(1)))
+        p[0] = c_ast.DoWhile(p[5], p[2], self._token_coord(p, 1))
 
     def p_iteration_statement_3(self, p):
         """ iteration_statement : FOR LPAREN expression_opt SEMI expression_opt SEMI expression_opt RPAREN statement """
-        p[0] = c_ast.For(p[3], p[5], p[7], p[9], self._coord(p.lineno(1)))
+        p[0] = c_ast.For(p[3], p[5], p[7], p[9], self._token_coord(p, 1))
 
     def p_iteration_statement_4(self, p):
         """ iteration_statement : FOR LPAREN declaration expression_opt SEMI expression_opt RPAREN statement """
-        p[0] = c_ast.For(c_ast.DeclList(p[3], self._coord(p.lineno(1))),
-                         p[4], p[6], p[8], self._coord(p.lineno(1)))
+        p[0] = c_ast.For(c_ast.DeclList(p[3], self._token_coord(p, 1)),
+                         p[4], p[6], p[8], self._token_coord(p, 1))
 
     def p_jump_statement_1(self, p):
         """ jump_statement  : GOTO ID SEMI """
-        p[0] = c_ast.Goto(p[2], self._coord(p.lineno(1)))
+        p[0] = c_ast.Goto(p[2], self._token_coord(p, 1))
 
     def p_jump_statement_2(self, p):
         """ jump_statement  : BREAK SEMI """
-        p[0] = c_ast.Break(self._coord(p.lineno(1)))
+        p[0] = c_ast.Break(self._token_coord(p, 1))
 
     def p_jump_statement_3(self, p):
         """ jump_statement  : CONTINUE SEMI """
-        p[0] = c_ast.Continue(self._coord(p.lineno(1)))
+        p[0] = c_ast.Continue(self._token_coord(p, 1))
 
     def p_jump_statement_4(self, p):
         """ jump_statement  : RETURN expression SEMI
                             | RETURN SEMI
         """
-        p[0] = c_ast.Return(p[2] if len(p) == 4 else None, self._coord(p.lineno(1)))
+        p[0] = c_ast.Return(p[2] if len(p) == 4 else None, self._token_coord(p, 1))
 
     def p_expression_statement(self, p):
         """ expression_statement : expression_opt SEMI """
         if p[1] is None:
-            p[0] = c_ast.EmptyStatement(self._coord(p.lineno(1)))
+            p[0] = c_ast.EmptyStatement(self._token_coord(p, 1))
         else:
             p[0] = p[1]
 
@@ -1441,7 +1554,7 @@ class CParser(PLYParser):
 
     def p_typedef_name(self, p):
         """ typedef_name : TYPEID """
-        p[0] = c_ast.IdentifierType([p[1]], coord=self._coord(p.lineno(1)))
+        p[0] = c_ast.IdentifierType([p[1]], coord=self._token_coord(p, 1))
 
     def p_assignment_expression(self, p):
         """ assignment_expression   : conditional_expression
@@ -1517,7 +1630,7 @@ class CParser(PLYParser):
 
     def p_cast_expression_2(self, p):
         """ cast_expression : LPAREN type_name RPAREN cast_expression """
-        p[0] = c_ast.Cast(p[2], p[4], self._coord(p.lineno(1)))
+        p[0] = c_ast.Cast(p[2], p[4], self._token_coord(p, 1))
 
     def p_unary_expression_1(self, p):
         """ unary_expression    : postfix_expression """
@@ -1537,7 +1650,7 @@ class CParser(PLYParser):
         p[0] = c_ast.UnaryOp(
             p[1],
             p[2] if len(p) == 3 else p[3],
-            self._coord(p.lineno(1)))
+            self._token_coord(p, 1))
 
     def p_unary_operator(self, p):
         """ unary_operator  : AND
@@ -1569,7 +1682,7 @@ class CParser(PLYParser):
                                 | postfix_expression ARROW ID
                                 | postfix_expression ARROW TYPEID
         """
-        field = c_ast.ID(p[3], self._coord(p.lineno(3)))
+        field = c_ast.ID(p[3], self._token_coord(p, 3))
         p[0] = c_ast.StructRef(p[1], p[2], field, p[1].coord)
 
     def p_postfix_expression_5(self, p):
@@ -1605,7 +1718,7 @@ class CParser(PLYParser):
     def p_primary_expression_5(self, p):
         """ primary_expression  : OFFSETOF LPAREN type_name COMMA identifier RPAREN
         """
-        coord = self._coord(p.lineno(1))
+        coord = self._token_coord(p, 1)
         p[0] = c_ast.FuncCall(c_ast.ID(p[1], coord),
                               c_ast.ExprList([p[3], p[5]], coord),
                               coord)
@@ -1622,7 +1735,7 @@ class CParser(PLYParser):
 
     def p_identifier(self, p):
         """ identifier  : ID """
-        p[0] = c_ast.ID(p[1], self._coord(p.lineno(1)))
+        p[0] = c_ast.ID(p[1], self._token_coord(p, 1))
 
     def p_constant_1(self, p):
         """ constant    : INT_CONST_DEC
@@ -1631,21 +1744,21 @@ class CParser(PLYParser):
                         | INT_CONST_BIN
         """
         p[0] = c_ast.Constant(
-            'int', p[1], self._coord(p.lineno(1)))
+            'int', p[1], self._token_coord(p, 1))
 
     def p_constant_2(self, p):
         """ constant    : FLOAT_CONST
                         | HEX_FLOAT_CONST
         """
         p[0] = c_ast.Constant(
-            'float', p[1], self._coord(p.lineno(1)))
+            'float', p[1], self._token_coord(p, 1))
 
     def p_constant_3(self, p):
         """ constant    : CHAR_CONST
                         | WCHAR_CONST
         """
         p[0] = c_ast.Constant(
-            'char', p[1], self._coord(p.lineno(1)))
+            'char', p[1], self._token_coord(p, 1))
 
     # The "unified" string and wstring literal rules are for supporting
     # concatenation of adjacent string literals.
@@ -1658,7 +1771,7 @@ class CParser(PLYParser):
         """
         if len(p) == 2: # single literal
             p[0] = c_ast.Constant(
-                'string', p[1], self._coord(p.lineno(1)))
+                'string', p[1], self._token_coord(p, 1))
         else:
             p[1].value = p[1].value[:-1] + p[2][1:]
             p[0] = p[1]
@@ -1669,7 +1782,7 @@ class CParser(PLYParser):
         """
         if len(p) == 2: # single literal
             p[0] = c_ast.Constant(
-                'string', p[1], self._coord(p.lineno(1)))
+                'string', p[1], self._token_coord(p, 1))
         else:
             p[1].value = p[1].value.rstrip()[:-1] + p[2][2:]
             p[0] = p[1]
@@ -1683,6 +1796,7 @@ class CParser(PLYParser):
         """ brace_close :   RBRACE
         """
         p[0] = p[1]
+        p.set_lineno(0, p.lineno(1))
 
     def p_empty(self, p):
         'empty : '
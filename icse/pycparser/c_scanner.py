@@ -0,0 +1,338 @@
+#------------------------------------------------------------------------------
+# pycparser: c_scanner.py
+#
+# CScanner: a faster replacement for the PLY lexer runtime of CLexer.
+#
+# Copyright (C) 2008-2015, Eli Bendersky
+# License: BSD
+#------------------------------------------------------------------------------
+import re
+
+from .ply.lex import LexError
+
+
+class Token(object):
+    """ A token of CScanner. Same attributes as PLY's LexToken, without
+        the per token __dict__. 'lexer' is only set on the tokens passed
+        to the rule functions of CLexer and 'column' when columns are
+        tracked.
+    """
+    __slots__ = ('type', 'value', 'lineno', 'lexpos', 'column', 'lexer')
+
+    def __init__(self, type, value, lineno, lexpos):
+        self.type = type
+        self.value = value
+        self.lineno = lineno
+        self.lexpos = lexpos
+
+    def __str__(self):
+        return "LexToken(%s,%r,%d,%d)" % (
+            self.type, self.value, self.lineno, self.lexpos)
+
+    def __repr__(self):
+        return str(self)
+
+
+# Actions of the dispatch tables
+_TOKEN = 0      # return a token of the type of the rule
+_PUNCT = 1      # single character token, no regex match needed
+_OPERATOR = 2   # token of the string rules only
+_ID = 3         # t_ID: keyword, TYPEID or ID
+_NEWLINE = 4    # t_NEWLINE
+_LBRACE = 5     # t_LBRACE
+_RBRACE = 6     # t_RBRACE
+_SKIP = 7       # string rule without a token type
+_CALL = 8       # any other rule function of CLexer, called as PLY does
+
+# Rule functions of CLexer that CScanner runs inline. Keep in sync with the
+# rules of c_lexer.py: the ones mapped to _TOKEN only return their token.
+_INLINE = {
+    't_NEWLINE': _NEWLINE,
+    't_ID': _ID,
+    't_LBRACE': _LBRACE,
+    't_RBRACE': _RBRACE,
+    't_FLOAT_CONST': _TOKEN,
+    't_HEX_FLOAT_CONST': _TOKEN,
+    't_INT_CONST_HEX': _TOKEN,
+    't_INT_CONST_BIN': _TOKEN,
+    't_INT_CONST_OCT': _TOKEN,
+    't_INT_CONST_DEC': _TOKEN,
+    't_CHAR_CONST': _TOKEN,
+    't_WCHAR_CONST': _TOKEN,
+    't_WSTRING_LITERAL': _TOKEN,
+    't_pppragma_PPPRAGMA': _TOKEN,
+}
+
+# Characters that can only start one token of the INITIAL state: no rule
+# matches a longer text starting with them.
+_PUNCTUATORS = {
+    '(': 'LPAREN', ')': 'RPAREN', '[': 'LBRACKET', ']': 'RBRACKET',
+    ',': 'COMMA', ';': 'SEMI', ':': 'COLON', '?': 'CONDOP', '~': 'NOT',
+}
+
+# Characters that only start tokens of the string rules (operators) in the
+# INITIAL state.
+_OPERATOR_CHARS = '+-*/%|&^!<>='
+
+# Characters that only start identifiers in the INITIAL state. 'L' may also
+# start a wide char or string constant, it goes through the master regex.
+_ID_CHARS = ''.join(c for c in
+                    'abcdefghijklmnopqrstuvwxyz'
+                    'ABCDEFGHIJKLMNOPQRSTUVWXYZ_$' if c != 'L')
+
+
+class _State(object):
+    """ Dispatch tables of one lexer state.
+    """
+    def __init__(self, master, actions, ignore, errorf):
+        self.master = master
+        self.actions = actions
+        self.ignore = ignore
+        self.ignore_re = re.compile('[%s]+' % re.escape(ignore)) \
+            if ignore else None
+        self.errorf = errorf
+        # First character of a token -> (action, token type), INITIAL only
+        self.first = {}
+        self.operator_re = None
+        self.operator_types = None
+        self.id_re = None
+        self.newline_re = None
+
+
+class CScanner(object):
+    """ Lexer runtime for CLexer, built from the PLY lexer of the CLexer
+        and producing the same tokens as PLY's Lexer.token, faster:
+
+        *   The rules of a state are one precompiled alternation, a match
+            is dispatched on its group index through a table.
+        *   t_ID, t_NEWLINE, the braces and the rules that only return
+            their token run inline instead of through the rule functions.
+        *   Whitespace is skipped by one regex match, single character
+            punctuators need no match at all and operators are matched
+            against the operator rules only.
+        *   Tokens are slotted Token objects.
+
+        The other rules (preprocessor lines, errors) are called the way
+        PLY calls them, with this object as their t.lexer.
+
+        token() also does the work of CLexer.token: sets the column of the
+        token and CLexer.last_token.
+    """
+    def __init__(self, clex, lexer):
+        """ clex:
+                The CLexer
+
+            lexer:
+                The PLY lexer built for clex
+        """
+        self.clex = clex
+        self.lexdata = None
+        self.lexpos = 0
+        self.lexlen = 0
+        self.lineno = 1
+        self.lexmatch = None
+        self.lexstatestack = []
+        self.states = {}
+        for name, master in lexer.lexstatere.items():
+            self.states[name] = self._build_state(
+                master,
+                lexer.lexstateignore.get(name, ''),
+                lexer.lexstateerrorf.get(name))
+        self._fast_paths(self.states['INITIAL'])
+        self.begin('INITIAL')
+
+    def _build_state(self, master, ignore, errorf):
+        """ Joins the master regexes PLY split in chunks, in order, and
+            maps their group indices to (action, token type, function).
+        """
+        pattern = '|'.join(regex.pattern for regex, findex in master)
+        regex = re.compile(pattern, master[0][0].flags)
+        actions = [None] * (regex.groups + 1)
+        for chunk, findex in master:
+            for name, index in chunk.groupindex.items():
+                if findex[index] is None:
+                    continue
+                func, type = findex[index]
+                if func is None:
+                    action = _TOKEN if type else _SKIP
+                else:
+                    action = _INLINE.get(func.__name__, _CALL)
+                actions[regex.groupindex[name]] = (action, type, func)
+        return _State(regex, actions, ignore, errorf)
+
+    def _fast_paths(self, state):
+        """ Fills the first character table of the INITIAL state.
+        """
+        clex = self.clex
+        rules = []
+        for name, index in sorted(state.master.groupindex.items(),
+                                  key=lambda item: item[1]):
+            action = state.actions[index]
+            if action is not None and action[0] == _TOKEN \
+                    and action[2] is None:
+                rules.append('(?P<%s>%s)' % (name, getattr(clex, name)))
+        state.operator_re = re.compile('|'.join(rules), state.master.flags)
+        state.operator_types = dict(
+            (index, state.actions[state.master.groupindex[name]][1])
+            for name, index in state.operator_re.groupindex.items())
+        state.id_re = re.compile(clex.identifier)
+        state.newline_re = re.compile(clex.t_NEWLINE.__doc__)
+
+        for c, type in _PUNCTUATORS.items():
+            state.first[c] = (_PUNCT, type)
+        for c in _OPERATOR_CHARS:
+            state.first[c] = (_OPERATOR, None)
+        for c in _ID_CHARS:
+            state.first[c] = (_ID, None)
+        state.first['\n'] = (_NEWLINE, None)
+        state.first['{'] = (_LBRACE, 'LBRACE')
+        state.first['}'] = (_RBRACE, 'RBRACE')
+
+    def input(self, s):
+        if not isinstance(s, str):
+            raise ValueError("Expected a string")
+        self.lexdata = s
+        self.lexpos = 0
+        self.lexlen = len(s)
+
+    def begin(self, state):
+        if state not in self.states:
+            raise ValueError("Undefined state")
+        self.state = self.states[state]
+        self.lexstate = state
+
+    def push_state(self, state):
+        self.lexstatestack.append(self.lexstate)
+        self.begin(state)
+
+    def pop_state(self):
+        self.begin(self.lexstatestack.pop())
+
+    def current_state(self):
+        return self.lexstate
+
+    def skip(self, n):
+        self.lexpos += n
+
+    def token(self):
+        clex = self.clex
+        data = self.lexdata
+        pos = self.lexpos
+        end = self.lexlen
+        state = self.state
+        ignore = state.ignore
+        first = state.first
+
+        while pos < end:
+            c = data[pos]
+            if c in ignore:
+                pos = state.ignore_re.match(data, pos).end()
+                continue
+
+            fast = first.get(c)
+            if fast is not None:
+                action, type = fast
+                if action == _PUNCT:
+                    tok = Token(type, c, self.lineno, pos)
+                    pos += 1
+                    break
+                if action == _ID:
+                    m = state.id_re.match(data, pos)
+                elif action == _OPERATOR:
+                    m = state.operator_re.match(data, pos)
+                    tok = Token(state.operator_types[m.lastindex],
+                                m.group(), self.lineno, pos)
+                    pos = m.end()
+                    break
+                elif action == _NEWLINE:
+                    m = state.newline_re.match(data, pos)
+                else:
+                    m = None
+            else:
+                m = state.master.match(data, pos)
+                if m is None:
+                    tok, pos = self._no_match(pos)
+                    state = self.state
+                    ignore = state.ignore
+                    first = state.first
+                    if tok is None:
+                        continue
+                    break
+                action, type, func = state.actions[m.lastindex]
+
+            if action == _ID:
+                value = m.group()
+                type = clex.keyword_map.get(value, 'ID')
+                if type == 'ID' and clex.type_lookup_func(value):
+                    type = 'TYPEID'
+                tok = Token(type, value, self.lineno, pos)
+                pos = m.end()
+                break
+            if action == _TOKEN:
+                tok = Token(type, m.group(), self.lineno, pos)
+                pos = m.end()
+                break
+            if action == _NEWLINE:
+                pos = m.end()
+                self.lineno += pos - m.start()
+                clex.line_start = pos
+                continue
+            if action == _LBRACE:
+                tok = Token(type, c, self.lineno, pos)
+                pos += 1
+                clex.on_lbrace_func()
+                break
+            if action == _RBRACE:
+                tok = Token(type, c, self.lineno, pos)
+                pos += 1
+                clex.on_rbrace_func()
+                break
+            if action == _SKIP:
+                pos = m.end()
+                continue
+
+            # _CALL
+            tok = Token(type, m.group(), self.lineno, pos)
+            pos = m.end()
+            tok.lexer = self
+            self.lexmatch = m
+            self.lexpos = pos
+            tok = func(tok)
+            if not tok:
+                pos = self.lexpos
+                state = self.state
+                ignore = state.ignore
+                first = state.first
+                continue
+            break
+        else:
+            self.lexpos = pos + 1
+            if self.lexdata is None:
+                raise RuntimeError("No input string given with input()")
+            clex.last_token = None
+            return None
+
+        self.lexpos = pos
+        if clex.track_columns:
+            tok.column = tok.lexpos - clex.line_start + 1
+        clex.last_token = tok
+        return tok
+
+    def _no_match(self, pos):
+        """ Calls the error rule of the state when no rule matches at pos.
+            Returns the token it returned and the position to go on from.
+        """
+        data = self.lexdata
+        if self.state.errorf is None:
+            self.lexpos = pos
+            raise LexError("Illegal character '%s' at index %d" % (
+                data[pos], pos), data[pos:])
+        tok = Token('error', data[pos:], self.lineno, pos)
+        tok.lexer = self
+        self.lexpos = pos
+        tok = self.state.errorf(tok)
+        if pos == self.lexpos:
+            raise LexError("Scanning error. Illegal character '%s'" % (
+                data[pos]), data[pos:])
+        return (tok or None, self.lexpos)
+
@@ -0,0 +1,162 @@
+#------------------------------------------------------------------------------
+# pycparser: node_index.py
+#
+# NodeIndex: index of the nodes of a translation unit by class, with parent
+# links, filled by the parser as the grammar actions build the AST.
+#
+# Copyright (C) 2008-2015, Eli Bendersky
+# License: BSD
+#------------------------------------------------------------------------------
+
+from . import c_ast
+
+
+# Declarator nodes whose 'type' is filled in after they are created, when the
+# enclosing declaration is built. Their children are linked again when a new
+# node takes them as a child.
+_DECLARATORS = (c_ast.TypeDecl, c_ast.PtrDecl, c_ast.ArrayDecl, c_ast.FuncDecl)
+
+# List nodes the grammar actions grow one item at a time, with the attribute
+# holding the items.
+_LISTS = {
+    c_ast.ExprList: 'exprs',
+    c_ast.InitList: 'exprs',
+    c_ast.ParamList: 'params',
+    c_ast.EnumeratorList: 'enumerators',
+}
+
+
+class NodeIndex(object):
+    """ Index of the nodes of one translation unit, keyed by node class.
+
+        Build a CParser with index_nodes=True and the index of the last
+        parse is CParser.node_index. Code that only cares about a few node
+        classes can then iterate over them directly instead of walking the
+        whole tree:
+
+            parser = CParser(index_nodes=True)
+            ast = parser.parse(text)
+            for node in parser.node_index.nodes(c_ast.FuncCall):
+                ...
+
+        Notes:
+
+        *   The index holds every node the grammar actions created, in
+            creation order. A few nodes (merged type specifiers) do not end
+            up in the tree; preorder() and in_tree() tell them apart.
+        *   Parent links are exact for the final tree, including the
+            statements that fix_switch_cases moves under their 'case'.
+        *   The type of a declaration with several declarators (struct S
+            { ... } a, b;) is one subtree shared by the declarators. Its
+            nodes are indexed once, under the last declarator, where a
+            NodeVisitor visits them once per declarator.
+    """
+    def __init__(self):
+        self.root = None
+        self._nodes = {}
+        self._parents = {}
+
+    def nodes(self, klass):
+        """ Returns the list of the nodes of a c_ast class, in creation
+            order.
+        """
+        return self._nodes.get(klass, [])
+
+    def parent(self, node):
+        """ Returns the parent of a node, None for the root.
+        """
+        link = self._parents.get(node)
+        return link[0] if link is not None else None
+
+    def in_tree(self, node):
+        """ Tells whether a node is part of the tree of the root.
+        """
+        return self._path(node) is not None
+
+    def preorder(self, nodes):
+        """ Returns the nodes that are part of the tree sorted in the order a
+            NodeVisitor visits them.
+        """
+        keyed = []
+        for node in nodes:
+            path = self._path(node)
+            if path is not None:
+                keyed.append((path, node))
+        keyed.sort(key=lambda item: item[0])
+        return [node for path, node in keyed]
+
+    def add(self, value):
+        """ Indexes the result of a grammar action and the new nodes below
+            it. Called by the parser after each reduction.
+
+            Actions also return lists, dicts and strings. The nodes they hold
+            are indexed with the node that takes them as children.
+        """
+        if isinstance(value, c_ast.Node):
+            if value not in self._parents:
+                self._parents[value] = None
+                self._add_new(value)
+            elif type(value) in _LISTS:
+                self._link_last(value)
+
+    def _add_new(self, node):
+        """ Indexes a node whose parent link is set, and the nodes below it
+            that were not indexed yet.
+        """
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            self._nodes.setdefault(type(node), []).append(node)
+            if isinstance(node, c_ast.Switch) and node.stmt is not None:
+                self._relink_cases(node.stmt)
+            stack.extend(self._link_children(node))
+
+    def _link_children(self, node):
+        """ Sets the parent link of the children of node, returns the
+            children that were not indexed yet.
+        """
+        new = []
+        for position, (name, child) in enumerate(node.children()):
+            if child not in self._parents:
+                new.append(child)
+            elif isinstance(child, _DECLARATORS):
+                new.extend(self._link_children(child))
+            self._parents[child] = (node, position)
+        return new
+
+    def _link_last(self, node):
+        """ Links the item an action appended to a list node.
+        """
+        items = getattr(node, _LISTS[type(node)])
+        if not items:
+            return
+        child = items[-1]
+        new = child not in self._parents
+        self._parents[child] = (node, len(items) - 1)
+        if new:
+            self._add_new(child)
+
+    def _relink_cases(self, stmt):
+        """ fix_switch_cases moves statements of the switch body under their
+            'case' or 'default' label, link them again.
+        """
+        for child in self._link_children(stmt):
+            self._add_new(child)
+        for name, child in stmt.children():
+            if isinstance(child, (c_ast.Case, c_ast.Default)):
+                for new in self._link_children(child):
+                    self._add_new(new)
+
+    def _path(self, node):
+        """ Returns the child positions from the root down to node, None when
+            node is not part of the tree.
+        """
+        path = []
+        while node is not self.root:
+            link = self._parents.get(node)
+            if link is None:
+                return None
+            node, position = link
+            path.append(position)
+        path.reverse()
+        return path
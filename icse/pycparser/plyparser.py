@@ -9,23 +9,112 @@
 #-----------------------------------------------------------------
 
 
+import threading
+
+
+# Layout of a packed Coord: the column + 1 (0 for no column) in the low
+# bits, the line above it and the file id above the line.
+_FIELD_BITS = 32
+_FIELD_MASK = (1 << _FIELD_BITS) - 1
+_LINE_SHIFT = _FIELD_BITS
+_FILE_SHIFT = 2 * _FIELD_BITS
+
+# Maximum number of coords PLYParser._coord keeps for reuse
+COORD_CACHE_SIZE = 1 << 16
+
+# Process wide table of the interned file names of the coords. Id 0 is
+# unused so that a packed Coord is never 0 (false).
+_coord_files = [None]
+_coord_file_ids = {}
+_coord_files_lock = threading.Lock()
+
+
+def _coord_file_id(file):
+    """ Returns the id of a file name, interning it on first use.
+    """
+    file_id = _coord_file_ids.get(file)
+    if file_id is None:
+        with _coord_files_lock:
+            file_id = _coord_file_ids.get(file)
+            if file_id is None:
+                file_id = len(_coord_files)
+                _coord_files.append(file)
+                _coord_file_ids[file] = file_id
+    return file_id
+
+
+def pack_coord(file, line, column=None):
+    """ Returns the packed int value of the Coord (file, line, column).
+    """
+    if not 0 <= line <= _FIELD_MASK or \
+            (column is not None and not 0 <= column < _FIELD_MASK):
+        raise ValueError("coord out of range: %s:%s:%s" % (file, line, column))
+    return ((_coord_file_id(file) << _FILE_SHIFT) | (line << _LINE_SHIFT) |
+            (0 if column is None else column + 1))
+
+
 class Coord(object):
     """ Coordinates of a syntactic element. Consists of:
             - File name
             - Line number
             - (optional) column number, for the Lexer
+
+        A Coord keeps one int packing the id of its file, among the
+        interned file names of the process, the line and the column. The
+        fields are unpacked when read. The packed value is internal: coords
+        compare and hash by (file, line, column), have no order, and pickle
+        as (file, line, column).
     """
-    __slots__ = ('file', 'line', 'column', '__weakref__')
+    __slots__ = ('_packed',)
+
     def __init__(self, file, line, column=None):
-        self.file = file
-        self.line = line
-        self.column = column
+        self._packed = pack_coord(file, line, column)
+
+    @classmethod
+    def from_packed(cls, packed):
+        """ Returns the Coord of a value returned by pack_coord.
+        """
+        coord = cls.__new__(cls)
+        coord._packed = packed
+        return coord
+
+    @property
+    def file(self):
+        return _coord_files[self._packed >> _FILE_SHIFT]
+
+    @property
+    def line(self):
+        return (self._packed >> _LINE_SHIFT) & _FIELD_MASK
+
+    @property
+    def column(self):
+        column = self._packed & _FIELD_MASK
+        return column - 1 if column else None
+
+    def __eq__(self, other):
+        if not isinstance(other, Coord):
+            return NotImplemented
+        return (self.file, self.line, self.column) == \
+            (other.file, other.line, other.column)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash((self.file, self.line, self.column))
 
     def __str__(self):
         str = "%s:%s" % (self.file, self.line)
         if self.column: str += ":%s" % self.column
         return str
 
+    def __repr__(self):
+        return "Coord(%r, %r, %r)" % (self.file, self.line, self.column)
+
+    def __reduce__(self):
+        return (Coord, (self.file, self.line, self.column))
+
 
 class ParseError(Exception): pass
 
@@ -46,10 +135,25 @@ class PLYParser(object):
         setattr(self.__class__, optrule.__name__, optrule)
 
     def _coord(self, lineno, column=None):
-        return Coord(
-                file=self.clex.filename,
-                line=lineno,
-                column=column)
+        """ Returns the coord of a line and column of the current file.
+            Equal coords are one object, from the _coords cache of the
+            parser, which starts over past COORD_CACHE_SIZE entries.
+        """
+        packed = pack_coord(self.clex.filename, lineno, column)
+        coord = self._coords.get(packed)
+        if coord is None:
+            if len(self._coords) >= COORD_CACHE_SIZE:
+                self._coords.clear()
+            coord = self._coords[packed] = Coord.from_packed(packed)
+        return coord
+
+    def _token_coord(self, p, token_idx):
+        """ Returns the coord of the token at token_idx of a production.
+            The column is the one the lexer set on the token, if any.
+        """
+        return self._coord(
+                p.lineno(token_idx),
+                getattr(p.slice[token_idx], 'column', None))
 
     def _parse_error(self, msg, coord):
         raise ParseError("%s: %s" % (coord, msg))